@@ -5,10 +5,11 @@ from fastapi.exceptions import RequestValidationError
 from fastapi.encoders import jsonable_encoder # Import jsonable_encoder
 from contextlib import asynccontextmanager
 import logging
+import os
 import sys
 from logging.handlers import RotatingFileHandler # Import RotatingFileHandler
 
-from fastapi.staticfiles import StaticFiles
+from utils.static_files import ImmutableStaticFiles
 
 # Helper function to recursively convert bytes to strings for JSON serialization
 def convert_bytes_to_str(obj):
@@ -31,7 +32,7 @@ logging.basicConfig(
     handlers=[
         logging.StreamHandler(sys.stdout),
         RotatingFileHandler(
-            'backend/app.log', # Specify the path relative to the current working directory
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.log'), # Next to this file, whatever the working directory
             maxBytes=5 * 1024 * 1024, # 5 MB
             backupCount=5,
             encoding='utf-8'
@@ -42,11 +43,16 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Import database and scheduler
+from config import settings
 from database import init_db
 from utils.schedular import start_scheduler, stop_scheduler
+from utils.concurrency import shutdown_executor
+from utils.metering import flush_metrics
+from utils.jobs import job_queue
+from utils.history_writer import history_writer
 
 # Import routes
-from routes import auth, medicine, chat, dashboard, profile, yolo
+from routes import auth, medicine, chat, dashboard, profile, yolo, metrics, jobs
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -58,10 +64,19 @@ async def lifespan(app: FastAPI):
         init_db()
         logger.info("Database initialized")
         
+        # Batch chat history writes off the request path
+        history_writer.start()
+        
         # Start scheduler
         start_scheduler()
         logger.info("Scheduler started")
         
+        # Watch the model manifest for new versions
+        yolo.model_registry.start_watcher(settings.MODEL_WATCH_INTERVAL_SECONDS)
+        
+        # Resume queued and interrupted background jobs
+        job_queue.start()
+        
     except Exception as e:
         logger.error(f"Error during startup: {str(e)}")
         raise
@@ -71,8 +86,14 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down application...")
     try:
+        yolo.model_registry.stop_watcher()
         stop_scheduler()
         logger.info("Scheduler stopped")
+        job_queue.stop()
+        # Jobs may save chat turns, so the history queue is flushed after they stop
+        history_writer.stop()
+        shutdown_executor()
+        flush_metrics()
     except Exception as e:
         logger.error(f"Error during shutdown: {str(e)}")
 
@@ -91,6 +112,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Exception handlers
@@ -121,9 +143,11 @@ app.include_router(chat.router)
 app.include_router(dashboard.router)
 app.include_router(profile.router)
 app.include_router(yolo.router)
+app.include_router(metrics.router)
+app.include_router(jobs.router)
 
 # Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", ImmutableStaticFiles(directory=settings.STATIC_DIR), name="static")
 
 # Health check endpoint
 @app.get("/health")
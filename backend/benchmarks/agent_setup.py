@@ -0,0 +1,54 @@
+"""
+Per-request agent setup cost: rebuilding tools, graph and LLM on every request
+(the previous behaviour) versus reusing the module-level agent and only
+creating an AgentState.
+
+Run from the repository root:
+    python backend/benchmarks/agent_setup.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SessionLocal
+from utils.ai_agent import build_agent_graph, build_llm, build_tools, create_agent_state
+
+
+def per_request_rebuild(db, user_id):
+    tools = build_tools()
+    build_agent_graph()
+    build_llm(tools)
+    return create_agent_state(db, user_id, "hello")
+
+
+def shared_agent(db, user_id):
+    return create_agent_state(db, user_id, "hello")
+
+
+def measure(fn, db, iterations):
+    fn(db, 1)  # warm imports and caches
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(db, 1)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    db = SessionLocal()
+    try:
+        before = measure(per_request_rebuild, db, iterations)
+        after = measure(shared_agent, db, iterations)
+    finally:
+        db.close()
+
+    print(f"iterations:             {iterations}")
+    print(f"rebuild per request:    {before * 1000:.3f} ms")
+    print(f"shared agent:           {after * 1000:.3f} ms")
+    print(f"speedup:                {before / after:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
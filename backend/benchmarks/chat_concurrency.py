@@ -0,0 +1,71 @@
+"""
+Event-loop responsiveness while chat requests are in flight.
+
+Starts N concurrent /api/chat/message requests against a running server and,
+at the same time, polls /health. When the agent runs on the event loop the
+health probe waits for whole agent turns; with the blocking work moved onto
+the worker pool its latency stays flat.
+
+Run against a running server (a valid bearer token is required):
+    python backend/benchmarks/chat_concurrency.py http://localhost:8000 <token> [concurrency]
+"""
+import asyncio
+import sys
+import time
+
+import httpx
+
+
+async def chat(client, token, i):
+    start = time.perf_counter()
+    response = await client.post(
+        "/api/chat/message",
+        json={"message": f"Give me three general tips for staying hydrated ({i})"},
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=120
+    )
+    return response.status_code, time.perf_counter() - start
+
+
+async def probe_health(client, stop: asyncio.Event):
+    samples = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/health", timeout=120)
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+    return samples
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+async def main():
+    base_url = sys.argv[1]
+    token = sys.argv[2]
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(client, stop))
+        start = time.perf_counter()
+        results = await asyncio.gather(*(chat(client, token, i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        health = await prober
+
+    chat_latencies = [seconds for _, seconds in results]
+    failures = sum(1 for status, _ in results if status != 200)
+    print(f"concurrent chats:       {concurrency} ({failures} failed)")
+    print(f"wall time:              {elapsed:.2f} s")
+    print(f"chat p50 / max:         {percentile(chat_latencies, 0.5):.2f} s / {max(chat_latencies):.2f} s")
+    if health:
+        print(f"health probes:          {len(health)}")
+        print(f"health p50 / p95 / max: {percentile(health, 0.5) * 1000:.1f} / "
+              f"{percentile(health, 0.95) * 1000:.1f} / {max(health) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+Routing accuracy and latency of the local intent router on a labeled set.
+
+Each line of the eval file is ``{"text", "intent", "slots"}`` where intent is
+the expected locally executed intent or ``"llm"`` when the message must go to
+the agent. Reports exact intent+slot accuracy, wrongly routed messages (the
+costly error: a command executed that the user did not ask for), coverage
+and router latency. With ``--live`` it also times the agent LLM's
+tool-selection call on the routed messages to show the latency saved.
+
+Run from the repository root:
+    python backend/benchmarks/intent_router_eval.py [eval.jsonl] [--live]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.intent_router import confident_intent
+
+DEFAULT_EVAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intent_router_eval.jsonl")
+
+
+def load_cases(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+def measure_llm(texts):
+    from langchain.schema import HumanMessage
+    from utils.ai_agent import AGENT_LLM, SYSTEM_MESSAGE
+
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        AGENT_LLM.invoke([SYSTEM_MESSAGE, HumanMessage(content=text)])
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    live = "--live" in sys.argv
+    cases = load_cases(args[0] if args else DEFAULT_EVAL)
+
+    correct = 0
+    wrongly_routed = []
+    missed = []
+    latencies = []
+    routed_texts = []
+    for case in cases:
+        start = time.perf_counter()
+        intent = confident_intent(case["text"])
+        latencies.append(time.perf_counter() - start)
+
+        predicted = intent.name if intent else "llm"
+        slots = intent.slots if intent else {}
+        if predicted == case["intent"] and slots == case["slots"]:
+            correct += 1
+        elif predicted != "llm":
+            wrongly_routed.append((case["text"], predicted, slots))
+        else:
+            missed.append(case["text"])
+        if intent:
+            routed_texts.append(case["text"])
+
+    local_cases = sum(1 for case in cases if case["intent"] != "llm")
+    print(f"cases:                  {len(cases)} ({local_cases} local commands, {len(cases) - local_cases} for the LLM)")
+    print(f"accuracy:               {correct / len(cases):.3f}")
+    print(f"coverage of commands:   {(local_cases - len(missed)) / local_cases:.3f}" if local_cases else "coverage of commands:   -")
+    print(f"wrongly routed:         {len(wrongly_routed)}")
+    for text, predicted, slots in wrongly_routed:
+        print(f"  {text!r} -> {predicted} {slots}")
+    for text in missed:
+        print(f"  missed: {text!r}")
+    print(f"router latency p50/p99: {percentile(latencies, 0.5) * 1e6:.0f} / {percentile(latencies, 0.99) * 1e6:.0f} µs")
+
+    if live and routed_texts:
+        llm = measure_llm(routed_texts)
+        print(f"LLM tool selection p50: {percentile(llm, 0.5) * 1000:.0f} ms over {len(llm)} routed messages")
+        print(f"saved per routed message: ~{(percentile(llm, 0.5) - percentile(latencies, 0.5)) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+False-hit rate of the semantic cache on labeled query pairs.
+
+Each line of the pairs file is ``{"tool", "a", "b", "same"}`` where ``same``
+says whether one answer serves both queries. For every threshold the script
+reports how many pairs would hit, how many of those hits are false, and the
+recall on same-answer pairs, overall and per tool.
+
+Run from the repository root:
+    python backend/benchmarks/semantic_cache_eval.py [pairs.jsonl] [threshold ...]
+"""
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.semantic_cache import HashingEmbedder, SemanticCache, evaluate_pairs
+
+DEFAULT_PAIRS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "semantic_pairs.jsonl")
+DEFAULT_THRESHOLDS = [0.6, 0.7, 0.8, 0.85, 0.9, 0.95]
+
+
+def load_pairs(path):
+    by_tool = defaultdict(list)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                by_tool[row["tool"]].append((row["a"], row["b"], row["same"]))
+    return by_tool
+
+
+def print_report(title, report):
+    print(title)
+    print(f"  {'threshold':>9}  {'hits':>4}  {'false':>5}  {'false-hit rate':>14}  {'recall':>6}")
+    for row in report:
+        rate = "-" if row["false_hit_rate"] is None else f"{row['false_hit_rate']:.3f}"
+        recall = "-" if row["recall"] is None else f"{row['recall']:.3f}"
+        print(f"  {row['threshold']:>9.2f}  {row['hits']:>4}  {row['false_hits']:>5}  {rate:>14}  {recall:>6}")
+
+
+def lookup_latency(embedder_dim, entries=1000, lookups=500):
+    cache = SemanticCache(max_entries=entries, dim=embedder_dim)
+    for i in range(entries):
+        cache.store("bench", f"question number {i} about medicine {i % 37} and food {i % 11}", "answer")
+    start = time.perf_counter()
+    for i in range(lookups):
+        cache.lookup("bench", f"question {i} about medicine {i % 41}")
+    return (time.perf_counter() - start) / lookups
+
+
+def main():
+    args = sys.argv[1:]
+    path = args.pop(0) if args and not args[0].replace(".", "", 1).isdigit() else DEFAULT_PAIRS
+    thresholds = [float(t) for t in args] or DEFAULT_THRESHOLDS
+
+    embedder = HashingEmbedder()
+    by_tool = load_pairs(path)
+    all_pairs = [pair for pairs in by_tool.values() for pair in pairs]
+
+    print_report(f"all tools ({len(all_pairs)} pairs)", evaluate_pairs(embedder, all_pairs, thresholds))
+    for tool, pairs in sorted(by_tool.items()):
+        print_report(f"{tool} ({len(pairs)} pairs)", evaluate_pairs(embedder, pairs, thresholds))
+
+    print(f"lookup latency (1000 entries): {lookup_latency(embedder.dim) * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
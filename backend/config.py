@@ -1,6 +1,11 @@
 from pydantic_settings import BaseSettings
+from pathlib import Path
 from typing import Optional
 
+# File locations are resolved from here, not from the directory the server is started in
+BACKEND_DIR = Path(__file__).resolve().parent
+PROJECT_DIR = BACKEND_DIR.parent
+
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./medicine_dispenser.db"
@@ -9,9 +14,12 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Comma-separated usernames allowed to see data across all users (usage metrics)
+    ADMIN_USERNAMES: str = ""
     
     # AI/ML API Keys
     AIMLAPI_KEY: str
+    AIMLAPI_BASE_URL: str = "https://api.aimlapi.com/v1"
     OPENAI_API_KEY: Optional[str] = None
     SERPAPI_API_KEY: Optional[str] = None
     
@@ -27,12 +35,92 @@ class Settings(BaseSettings):
     MONGODB_URI: Optional[str] = None
     DB_NAME: str = "medicine_dispenser"
     
+    # Worker threads for blocking agent/LLM work started from async routes
+    BLOCKING_WORKER_THREADS: int = 16
+    
+    # Conversation context sent with each chat message (approximate tokens)
+    CONTEXT_TOKEN_BUDGET: int = 2000
+    CONTEXT_MAX_TURNS: int = 20
+    CONTEXT_SUMMARY_MAX_TOKENS: int = 300
+    CONTEXT_SUMMARY_MODEL: str = "gpt-4o-mini"
+    # Turns that must pile up beyond the recent window before the summary is refreshed
+    CONTEXT_SUMMARY_MIN_TURNS: int = 6
+    CONTEXT_SUMMARY_TIMEOUT_SECONDS: float = 30
+    
+    # Overall time budget of one interactive chat turn, from request arrival to answer
+    CHAT_DEADLINE_SECONDS: float = 30
+    # An LLM call is not started with less than AGENT_MIN_LLM_SECONDS of it left, a tool
+    # call not with less than AGENT_MIN_TOOL_SECONDS. Without a deadline (background
+    # jobs) advisory LLM calls still stop after AGENT_LLM_TIMEOUT_SECONDS.
+    AGENT_MIN_LLM_SECONDS: float = 3
+    AGENT_MIN_TOOL_SECONDS: float = 1
+    AGENT_LLM_TIMEOUT_SECONDS: float = 60
+    
+    # Agent tool execution: how many tool calls of one response run at once, and how long each may take
+    AGENT_TOOL_CONCURRENCY: int = 6
+    AGENT_TOOL_TIMEOUT_SECONDS: float = 20
+    AGENT_TOOL_WORKERS: int = 32
+    
+    # Persistent cache of tool results (searches, drug pairs, prescription extractions)
+    TOOL_CACHE_PATH: str = str(BACKEND_DIR / "data" / "tool_cache.db")
+    TOOL_CACHE_MAX_ENTRIES: int = 2048
+    
+    # SerpAPI requests: timeouts, retries and the circuit breaker around them
+    SERPAPI_BASE_URL: str = "https://serpapi.com"
+    SERPAPI_CONNECT_TIMEOUT_SECONDS: float = 3.05
+    SERPAPI_READ_TIMEOUT_SECONDS: float = 10
+    SERPAPI_RETRIES: int = 2
+    SERPAPI_CIRCUIT_FAILURES: int = 5
+    SERPAPI_CIRCUIT_RESET_SECONDS: float = 30
+    
+    # Chat history is written behind the request, in batches by count or age
+    CHAT_HISTORY_FLUSH_SIZE: int = 50
+    CHAT_HISTORY_FLUSH_INTERVAL_SECONDS: float = 1.0
+    
+    # Voice chat: engines are "aimlapi" or "standin" (offline, for tests and load tests;
+    # only used with SPEECH_ALLOW_STANDIN, since it does not understand real audio)
+    SPEECH_STT_ENGINE: str = "aimlapi"
+    SPEECH_TTS_ENGINE: str = "aimlapi"
+    SPEECH_ALLOW_STANDIN: bool = False
+    SPEECH_STT_MODEL: str = "whisper-1"
+    SPEECH_TTS_MODEL: str = "tts-1"
+    SPEECH_TTS_VOICE: str = "alloy"
+    VOICE_SILENCE_MS: int = 700
+    VOICE_VAD_THRESHOLD: float = 500
+    VOICE_MAX_UTTERANCE_BYTES: int = 10 * 1024 * 1024
+    
+    # Background jobs
+    JOB_WORKERS: int = 2
+    JOB_POLL_INTERVAL_SECONDS: float = 2
+    JOB_LEASE_SECONDS: int = 600
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 5
+    JOB_RETENTION_DAYS: int = 7
+    JOB_UPLOAD_DIR: str = str(PROJECT_DIR / "uploads" / "jobs")
+    
+    # LLM and tool call metering
+    METERING_FLUSH_SIZE: int = 100
+    METERING_FLUSH_INTERVAL_SECONDS: float = 10
+    METERING_RETENTION_DAYS: int = 30
+    
+    # Bulk prescription import
+    PRESCRIPTION_IMPORT_MAX_FILES: int = 20
+    PRESCRIPTION_UPLOAD_DIR: str = str(PROJECT_DIR / "uploads" / "prescriptions")
+    
+    # YOLO models
+    MODEL_MANIFEST_PATH: str = str(BACKEND_DIR / "models" / "manifest.json")
+    
+    # Uploaded analysis images, and files served under /static
+    UPLOAD_DIR: str = str(PROJECT_DIR / "uploads")
+    STATIC_DIR: str = str(PROJECT_DIR / "static")
+    MODEL_WATCH_INTERVAL_SECONDS: int = 10
+    
     # URLs
     BACKEND_BASE_URL: str = "http://localhost:8000"
     FRONTEND_URL: str = "http://localhost:3000"
     
     class Config:
-        env_file = "backend/.env"
+        env_file = str(BACKEND_DIR / ".env")
         case_sensitive = True
 
 settings = Settings()
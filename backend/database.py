@@ -20,5 +20,11 @@ def get_db():
         db.close()
 
 def init_db():
-    from models import User, Medicine, Reminder, Prescription
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    from models import User, Medicine, Reminder, Prescription, ChatHistory, ConversationSummary, ImageAnalysis, CallMetric, Job
+    from utils.chat_search import setup_search
+    Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add indexes introduced since
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    setup_search(engine)
@@ -0,0 +1,240 @@
+"""
+Load-test scenario suite for the API.
+
+Virtual users log in and then, until the duration runs out, each pick a
+scenario from the selected mix, run it and wait a short think time. The
+report gives throughput and p50/p95/p99 latency per scenario and overall;
+for streamed chats the time to the first SSE event is reported as well.
+
+Run the backend against the stand-in (see standin.py) and then:
+    python backend/loadtest/run.py http://localhost:8000 --mix mixed --users 20 --duration 60
+
+Mixes: chat (agent turns only), mixed (chat, local commands, history and
+search with a little image analysis) and analysis (YOLO analysis heavy).
+Analysis scenarios are dropped when no model weights are present.
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import time
+import uuid
+
+import httpx
+from PIL import Image
+
+CHAT_PROMPTS = [
+    "What is the price of panadol?",
+    "Find pharmacies near me in Lahore",
+    "I have had a headache and mild fever since yesterday",
+    "Find a dermatologist in Karachi",
+    "Any tips for better sleep?",
+    "Is there an interaction between aspirin and ibuprofen?",
+    "What should I eat to lower my cholesterol?",
+    "Tell me about the HPV vaccine",
+    "Which hospitals are in Islamabad?",
+]
+LOCAL_COMMANDS = [
+    "show my medicines",
+    "add panadol 500mg at 08:00",
+    "list all my medications",
+]
+SEARCH_TERMS = ["panadol", "fever", "pharmacy", "sleep", "vaccine"]
+
+MIXES = {
+    "chat": {"chat": 6, "chat_stream": 4},
+    "mixed": {"chat": 3, "chat_stream": 2, "local_command": 2, "history": 2, "search": 1, "analysis": 1},
+    "analysis": {"analysis": 6, "analyses_list": 2, "chat": 1, "history": 1},
+}
+
+
+def auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_image(size=(640, 480)) -> bytes:
+    image = Image.new("RGB", size, (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+async def scenario_chat(client, token, context):
+    response = await client.post("/api/chat/message", json={"message": random.choice(CHAT_PROMPTS)}, headers=auth(token))
+    return response.status_code, {}
+
+
+async def scenario_chat_stream(client, token, context):
+    start = time.perf_counter()
+    first_event = None
+    async with client.stream("POST", "/api/chat/message/stream", json={"message": random.choice(CHAT_PROMPTS)}, headers=auth(token)) as response:
+        failed = False
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                if first_event is None and line != "event: start":
+                    first_event = time.perf_counter() - start
+                failed = failed or line == "event: error"
+        status = 500 if failed else response.status_code
+    return status, {"first_event": first_event}
+
+
+async def scenario_local_command(client, token, context):
+    response = await client.post("/api/chat/message", json={"message": random.choice(LOCAL_COMMANDS)}, headers=auth(token))
+    return response.status_code, {}
+
+
+async def scenario_history(client, token, context):
+    response = await client.get("/api/chat/history", params={"limit": 20}, headers=auth(token))
+    return response.status_code, {}
+
+
+async def scenario_search(client, token, context):
+    response = await client.get("/api/chat/search", params={"q": random.choice(SEARCH_TERMS)}, headers=auth(token))
+    return response.status_code, {}
+
+
+async def scenario_analysis(client, token, context):
+    model_name = random.choice(context["models"])
+    files = {"file": (f"{uuid.uuid4().hex}.jpg", test_image(), "image/jpeg")}
+    response = await client.post(f"/api/analyze/{model_name}", files=files, headers=auth(token))
+    return response.status_code, {}
+
+
+async def scenario_analyses_list(client, token, context):
+    response = await client.get("/api/analyses", params={"limit": 20}, headers=auth(token))
+    return response.status_code, {}
+
+
+SCENARIOS = {
+    "chat": scenario_chat,
+    "chat_stream": scenario_chat_stream,
+    "local_command": scenario_local_command,
+    "history": scenario_history,
+    "search": scenario_search,
+    "analysis": scenario_analysis,
+    "analyses_list": scenario_analyses_list,
+}
+
+
+async def create_user(client, run_id: str, i: int) -> str:
+    username = f"loadtest_{run_id}_{i}"
+    password = "loadtest-password"
+    response = await client.post("/api/auth/register", json={
+        "email": f"{username}@example.com",
+        "username": username,
+        "full_name": f"Load Test {i}",
+        "password": password,
+    })
+    response.raise_for_status()
+    response = await client.post("/api/auth/login/json", json={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def available_models(client) -> list:
+    response = await client.get("/api/models")
+    if response.status_code != 200:
+        return []
+    return [name for name, status in response.json().get("models", {}).items() if status.get("exists")]
+
+
+async def virtual_user(client, token, mix: dict, context, deadline: float, think: float, samples: list):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.perf_counter() < deadline:
+        name = random.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            status, extra = await SCENARIOS[name](client, token, context)
+        except httpx.HTTPError as e:
+            status, extra = type(e).__name__, {}
+        samples.append({"scenario": name, "status": status, "seconds": time.perf_counter() - start, **extra})
+        await asyncio.sleep(random.uniform(0, think * 2))
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    groups = {}
+    for sample in samples:
+        groups.setdefault(sample["scenario"], []).append(sample)
+    groups["all"] = samples
+
+    report = {}
+    for name, group in groups.items():
+        ok = [sample["seconds"] for sample in group if sample["status"] == 200]
+        report[name] = {
+            "requests": len(group),
+            "errors": len(group) - len(ok),
+            "throughput_rps": round(len(group) / elapsed, 2),
+            "p50_ms": round(percentile(ok, 0.50) * 1000, 1) if ok else None,
+            "p95_ms": round(percentile(ok, 0.95) * 1000, 1) if ok else None,
+            "p99_ms": round(percentile(ok, 0.99) * 1000, 1) if ok else None,
+            "max_ms": round(max(ok) * 1000, 1) if ok else None,
+        }
+        first_events = [sample["first_event"] for sample in group if sample.get("first_event") is not None]
+        if first_events:
+            report[name]["first_event_p50_ms"] = round(percentile(first_events, 0.50) * 1000, 1)
+            report[name]["first_event_p95_ms"] = round(percentile(first_events, 0.95) * 1000, 1)
+    return report
+
+
+def print_report(report: dict, elapsed: float, users: int, mix_name: str):
+    print(f"mix: {mix_name}, users: {users}, duration: {elapsed:.1f} s")
+    print(f"{'scenario':<15}{'reqs':>7}{'errs':>6}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, row in sorted(report.items(), key=lambda item: item[0] == "all"):
+        cells = [row[key] if row[key] is not None else "-" for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{name:<15}{row['requests']:>7}{row['errors']:>6}{row['throughput_rps']:>8}" + "".join(f"{cell:>10}" for cell in cells))
+        if "first_event_p50_ms" in row:
+            print(f"{'':<15}first SSE event p50 / p95: {row['first_event_p50_ms']} / {row['first_event_p95_ms']} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_url")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--think", type=float, default=0.5, help="mean think time between requests, seconds")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    mix = dict(MIXES[args.mix])
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        context = {"models": await available_models(client)}
+        if not context["models"]:
+            for name in ("analysis", "analyses_list"):
+                if mix.pop(name, None) is not None:
+                    print(f"No YOLO weights available; dropping the '{name}' scenario")
+        if not mix:
+            raise SystemExit("Nothing left to run in this mix")
+
+        run_id = uuid.uuid4().hex[:8]
+        tokens = await asyncio.gather(*(create_user(client, run_id, i) for i in range(args.users)))
+
+        samples = []
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(
+            virtual_user(client, token, mix, context, deadline, args.think, samples)
+            for token in tokens
+        ))
+        elapsed = time.perf_counter() - start
+
+    report = summarize(samples, elapsed)
+    print_report(report, elapsed, args.users, args.mix)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"mix": args.mix, "users": args.users, "duration": elapsed, "scenarios": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
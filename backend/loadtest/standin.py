@@ -0,0 +1,297 @@
+"""
+Offline stand-in for the upstream APIs the backend calls.
+
+Serves the OpenAI chat-completions API (plain, tool calls, streaming with
+usage, vision) under /v1 and the SerpAPI search API under /search, with
+canned responses and configurable latency distributions, so the app can be
+load-tested without api.aimlapi.com or serpapi.com.
+
+Start it, then point the backend at it:
+    python backend/loadtest/standin.py --port 9100 --llm-latency lognormal:900:0.5
+    AIMLAPI_BASE_URL=http://localhost:9100/v1 SERPAPI_BASE_URL=http://localhost:9100 \\
+        AIMLAPI_KEY=standin SERPAPI_API_KEY=standin uvicorn app:app --app-dir backend
+
+Latency specs (milliseconds): ``fixed:MS``, ``uniform:LOW:HIGH``,
+``normal:MEAN:STD`` or ``lognormal:MEDIAN:SIGMA``.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CHARS_PER_TOKEN = 4
+
+# Tool picked for a user message, by keyword; the first matches win
+TOOL_KEYWORDS = [
+    (re.compile(r"\b(?:price|cost|rate)\b"), ["medicine_pricing"]),
+    (re.compile(r"\bpharmac"), ["find_pharmacies"]),
+    (re.compile(r"\b(?:doctor|specialist|dermatologist|cardiologist)"), ["find_doctors"]),
+    (re.compile(r"\bhospital"), ["find_hospitals"]),
+    (re.compile(r"\btelemedicine|online consult"), ["find_telemedicine_services"]),
+    (re.compile(r"\bemergenc|ambulance"), ["emergency_services"]),
+    (re.compile(r"\binteract"), ["check_drug_interactions"]),
+    (re.compile(r"\b(?:symptom|fever|pain|cough|headache|nausea)"), ["symptom_checker"]),
+    (re.compile(r"\b(?:diet|nutrition|food|eat)"), ["nutrition_advisor"]),
+    (re.compile(r"\bvaccin"), ["vaccine_information"]),
+    (re.compile(r"\b(?:panadol|aspirin|ibuprofen|paracetamol|augmentin|brufen|metformin)\b"),
+     ["medicine_information", "medicine_pricing", "find_pharmacies"]),
+    (re.compile(r"\b(?:health|advice|tips|sleep|stress|hydrat)"), ["health_advisor"]),
+]
+
+ARGUMENT_DEFAULTS = {
+    "location": "Lahore",
+    "specialty": "general physician",
+    "duration": "2 days",
+    "severity": "moderate",
+    "medicines": "",
+    "medicine_id": "1",
+    "dosage": "500mg",
+    "time": "08:00",
+}
+
+CANNED_PRESCRIPTION = {
+    "medicines": [
+        {"name": "Panadol", "dosage": "500mg", "instructions": "Twice daily after meals"},
+        {"name": "Augmentin", "dosage": "625mg", "instructions": "Three times a day for 5 days"},
+    ]
+}
+
+CANNED_ANSWER = (
+    "Here is some general guidance. Stay hydrated, rest well and follow the dosing on the label. "
+    "If symptoms get worse or do not improve within a few days, please consult a doctor. "
+    "This information is not a substitute for professional medical advice."
+)
+
+
+def parse_latency(spec: str):
+    """Return a function sampling one delay in seconds from ``spec``"""
+    kind, *values = spec.split(":")
+    values = [float(value) for value in values]
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "normal":
+        return lambda: max(random.gauss(values[0], values[1]), 0) / 1000
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1]) / 1000
+    raise argparse.ArgumentTypeError(f"Unknown latency distribution '{spec}'")
+
+
+def estimate_tokens(value) -> int:
+    return max(len(json.dumps(value) if not isinstance(value, str) else value) // CHARS_PER_TOKEN, 1)
+
+
+def message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def has_image(message: dict) -> bool:
+    content = message.get("content")
+    return isinstance(content, list) and any(isinstance(part, dict) and part.get("type") == "image_url" for part in content)
+
+
+def tool_arguments(tool: dict, text: str) -> dict:
+    properties = (tool.get("function", {}).get("parameters") or {}).get("properties") or {}
+    location = re.search(r"\b(?:in|near|at)\s+([A-Z][a-z]+)", text)
+    specialty = re.search(r"\b([a-z]+(?:ologist|iatrician|ist))\b", text.lower())
+    arguments = {}
+    for name in properties:
+        if name == "location" and location:
+            arguments[name] = location.group(1)
+        elif name == "specialty" and specialty:
+            arguments[name] = specialty.group(1)
+        else:
+            arguments[name] = ARGUMENT_DEFAULTS.get(name, text)
+    return arguments
+
+
+def choose_tool_calls(tools: list, text: str) -> list:
+    available = {tool.get("function", {}).get("name"): tool for tool in tools}
+    lowered = text.lower()
+    for pattern, names in TOOL_KEYWORDS:
+        if pattern.search(lowered):
+            chosen = [name for name in names if name in available]
+            if chosen:
+                return [
+                    {
+                        "id": f"call_{uuid.uuid4().hex[:24]}",
+                        "type": "function",
+                        "function": {"name": name, "arguments": json.dumps(tool_arguments(available[name], text))},
+                    }
+                    for name in chosen
+                ]
+    return []
+
+
+def drug_pairs_answer(text: str) -> str:
+    pairs = re.findall(r"^- (.+?) \+ (.+?)$", text, re.MULTILINE)
+    return json.dumps({"pairs": [
+        {
+            "drug_a": a,
+            "drug_b": b,
+            "severity": "minor",
+            "summary": f"No clinically significant interaction between {a} and {b} is expected.",
+            "advice": "Take as prescribed and tell your doctor about all your medicines.",
+        }
+        for a, b in pairs
+    ]})
+
+
+def completion_for(body: dict):
+    """(content, tool_calls) the stand-in answers a chat-completions request with"""
+    messages = body.get("messages") or []
+    last = messages[-1] if messages else {}
+    text = message_text(last)
+
+    if any(has_image(message) for message in messages):
+        return json.dumps(CANNED_PRESCRIPTION), []
+    if "Reply with JSON only" in text and " + " in text:
+        return drug_pairs_answer(text), []
+    if body.get("tools") and last.get("role") == "user":
+        tool_calls = choose_tool_calls(body["tools"], text)
+        if tool_calls:
+            return "", tool_calls
+    return CANNED_ANSWER, []
+
+
+def create_app(llm_latency, search_latency, token_delay: float, error_rate: float) -> FastAPI:
+    app = FastAPI(title="Upstream stand-in")
+    counters = {"chat_completions": 0, "streams": 0, "searches": 0, "errors": 0}
+
+    def fail():
+        if random.random() < error_rate:
+            counters["errors"] += 1
+            return JSONResponse(status_code=503, content={"error": {"message": "stand-in injected failure", "type": "server_error"}})
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(llm_latency())
+        failure = fail()
+        if failure is not None:
+            return failure
+
+        content, tool_calls = completion_for(body)
+        completion_id = f"chatcmpl-standin-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4o")
+        usage = {
+            "prompt_tokens": estimate_tokens(body.get("messages") or []),
+            "completion_tokens": estimate_tokens(content or tool_calls),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        finish_reason = "tool_calls" if tool_calls else "stop"
+
+        if not body.get("stream"):
+            counters["chat_completions"] += 1
+            message = {"role": "assistant", "content": content or None}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            }
+
+        counters["streams"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        def chunk(delta: dict, finish=None, **extra):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in re.findall(r"\S+\s*", content):
+                await asyncio.sleep(token_delay)
+                yield chunk({"content": piece})
+            for i, call in enumerate(tool_calls):
+                yield chunk({"tool_calls": [{"index": i, **call}]})
+            yield chunk({}, finish_reason)
+            if include_usage:
+                yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/search")
+    async def search(request: Request):
+        query = request.query_params.get("q", "")
+        await asyncio.sleep(search_latency())
+        failure = fail()
+        if failure is not None:
+            return failure
+        counters["searches"] += 1
+        return {
+            "search_metadata": {"id": uuid.uuid4().hex, "status": "Success"},
+            "search_parameters": dict(request.query_params),
+            "organic_results": [
+                {
+                    "position": i + 1,
+                    "title": f"{query.title()} - result {i + 1}",
+                    "link": f"https://example.com/{i + 1}",
+                    "snippet": f"Stand-in result {i + 1} for {query}.",
+                }
+                for i in range(5)
+            ],
+            "local_results": {"places": [
+                {
+                    "title": f"Stand-in Place {i + 1}",
+                    "address": f"{i + 1} Main Boulevard, Lahore",
+                    "rating": round(3.5 + i * 0.3, 1),
+                    "phone": f"+92 42 0000 00{i}",
+                }
+                for i in range(5)
+            ]},
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return counters
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--llm-latency", type=parse_latency, default="lognormal:900:0.5",
+                        help="delay before the first byte of a completion")
+    parser.add_argument("--search-latency", type=parse_latency, default="lognormal:350:0.4")
+    parser.add_argument("--token-delay-ms", type=float, default=15, help="delay between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    app = create_app(args.llm_latency, args.search_latency, args.token_delay_ms / 1000, args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
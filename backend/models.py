@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, JSON
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -19,6 +19,7 @@ class User(Base):
     medicines = relationship("Medicine", back_populates="user", cascade="all, delete-orphan")
     reminders = relationship("Reminder", back_populates="user", cascade="all, delete-orphan")
     prescriptions = relationship("Prescription", back_populates="user", cascade="all, delete-orphan")
+    image_analyses = relationship("ImageAnalysis", back_populates="user", cascade="all, delete-orphan")
 
 class Medicine(Base):
     __tablename__ = "medicines"
@@ -74,4 +75,84 @@ class ChatHistory(Base):
     message = Column(Text, nullable=False)
     response = Column(Text, nullable=False)
     message_type = Column(String, default="text")  # text, image, audio
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_chat_history_user_created", "user_id", "created_at", "id"),
+    )
+
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    covered_until_id = Column(Integer, nullable=False, default=0)  # last ChatHistory id folded into the summary
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CallMetric(Base):
+    __tablename__ = "call_metrics"
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # llm, tool
+    name = Column(String, nullable=False)  # tool name or calling function
+    model = Column(String)
+    user_id = Column(Integer, index=True)
+    prompt_tokens = Column(Integer)
+    completion_tokens = Column(Integer)
+    latency_ms = Column(Float, nullable=False)
+    cache_hit = Column(Boolean)  # None when the call has no cache in front of it
+    error = Column(Text)
+    cost_usd = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_call_metrics_created", "created_at"),
+        Index("ix_call_metrics_name_created", "name", "created_at"),
+    )
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(String(36), primary_key=True)  # uuid4
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)  # chat_image, prescription_import
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed
+    payload = Column(JSON, nullable=False)
+    result = Column(JSON)
+    error = Column(Text)
+    idempotency_key = Column(String)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = Column(DateTime)  # lease of the worker running it
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_user_idempotency_key", "user_id", "idempotency_key", unique=True),
+        Index("ix_jobs_user_created", "user_id", "created_at"),
+    )
+
+class ImageAnalysis(Base):
+    __tablename__ = "image_analyses"
+    
+    id = Column(String(36), primary_key=True)  # analysis UUID, also used in image URLs
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # null for anonymous uploads
+    model_name = Column(String, nullable=False)
+    model_version = Column(String, nullable=False)
+    profile = Column(String, nullable=False)
+    content_hash = Column(String(64), nullable=False)  # sha256 of the uploaded image
+    upload_path = Column(String, nullable=False)
+    detections = Column(JSON, nullable=False)  # compact raw results: boxes, classes, confidences, RLE masks
+    ai_analysis = Column(Text)
+    renders = Column(JSON)  # rendered variant -> published /static URLs
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    user = relationship("User", back_populates="image_analyses")
+    
+    __table_args__ = (
+        Index("ix_image_analyses_user_created", "user_id", "created_at", "id"),
+        Index("ix_image_analyses_content_hash", "content_hash", "model_name", "model_version", "profile"),
+    )
@@ -1,19 +1,57 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 from datetime import datetime
-from database import get_db
+from typing import Optional
+from config import settings
+from database import get_db, SessionLocal
 from models import User, ChatHistory
 from schemas import ChatMessage, ChatResponse
-from utils.auth import get_current_user
-from utils.ai_agent import get_agent_graph, process_prescription_image, speech_to_text_tool, text_to_speech_tool
-from utils.ai_agent import AgentState, HumanMessage, AIMessage
+from utils.auth import get_current_user, get_optional_user
+from utils.chat_search import search_history
+from utils.concurrency import run_blocking
+from utils.deadline import Deadline
+from utils.jobs import PermanentJobError, accepted_response, enqueue, job_handler
+from utils.pagination import encode_cursor, keyset_page
+from utils.speech import PCM_ENCODING, EnergyVAD, get_speech_engines, speakable, split_sentences
+from utils.image_preprocessing import prepare_image
+from utils.conversation_context import build_context_messages
+from utils.history_writer import history_writer, unsaved
+from utils.ai_agent import agent_graph, create_agent_state, stream_agent, answer_locally, process_prescription_image, speech_to_text_tool, text_to_speech_tool
+from utils.ai_agent import AIMessage, tool_cache, serpapi_client, semantic_cache, SEMANTIC_CACHE_TOOLS
 import logging
 import io
+import json
+import os
+import time
+import uuid
+import asyncio
 import base64
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/chat", tags=["Chat"])
 
+def save_chat_turn(user_id: int, message: str, response_content: str, message_type: str):
+    # Queued, not committed; the history writer batches the insert and refreshes the summary
+    history_writer.add(user_id, message, response_content, message_type)
+
+def run_agent_turn(db: Session, user_id: int, content, history_message: str, message_type: str, deadline: Optional[Deadline] = None) -> str:
+    """Invoke the agent for one message and save the exchange. Blocking; call through run_blocking."""
+    # Simple medicine commands are executed directly, without an LLM round trip
+    response_content = answer_locally(db, user_id, content)
+    if response_content is None:
+        history = build_context_messages(db, user_id)
+        state = create_agent_state(db, user_id, content, history, deadline)
+        result = agent_graph.invoke(state)
+        
+        # Extract the AI's response
+        ai_response_message = result["messages"][-1]
+        response_content = ai_response_message.content if isinstance(ai_response_message, AIMessage) else str(ai_response_message)
+    
+    save_chat_turn(user_id, history_message, response_content, message_type)
+    return response_content
+
 @router.post("/message", response_model=ChatResponse)
 async def send_chat_message(
     chat_data: ChatMessage,
@@ -21,29 +59,12 @@ async def send_chat_message(
     db: Session = Depends(get_db)
 ):
     """Send a text message to AI agent"""
+    # Started before queueing for a worker so waiting counts against the budget
+    deadline = Deadline(settings.CHAT_DEADLINE_SECONDS)
     try:
-        # Get the agent graph and tools configured with the current db session and user_id
-        agent_graph, tools = get_agent_graph(db, current_user.id)
-
-        # Initialize agent state with user message and tools
-        state = AgentState(messages=[HumanMessage(content=chat_data.message)], user_id=str(current_user.id), tools=tools)
-        
-        # Invoke the agent graph
-        result = agent_graph.invoke(state)
-        
-        # Extract the AI's response
-        ai_response_message = result["messages"][-1]
-        response_content = ai_response_message.content if isinstance(ai_response_message, AIMessage) else str(ai_response_message)
-        
-        # Save to chat history
-        chat_entry = ChatHistory(
-            user_id=current_user.id,
-            message=chat_data.message,
-            response=response_content,
-            message_type="text"
+        response_content = await run_blocking(
+            run_agent_turn, db, current_user.id, chat_data.message, chat_data.message, "text", deadline
         )
-        db.add(chat_entry)
-        db.commit()
         
         return ChatResponse(
             response=response_content,
@@ -57,63 +78,122 @@ async def send_chat_message(
             detail=f"Error processing message: {str(e)}"
         )
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/message/stream")
+async def stream_chat_message(
+    chat_data: ChatMessage,
+    current_user: User = Depends(get_current_user)
+):
+    """Send a text message to AI agent and stream tool events and tokens back as Server-Sent Events"""
+    user_id = current_user.id
+    message = chat_data.message
+    deadline = Deadline(settings.CHAT_DEADLINE_SECONDS)
+
+    def event_stream():
+        # The request-scoped session may be closed before streaming ends, so use our own
+        db = SessionLocal()
+        try:
+            yield sse_event("start", {"timestamp": datetime.utcnow()})
+
+            local_response = answer_locally(db, user_id, message)
+            if local_response is not None:
+                events = [{"event": "done", "data": {"response": local_response}}]
+            else:
+                state = create_agent_state(db, user_id, message, build_context_messages(db, user_id), deadline)
+                events = stream_agent(state)
+            for event in events:
+                if event["event"] != "done":
+                    yield sse_event(event["event"], event["data"])
+                    continue
+
+                response_content = event["data"]["response"]
+                save_chat_turn(user_id, message, response_content, "text")
+                yield sse_event("done", {"response": response_content, "timestamp": datetime.utcnow()})
+        except Exception as e:
+            logger.error(f"Error streaming chat message: {str(e)}")
+            yield sse_event("error", {"detail": f"Error processing message: {str(e)}"})
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def image_message_content(message: Optional[str], image_data: bytes, mime_type: str) -> list:
+    """Multi-modal agent input for an uploaded image and its optional message"""
+    # Determine which tool to use based on message or default to prescription
+    if message and "prescription" in message.lower():
+        tool_call_message = f"Process this as a prescription: {message}"
+    elif message and "medicine" in message.lower():
+        tool_call_message = f"Identify the medicine in this image: {message}"
+    else:
+        # Default to prescription processing if no specific instruction
+        tool_call_message = "Process this image as a prescription."
+
+    image_base64 = base64.b64encode(image_data).decode("utf-8")
+    return [
+        {"type": "text", "text": tool_call_message},
+        {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_base64}"}}
+    ]
+
+@job_handler("chat_image")
+def run_chat_image_job(payload: dict, db: Session, job) -> dict:
+    """Background version of /image: one agent turn on the stored image"""
+    try:
+        with open(payload["image_path"], "rb") as f:
+            image_data = f.read()
+    except FileNotFoundError:
+        raise PermanentJobError("The uploaded image is no longer available")
+
+    message = payload.get("message")
+    response_content = run_agent_turn(
+        db, job.user_id, image_message_content(message, image_data, payload["mime_type"]), message or "Uploaded image", "image"
+    )
+    os.remove(payload["image_path"])
+    return {"response": response_content, "timestamp": datetime.utcnow().isoformat()}
+
 @router.post("/image")
 async def send_chat_image(
     file: UploadFile = File(...),
     message: str = Form(None),
+    background: bool = Query(False, description="Queue the work and return a job id instead of waiting"),
+    idempotency_key: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Send an image (prescription or medicine) to AI agent for processing"""
+    deadline = Deadline(settings.CHAT_DEADLINE_SECONDS)
     try:
         if not file.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="File must be an image")
         
         image_bytes = await file.read()
-        image_base64 = base64.b64encode(image_bytes).decode("utf-8")
+        # Send the vision model an image at the resolution it actually uses
+        prepared = await run_blocking(prepare_image, image_bytes)
         
-        # Determine which tool to use based on message or default to prescription
-        tool_call_message = ""
-        if message and "prescription" in message.lower():
-            tool_call_message = f"Process this as a prescription: {message}"
-        elif message and "medicine" in message.lower():
-            tool_call_message = f"Identify the medicine in this image: {message}"
-        else:
-            # Default to prescription processing if no specific instruction
-            tool_call_message = "Process this image as a prescription."
-
-        # Get the agent graph and tools configured with the current db session and user_id
-        agent_graph, tools = get_agent_graph(db, current_user.id)
-
-        # Initialize agent state with user message and image
-        # Format the message content for multi-modal input
-        multi_modal_content = [
-            {"type": "text", "text": tool_call_message},
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
-        ]
-        state = AgentState(
-            messages=[HumanMessage(content=multi_modal_content)],
-            user_id=str(current_user.id),
-            tools=tools
-        )
-        
-        # Invoke the agent graph
-        result = agent_graph.invoke(state)
-        
-        # Extract the AI's response
-        ai_response_message = result["messages"][-1]
-        response_content = ai_response_message.content if isinstance(ai_response_message, AIMessage) else str(ai_response_message)
+        if background:
+            # The job outlives the request, so the image goes to disk instead of the payload
+            os.makedirs(settings.JOB_UPLOAD_DIR, exist_ok=True)
+            image_path = os.path.join(settings.JOB_UPLOAD_DIR, f"{uuid.uuid4()}.jpg")
+            with open(image_path, "wb") as f:
+                f.write(prepared.data)
+            job, created = await run_blocking(
+                enqueue, db, current_user.id, "chat_image",
+                {"image_path": image_path, "mime_type": prepared.mime_type, "message": message, "uploads": [image_path]},
+                idempotency_key
+            )
+            if not created:
+                os.remove(image_path)
+            return JSONResponse(status_code=202, content=jsonable_encoder(accepted_response(job, created)))
         
-        # Save to chat history
-        user_message_history = message or "Uploaded image"
-        chat_entry = ChatHistory(
-            user_id=current_user.id,
-            message=user_message_history,
-            response=response_content,
-            message_type="image"
+        response_content = await run_blocking(
+            run_agent_turn, db, current_user.id, image_message_content(message, prepared.data, prepared.mime_type),
+            message or "Uploaded image", "image", deadline
         )
-        db.add(chat_entry)
-        db.commit()
         
         return {
             "status": "success",
@@ -135,6 +215,7 @@ async def send_chat_audio(
     db: Session = Depends(get_db)
 ):
     """Send an audio message to AI agent, get text response, and convert to audio"""
+    deadline = Deadline(settings.CHAT_DEADLINE_SECONDS)
     try:
         if not file.content_type.startswith("audio/"):
             raise HTTPException(status_code=400, detail="File must be an audio file")
@@ -143,34 +224,20 @@ async def send_chat_audio(
         audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
         
         # 1. Convert audio to text
-        transcribed_text = speech_to_text_tool(audio_base64)
+        transcribed_text = await run_blocking(speech_to_text_tool, audio_base64)
         if transcribed_text.startswith("Error"):
             raise HTTPException(status_code=500, detail=transcribed_text)
         
-        # Get the agent graph and tools configured with the current db session and user_id
-        agent_graph, tools = get_agent_graph(db, current_user.id)
-
-        # 2. Feed text to agent graph
-        state = AgentState(messages=[HumanMessage(content=transcribed_text)], user_id=str(current_user.id), tools=tools)
-        result = agent_graph.invoke(state)
-        ai_response_message = result["messages"][-1]
-        response_content = ai_response_message.content if isinstance(ai_response_message, AIMessage) else str(ai_response_message)
+        # 2. Feed text to agent graph and save the exchange
+        response_content = await run_blocking(
+            run_agent_turn, db, current_user.id, transcribed_text, transcribed_text, "audio", deadline
+        )
         
         # 3. Convert agent's text response to audio
-        response_audio_base64 = text_to_speech_tool(response_content)
+        response_audio_base64 = await run_blocking(text_to_speech_tool, response_content)
         if response_audio_base64.startswith("Error"):
             raise HTTPException(status_code=500, detail=response_audio_base64)
         
-        # Save to chat history
-        chat_entry = ChatHistory(
-            user_id=current_user.id,
-            message=transcribed_text,
-            response=response_content,
-            message_type="audio"
-        )
-        db.add(chat_entry)
-        db.commit()
-        
         return {
             "status": "success",
             "response_text": response_content,
@@ -185,20 +252,205 @@ async def send_chat_audio(
             detail=f"Error processing audio: {str(e)}"
         )
 
+def produce_agent_events(db: Session, user_id: int, message: str, emit, deadline: Optional[Deadline] = None):
+    """Run one agent turn on a worker thread, passing each stream event to ``emit``"""
+    local_response = answer_locally(db, user_id, message)
+    if local_response is not None:
+        emit({"event": "done", "data": {"response": local_response}})
+        return
+    state = create_agent_state(db, user_id, message, build_context_messages(db, user_id), deadline)
+    for event in stream_agent(state):
+        emit(event)
+
+async def answer_utterance(websocket: WebSocket, db: Session, user_id: int, transcript: str, tts, utterance_end: float):
+    """
+    Stream the agent's answer to one utterance: text deltas as they arrive and
+    synthesized audio sentence by sentence, so audio starts before the turn ends.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = Deadline(settings.CHAT_DEADLINE_SECONDS)
+    events = asyncio.Queue()
+    sentences = asyncio.Queue()
+    timings = {"transcript_ms": round((time.perf_counter() - utterance_end) * 1000, 1)}
+
+    def emit(event):
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    async def speak():
+        while (sentence := await sentences.get()) is not None:
+            clips = await run_blocking(lambda: list(tts.synthesize(sentence)))
+            for clip in clips:
+                if "first_audio_ms" not in timings:
+                    timings["first_audio_ms"] = round((time.perf_counter() - utterance_end) * 1000, 1)
+                await websocket.send_bytes(clip)
+
+    async def produce():
+        try:
+            await run_blocking(produce_agent_events, db, user_id, transcript, emit, deadline)
+        except Exception as e:
+            emit({"event": "error", "data": {"detail": str(e)}})
+        finally:
+            emit(None)
+
+    speaker = asyncio.create_task(speak())
+    producer = asyncio.create_task(produce())
+    streamed, pending, response_content = "", "", None
+    try:
+        while (event := await events.get()) is not None:
+            if event["event"] == "token":
+                streamed += event["data"]["text"]
+                pending += event["data"]["text"]
+                await websocket.send_json({"type": "response_delta", "text": event["data"]["text"]})
+                complete, pending = split_sentences(pending)
+                for sentence in complete:
+                    sentences.put_nowait(speakable(sentence))
+            elif event["event"] == "done":
+                response_content = event["data"]["response"]
+                # Tool answers replace the streamed text; otherwise only the unfinished tail is left to speak
+                rest = pending + response_content[len(streamed):] if response_content.startswith(streamed) else response_content
+                if rest.strip():
+                    sentences.put_nowait(speakable(rest))
+            elif event["event"] == "error":
+                await websocket.send_json({"type": "error", "detail": f"Error processing message: {event['data']['detail']}"})
+    finally:
+        sentences.put_nowait(None)
+        await producer
+        await speaker
+
+    if response_content is None:
+        return
+    save_chat_turn(user_id, transcript, response_content, "audio")
+    timings["total_ms"] = round((time.perf_counter() - utterance_end) * 1000, 1)
+    await websocket.send_json({"type": "audio_end"})
+    await websocket.send_json({"type": "done", "response": response_content, "timings": timings, "timestamp": datetime.utcnow().isoformat()})
+
+@router.websocket("/voice")
+async def voice_chat(websocket: WebSocket, token: Optional[str] = None):
+    """
+    Voice chat over a WebSocket, authenticated with ``?token=<access token>``.
+
+    Client -> server: binary frames of audio, plus JSON control messages
+    ``{"type": "start", "encoding": "pcm16", "sample_rate": 16000}`` (optional,
+    pcm16 at 16 kHz by default), ``{"type": "end"}`` to end an utterance and
+    ``{"type": "close"}``. With pcm16 audio, an utterance also ends on silence.
+
+    Server -> client: ``ready``, ``partial_transcript``, ``transcript``,
+    ``response_delta``, ``audio_end``, ``done`` (with timings) and ``error``
+    JSON messages; binary frames are self-contained audio clips in the
+    ``audio_format`` announced by ``ready``, one or more per sentence.
+    """
+    db = SessionLocal()
+    try:
+        user = get_optional_user(token, db)
+        if user is None:
+            await websocket.close(code=1008, reason="Not authenticated")
+            return
+        user_id = user.id
+        try:
+            stt, tts = get_speech_engines()
+        except ValueError as e:
+            logger.error(f"Voice chat unavailable: {str(e)}")
+            await websocket.close(code=1011, reason="Voice chat is not configured")
+            return
+
+        await websocket.accept()
+        encoding, sample_rate = PCM_ENCODING, 16000
+        transcriber, vad, received = stt.open(sample_rate, encoding), EnergyVAD(sample_rate), 0
+        await websocket.send_json({"type": "ready", "stt": stt.name, "tts": tts.name, "audio_format": tts.mime_type})
+
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            ended = False
+            if message.get("bytes") is not None:
+                chunk = message["bytes"]
+                received += len(chunk)
+                if received > settings.VOICE_MAX_UTTERANCE_BYTES:
+                    await websocket.send_json({"type": "error", "detail": "Utterance too long"})
+                    transcriber, received = stt.open(sample_rate, encoding), 0
+                    vad.reset()
+                    continue
+                partial = transcriber.feed(chunk)
+                if partial:
+                    await websocket.send_json({"type": "partial_transcript", "text": partial})
+                ended = encoding == PCM_ENCODING and vad.feed(chunk)
+            else:
+                try:
+                    control = json.loads(message.get("text") or "{}")
+                except ValueError:
+                    control = {}
+                if control.get("type") == "start":
+                    encoding = control.get("encoding", PCM_ENCODING)
+                    sample_rate = int(control.get("sample_rate", 16000))
+                    transcriber, vad, received = stt.open(sample_rate, encoding), EnergyVAD(sample_rate), 0
+                elif control.get("type") == "end":
+                    ended = True
+                elif control.get("type") == "close":
+                    break
+
+            if not ended:
+                continue
+            utterance_end = time.perf_counter()
+            try:
+                transcript = await run_blocking(transcriber.finish)
+            except Exception as e:
+                logger.error(f"Error transcribing audio: {str(e)}")
+                await websocket.send_json({"type": "error", "detail": f"Error transcribing audio: {str(e)}"})
+                transcript = ""
+            transcriber, received = stt.open(sample_rate, encoding), 0
+            vad.reset()
+            if not transcript:
+                continue
+
+            await websocket.send_json({"type": "transcript", "text": transcript})
+            await answer_utterance(websocket, db, user_id, transcript, tts, utterance_end)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error in voice chat: {str(e)}")
+    finally:
+        db.close()
+
 @router.get("/history")
-async def get_chat_history(
-    limit: int = 50,
+def get_chat_history(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get chat history for current user"""
-    history = db.query(ChatHistory).filter(
-        ChatHistory.user_id == current_user.id
-    ).order_by(ChatHistory.created_at.desc()).limit(limit).all()
+    """
+    Get chat history for current user, newest first; the next page's cursor is in X-Next-Cursor.
+    The first page also lists turns not yet written to the database, with ``id`` null.
+    """
+    # Read the queue before the table: a turn written in between is then seen twice, never missed
+    pending = history_writer.pending_for(current_user.id) if not cursor else []
+    if len(pending) > limit:
+        # Later pages only read the table, so queued turns that do not fit this page are written first
+        history_writer.flush()
+        pending = history_writer.pending_for(current_user.id)
+    query = db.query(ChatHistory).filter(ChatHistory.user_id == current_user.id)
+    try:
+        history, next_cursor = keyset_page(query, ChatHistory.created_at, ChatHistory.id, limit, cursor, id_type=int)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    fresh = unsaved(pending, history)
+    if fresh:
+        # Queued turns are the newest, so they go first and may push stored rows to the next page
+        history = fresh[::-1] + history
+        if len(history) > limit or next_cursor:
+            history = history[:limit]
+            last = history[-1]
+            next_cursor = encode_cursor(last.created_at, getattr(last, "id", 0))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     return [
         {
-            "id": chat.id,
+            "id": getattr(chat, "id", None),
             "message": chat.message,
             "response": chat.response,
             "message_type": chat.message_type,
@@ -206,3 +458,54 @@ async def get_chat_history(
         }
         for chat in history
     ]
+
+@router.get("/search")
+def search_chat_history(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Full-text search over the current user's chat history, newest first"""
+    try:
+        rows, next_cursor = search_history(db, current_user.id, q, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    return {
+        "items": [
+            {
+                "id": row["id"],
+                "message": row["message"],
+                "response": row["response"],
+                "message_type": row["message_type"],
+                "created_at": row["created_at"],
+                "snippet": row["snippet"]
+            }
+            for row in rows
+        ],
+        "next_cursor": next_cursor
+    }
+
+@router.get("/tools/cache-stats")
+async def get_tool_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit/miss counters for the cached search tools and prescription extraction (namespace "prescription")"""
+    return tool_cache.stats()
+
+@router.get("/tools/semantic-cache")
+async def get_semantic_cache_stats(
+    hits: int = 20,
+    current_user: User = Depends(get_current_user)
+):
+    """Semantic cache counters and the scores of the most recent hits"""
+    return {
+        "tools": sorted(SEMANTIC_CACHE_TOOLS),
+        **semantic_cache.stats(),
+        "recent_hits": semantic_cache.recent_hits(hits),
+    }
+
+@router.get("/tools/upstreams")
+async def get_tool_upstreams(current_user: User = Depends(get_current_user)):
+    """Connection settings and circuit breaker state of external search APIs"""
+    return {"serpapi": serpapi_client.status()}
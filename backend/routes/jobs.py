@@ -0,0 +1,91 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Optional
+from database import get_db, SessionLocal
+from models import User, Job
+from utils.auth import get_current_user
+from utils.concurrency import run_blocking
+from utils.jobs import TERMINAL_STATES, serialize_job
+import asyncio
+import json
+
+router = APIRouter(prefix="/api/jobs", tags=["Jobs"])
+
+EVENT_POLL_SECONDS = 1.0
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def get_user_job(db: Session, user_id: int, job_id: str) -> Job:
+    job = db.query(Job).filter(Job.id == job_id, Job.user_id == user_id).first()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
+def load_job_state(user_id: int, job_id: str) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id, Job.user_id == user_id).first()
+        return serialize_job(job) if job else None
+    finally:
+        db.close()
+
+@router.get("")
+def list_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    kind: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Recent background jobs of the current user, newest first"""
+    query = db.query(Job).filter(Job.user_id == current_user.id)
+    if kind:
+        query = query.filter(Job.kind == kind)
+    jobs = query.order_by(Job.created_at.desc()).limit(limit).all()
+    return [serialize_job(job) for job in jobs]
+
+@router.get("/{job_id}")
+def get_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Status, and once finished the result or error, of one job"""
+    return serialize_job(get_user_job(db, current_user.id, job_id))
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Server-sent events with the job state on every change, ending once it succeeds or fails"""
+    await run_blocking(get_user_job, db, current_user.id, job_id)
+    user_id = current_user.id
+
+    async def event_stream():
+        last_seen = None
+        while not await request.is_disconnected():
+            state = await run_blocking(load_job_state, user_id, job_id)
+            if state is None:
+                yield sse_event("error", {"message": "Job not found"})
+                return
+            seen = (state["status"], state["attempts"])
+            if seen != last_seen:
+                last_seen = seen
+                yield sse_event("status", state)
+            if state["status"] in TERMINAL_STATES:
+                yield sse_event("done", {"job_id": job_id, "status": state["status"]})
+                return
+            await asyncio.sleep(EVENT_POLL_SECONDS)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,13 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Header, Query
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from contextvars import copy_context
 from datetime import datetime
+from config import settings
 from database import get_db
 from models import User, Medicine
-from schemas import MedicineCreate, MedicineUpdate, MedicineResponse
+from schemas import MedicineCreate, MedicineUpdate, MedicineResponse, PrescriptionImportResponse
 from utils.auth import get_current_user
 from utils.schedular import create_reminders_for_medicine
+from utils.concurrency import BLOCKING_EXECUTOR, run_blocking
+from utils.jobs import PermanentJobError, accepted_response, enqueue, job_handler
+from utils.metering import metered_user
+from utils.ai_agent import process_prescription_image
+from utils.prescription_import import import_prescriptions
+import asyncio
 import logging
+import os
+import uuid
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/medicines", tags=["Medicines"])
@@ -61,6 +73,102 @@ async def create_medicine(
     
     return medicine
 
+def import_failures(sources) -> list:
+    return [
+        {"filename": source["filename"], "message": source["result"].get("message") or source["result"].get("analysis") or "No medicines found"}
+        for source in sources
+        if source["result"].get("status") != "success"
+    ]
+
+@job_handler("prescription_import")
+def run_prescription_import_job(payload: dict, db: Session, job) -> dict:
+    """Background version of /import over the images already saved to disk"""
+    sources = []
+    for source in payload["sources"]:
+        try:
+            with open(source["file_path"], "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            raise PermanentJobError(f"{source['filename']} is no longer available")
+        sources.append({**source, "content": content})
+
+    # Same concurrent extraction as the request path; each call keeps the worker's metering context
+    futures = [
+        BLOCKING_EXECUTOR.submit(copy_context().run, process_prescription_image, source.pop("content"), source["filename"], job.user_id)
+        for source in sources
+    ]
+    for source, future in zip(sources, futures):
+        source["result"] = future.result()
+
+    imported = import_prescriptions(db, job.user_id, sources)
+    response = PrescriptionImportResponse.model_validate({**imported, "failed": import_failures(sources)})
+    return response.model_dump(mode="json")
+
+@router.post("/import", response_model=PrescriptionImportResponse)
+async def import_prescription_images(
+    files: List[UploadFile] = File(...),
+    background: bool = Query(False, description="Queue the import and return a job id instead of waiting"),
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Extract medicines from several prescription images at once and add them with their reminders"""
+    if len(files) > settings.PRESCRIPTION_IMPORT_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.PRESCRIPTION_IMPORT_MAX_FILES} files can be imported at once"
+        )
+    for file in files:
+        if not (file.content_type or "").startswith("image/"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{file.filename} is not an image"
+            )
+
+    os.makedirs(settings.PRESCRIPTION_UPLOAD_DIR, exist_ok=True)
+    sources = []
+    for file in files:
+        filename = os.path.basename(file.filename or "prescription")
+        file_path = os.path.join(settings.PRESCRIPTION_UPLOAD_DIR, f"{uuid.uuid4()}_{filename}")
+        content = await file.read()
+        with open(file_path, "wb") as f:
+            f.write(content)
+        sources.append({"filename": filename, "file_path": file_path, "content": content})
+
+    if background:
+        payload = {
+            "sources": [{"filename": source["filename"], "file_path": source["file_path"]} for source in sources],
+            # Kept on success: the Prescription rows point at them
+            "uploads": [source["file_path"] for source in sources],
+        }
+        job, created = await run_blocking(
+            enqueue, db, current_user.id, "prescription_import", payload, idempotency_key
+        )
+        if not created:
+            for source in sources:
+                os.remove(source["file_path"])
+        return JSONResponse(status_code=202, content=jsonable_encoder(accepted_response(job, created)))
+
+    # All pages are extracted concurrently on the blocking worker pool
+    with metered_user(current_user.id):
+        results = await asyncio.gather(*(
+            run_blocking(process_prescription_image, source.pop("content"), source["filename"], current_user.id)
+            for source in sources
+        ))
+    for source, result in zip(sources, results):
+        source["result"] = result
+
+    try:
+        imported = await run_blocking(import_prescriptions, db, current_user.id, sources)
+    except Exception as e:
+        logger.error(f"Error importing prescriptions: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error importing prescriptions: {str(e)}"
+        )
+
+    return {**imported, "failed": import_failures(sources)}
+
 @router.get("/", response_model=List[MedicineResponse])
 async def get_medicines(
     status: str = "active",
@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Optional
+from database import get_db
+from models import User, CallMetric
+from utils.auth import get_current_user, is_admin
+from utils.metering import flush_metrics, recorder, summarize_calls
+
+router = APIRouter(prefix="/api/metrics", tags=["Metrics"])
+
+GROUPINGS = {
+    "name": ("kind", "name", "model"),
+    "model": ("model",),
+    "user": ("user_id",),
+}
+
+@router.get("/calls")
+def get_call_metrics(
+    hours: float = Query(24, gt=0, le=24 * 30),
+    group_by: str = Query("name", pattern="^(name|model|user)$"),
+    kind: Optional[str] = Query(None, pattern="^(llm|tool)$"),
+    name: Optional[str] = None,
+    mine: bool = True,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Token, cost, latency, cache and error aggregates of LLM and tool calls over the last ``hours``.
+    Covers the current user's calls; all users (``mine=false``) and ``group_by=user`` are admin only.
+    """
+    if (not mine or group_by == "user") and not is_admin(current_user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can see other users' calls"
+        )
+
+    # Include calls still waiting in the write buffer
+    flush_metrics()
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+    query = db.query(CallMetric).filter(CallMetric.created_at >= since)
+    if kind:
+        query = query.filter(CallMetric.kind == kind)
+    if name:
+        query = query.filter(CallMetric.name == name)
+    if mine:
+        query = query.filter(CallMetric.user_id == current_user.id)
+    rows = query.all()
+
+    groups = summarize_calls(rows, GROUPINGS[group_by])
+    llm_rows = [row for row in rows if row.kind == "llm"]
+    return {
+        "since": since,
+        "group_by": group_by,
+        "totals": {
+            "calls": len(rows),
+            "llm_calls": len(llm_rows),
+            "prompt_tokens": sum(row.prompt_tokens or 0 for row in llm_rows),
+            "completion_tokens": sum(row.completion_tokens or 0 for row in llm_rows),
+            "cost_usd": round(sum(row.cost_usd or 0 for row in llm_rows), 6),
+            "errors": sum(1 for row in rows if row.error),
+        },
+        "groups": groups,
+        "pending_writes": recorder.pending(),
+    }
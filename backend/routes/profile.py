@@ -5,6 +5,7 @@ from database import get_db
 from models import User
 from schemas import UserResponse, UserUpdate
 from utils.auth import get_current_user, get_password_hash, verify_password
+from utils.history_writer import history_writer, unsaved
 from pydantic import BaseModel
 import logging
 
@@ -117,9 +118,14 @@ async def get_profile_stats(
         Reminder.status == "acknowledged"
     ).count()
     
-    total_chats = db.query(ChatHistory).filter(
-        ChatHistory.user_id == current_user.id
-    ).count()
+    # Turns still queued by the history writer count too. Read the queue before the
+    # table, then drop queued turns that a flush wrote in between, so none is counted twice
+    pending = history_writer.pending_for(current_user.id)
+    chats = db.query(ChatHistory).filter(ChatHistory.user_id == current_user.id)
+    total_chats = chats.count()
+    if pending:
+        stored = chats.filter(ChatHistory.created_at >= pending[0].created_at).all()
+        total_chats += len(unsaved(pending, stored))
     
     # Calculate adherence rate
     adherence_rate = 0
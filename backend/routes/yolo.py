@@ -1,34 +1,40 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse, JSONResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from PIL import Image
 import io
 import os
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import openai
 import base64
+import hashlib
 import json
 from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
 from config import settings
+from database import get_db
+from models import User, ImageAnalysis
+from schemas import ImageAnalysisPage
+from utils.auth import get_current_user, get_optional_user
+from utils.pagination import keyset_page
+from utils.metering import metered_completion, metered_user
+from utils.annotations import (
+    DEFAULT_OPACITY, decode_rle, extract_raw_results, filter_objects, fit_to_size,
+    render_detections, resize_mask, rle_area, snap_opacity, snap_size
+)
+from utils.static_files import THUMBNAIL_SIZE, publish_image
+from utils.model_registry import LoadedModel, ModelLoadError, ModelRegistry, UnknownProfileError
 import uuid
 
-# Define model paths
-MODELS_DIR = "backend/models" # Updated to reflect actual location
-
-MODELS = {
-    "bone_detection_model": os.path.join(MODELS_DIR, "bone_detection_model.pt"),
-    "brain_tumor_segmentation_model": os.path.join(MODELS_DIR, "brain_tumor_segmentation_model.pt"),
-    "eye_conjunctiva_detection_model": os.path.join(MODELS_DIR, "eye_conjuntiva_detection_model.pt"),
-    "liver_disease_detection_model": os.path.join(MODELS_DIR, "liver_disease_detection_model.pt"),
-    "skin_disease_detection_model": os.path.join(MODELS_DIR, "skin_disease_detection_model.pt"),
-    "teeth_detection_model": os.path.join(MODELS_DIR, "teeth_detection_model.pt")
-}
+# Models, versions and inference settings come from the manifest
+MODELS_DIR = os.path.dirname(settings.MODEL_MANIFEST_PATH)
+model_registry = ModelRegistry(settings.MODEL_MANIFEST_PATH)
 
 # Ensure required directories exist
-UPLOAD_DIR = "uploads"
-STATIC_DIR = "static"
+UPLOAD_DIR = settings.UPLOAD_DIR
+STATIC_DIR = settings.STATIC_DIR
 # MODELS_DIR is now defined above
 
 def ensure_directories():
@@ -48,96 +54,82 @@ EYE_CONJUNCTIVA_CLASS_COLORS = [
     (0, 100, 0),    # Dark green for forniceal_palpebral
     (139, 0, 139)   # Dark magenta for palpebral
 ]
+EYE_CONJUNCTIVA_OPACITY = 0.6
 
 # Function to create custom eye conjunctiva visualization
-def create_eye_conjunctiva_visualization(image_np, results):
+def create_eye_conjunctiva_visualization(image_np, objects, opacity=EYE_CONJUNCTIVA_OPACITY):
     annotated_image = image_np.copy()
-    if hasattr(results, 'masks') and results.masks is not None:
-        masks = results.masks.data.cpu().numpy()
-        classes = results.boxes.cls.cpu().numpy().astype(int)
-        for mask, cls_idx in zip(masks, classes):
-            if cls_idx < len(EYE_CONJUNCTIVA_CLASS_COLORS):
-                color = EYE_CONJUNCTIVA_CLASS_COLORS[cls_idx]
-                mask = (mask > 0.5).astype(np.uint8)
-                mask_resized = cv2.resize(mask, (annotated_image.shape[1], annotated_image.shape[0]), interpolation=cv2.INTER_NEAREST)
-                colored_mask = np.zeros_like(annotated_image, dtype=np.uint8)
-                for c in range(3):
-                    colored_mask[:, :, c] = mask_resized * color[c]
-                annotated_image = cv2.addWeighted(annotated_image, 1.0, colored_mask, 0.6, 0)
-                moments = cv2.moments(mask_resized)
-                if moments["m00"] != 0:
-                    cx = int(moments["m10"] / moments["m00"])
-                    cy = int(moments["m01"] / moments["m00"])
-                    label = EYE_CONJUNCTIVA_CLASS_NAMES[cls_idx]
-                    offset_x, offset_y = 60, -40
-                    label_x = min(cx + offset_x, annotated_image.shape[1] - 10)
-                    label_y = max(cy + offset_y, 20)
-                    cv2.arrowedLine(
-                        annotated_image,
-                        (label_x, label_y),
-                        (cx, cy),
-                        color,
-                        2,
-                        tipLength=0.2
-                    )
-                    font_scale = 0.6
-                    font_thickness = 2
-                    text_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness)[0]
-                    highlight_color = (255, 255, 200)
-                    padding_x, padding_y = 8, 8
-                    cv2.rectangle(
-                        annotated_image,
-                        (label_x - padding_x, label_y - text_size[1] - padding_y),
-                        (label_x + text_size[0] + padding_x, label_y + padding_y),
-                        highlight_color, -1
-                    )
-                    cv2.putText(
-                        annotated_image,
-                        label,
-                        (label_x, label_y),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        font_scale,
-                        (0, 0, 0),
-                        font_thickness,
-                        cv2.LINE_AA
-                    )
+    height, width = annotated_image.shape[:2]
+    for obj in objects:
+        cls_idx = obj["class_id"]
+        if obj["mask"] is not None and cls_idx < len(EYE_CONJUNCTIVA_CLASS_COLORS):
+            color = EYE_CONJUNCTIVA_CLASS_COLORS[cls_idx]
+            mask_resized = resize_mask(decode_rle(obj["mask"]), width, height)
+            colored_mask = np.zeros_like(annotated_image, dtype=np.uint8)
+            for c in range(3):
+                colored_mask[:, :, c] = mask_resized * color[c]
+            annotated_image = cv2.addWeighted(annotated_image, 1.0, colored_mask, opacity, 0)
+            moments = cv2.moments(mask_resized)
+            if moments["m00"] != 0:
+                cx = int(moments["m10"] / moments["m00"])
+                cy = int(moments["m01"] / moments["m00"])
+                label = EYE_CONJUNCTIVA_CLASS_NAMES[cls_idx]
+                offset_x, offset_y = 60, -40
+                label_x = min(cx + offset_x, annotated_image.shape[1] - 10)
+                label_y = max(cy + offset_y, 20)
+                cv2.arrowedLine(
+                    annotated_image,
+                    (label_x, label_y),
+                    (cx, cy),
+                    color,
+                    2,
+                    tipLength=0.2
+                )
+                font_scale = 0.6
+                font_thickness = 2
+                text_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness)[0]
+                highlight_color = (255, 255, 200)
+                padding_x, padding_y = 8, 8
+                cv2.rectangle(
+                    annotated_image,
+                    (label_x - padding_x, label_y - text_size[1] - padding_y),
+                    (label_x + text_size[0] + padding_x, label_y + padding_y),
+                    highlight_color, -1
+                )
+                cv2.putText(
+                    annotated_image,
+                    label,
+                    (label_x, label_y),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale,
+                    (0, 0, 0),
+                    font_thickness,
+                    cv2.LINE_AA
+                )
     return annotated_image
 
-# Load models into memory
-LOADED_MODELS = {}
-
-def get_model(model_name: str):
-    """Load and return a YOLO model"""
-    if model_name not in MODELS:
+def get_model(model_name: str) -> LoadedModel:
+    """Return the active version of a YOLO model, loading it on first use"""
+    try:
+        return model_registry.get(model_name)
+    except KeyError:
         raise HTTPException(status_code=404, detail="Model not found")
-    
-    if model_name not in LOADED_MODELS:
-        model_path = MODELS[model_name]
-        
-        if not os.path.exists(model_path):
-            abs_path = os.path.abspath(model_path)
-            error_msg = (
-                f"Model file not found: {model_path}\n"
-                f"Absolute path: {abs_path}\n"
-                f"Please ensure the model file exists at this location.\n"
-                f"Current working directory: {os.getcwd()}"
-            )
-            print(error_msg)
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Model file not found: {model_path}. Please place the model file in the models directory."
-            )
-        
-        try:
-            print(f"Loading model from: {model_path}")
-            LOADED_MODELS[model_name] = YOLO(model_path)
-            print(f"Successfully loaded model: {model_name}")
-        except Exception as e:
-            error_msg = f"Error loading model {model_name} from {model_path}: {str(e)}"
-            print(error_msg)
-            raise HTTPException(status_code=500, detail=error_msg)
-    
-    return LOADED_MODELS[model_name]
+    except FileNotFoundError as e:
+        model_path = str(e)
+        error_msg = (
+            f"Model file not found: {model_path}\n"
+            f"Absolute path: {os.path.abspath(model_path)}\n"
+            f"Please ensure the model file exists at this location.\n"
+            f"Current working directory: {os.getcwd()}"
+        )
+        print(error_msg)
+        raise HTTPException(
+            status_code=404,
+            detail=f"Model file not found: {model_path}. Please place the model file in the models directory."
+        )
+    except ModelLoadError as e:
+        print(str(e))
+        raise HTTPException(status_code=500, detail=str(e))
 
 def generate_ai_analysis(model_name: str, detections: list, segmentation_info: list):
     """Generate AI medical analysis based on detections"""
@@ -201,9 +193,10 @@ Please provide clear, actionable, and medically sound advice.
         
         aiml_client = openai.OpenAI(
             api_key=api_key,
-            base_url="https://api.aimlapi.com/v1"
+            base_url=settings.AIMLAPI_BASE_URL
         )
-        response = aiml_client.chat.completions.create(
+        response = metered_completion(
+            aiml_client, "generate_ai_analysis",
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are a medical AI assistant providing professional medical analysis and recommendations based on image analysis results."},
@@ -217,7 +210,78 @@ Please provide clear, actionable, and medically sound advice.
         print(f"Error generating AI analysis: {e}")
         return f"Error generating AI analysis: {str(e)}"
 
-async def process_image_analysis(model_name: str, file: UploadFile):
+def summarize_raw_results(raw_results: dict):
+    """Build the detection strings and segmentation stats returned by the API"""
+    detections = []
+    segmentation_info = []
+
+    for obj in raw_results["objects"]:
+        if raw_results["has_masks"] and obj["mask"] is None:
+            continue
+        detections.append(f"{obj['class_name']} (confidence: {obj['confidence']:.2f})")
+
+        if obj["mask"] is not None:
+            mask_height, mask_width = obj["mask"]["size"]
+            area_pixels = rle_area(obj["mask"])
+            total_pixels = mask_height * mask_width
+            segmentation_info.append({
+                'class': obj["class_name"],
+                'confidence': obj["confidence"],
+                'area_percentage': float(area_pixels / total_pixels * 100),
+                'area_pixels': area_pixels
+            })
+
+    return detections, segmentation_info
+
+def find_previous_analysis(db: Session, model_name: str, model_version: str, profile: str, content_hash: str) -> Optional[ImageAnalysis]:
+    """Look up an earlier analysis of the same image with the same model version and profile"""
+    return db.query(ImageAnalysis).filter(
+        ImageAnalysis.content_hash == content_hash,
+        ImageAnalysis.model_name == model_name,
+        ImageAnalysis.model_version == model_version,
+        ImageAnalysis.profile == profile
+    ).order_by(ImageAnalysis.created_at.desc()).first()
+
+def get_analysis_or_404(db: Session, analysis_id: str) -> ImageAnalysis:
+    analysis = db.query(ImageAnalysis).filter(ImageAnalysis.id == analysis_id).first()
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return analysis
+
+def serialize_analysis(analysis: ImageAnalysis) -> dict:
+    """Build the API representation of a stored analysis without re-running anything"""
+    detections, segmentation_info = summarize_raw_results(analysis.detections)
+    return {
+        "analysis_id": analysis.id,
+        "model_name": analysis.model_name,
+        "model_version": analysis.model_version,
+        "profile": analysis.profile,
+        "detections": detections,
+        "segmentation_info": segmentation_info,
+        "ai_analysis": analysis.ai_analysis,
+        "annotated_image_url": f"/api/annotated/{analysis.id}",
+        "thumbnail_url": f"/api/annotated/{analysis.id}?thumbnail=true",
+        "created_at": analysis.created_at.isoformat()
+    }
+
+def render_annotated_image(analysis: ImageAnalysis, opacity: Optional[float] = None, classes: Optional[list] = None, max_size: Optional[int] = None):
+    """Draw the stored detections over the original upload and return an RGB array"""
+    if not os.path.exists(analysis.upload_path):
+        raise HTTPException(status_code=404, detail="Original image no longer available")
+
+    image_bgr = cv2.cvtColor(np.array(Image.open(analysis.upload_path).convert('RGB')), cv2.COLOR_RGB2BGR)
+    objects = filter_objects(analysis.detections, classes)
+
+    if analysis.model_name == "eye_conjunctiva_detection_model" and analysis.detections["has_masks"]:
+        annotated_bgr = create_eye_conjunctiva_visualization(
+            image_bgr, objects, EYE_CONJUNCTIVA_OPACITY if opacity is None else opacity
+        )
+    else:
+        annotated_bgr = render_detections(image_bgr, objects, DEFAULT_OPACITY if opacity is None else opacity)
+
+    return cv2.cvtColor(fit_to_size(annotated_bgr, max_size), cv2.COLOR_BGR2RGB)
+
+async def process_image_analysis(model_name: str, file: UploadFile, db: Session, current_user: Optional[User] = None, profile: Optional[str] = None):
     """Common image analysis processing logic"""
     try:
         ensure_directories()
@@ -226,7 +290,6 @@ async def process_image_analysis(model_name: str, file: UploadFile):
         unique_id = str(uuid.uuid4())
         safe_filename = os.path.basename(file.filename)
         original_filename = f"{unique_id}_{safe_filename}"
-        annotated_filename = f"{unique_id}_annotated_{safe_filename}"
 
         # Save original image
         upload_path = os.path.join(UPLOAD_DIR, original_filename)
@@ -237,74 +300,56 @@ async def process_image_analysis(model_name: str, file: UploadFile):
         
         print(f"Saved uploaded image to: {upload_path}")
 
-        # Read and process image
-        image = Image.open(upload_path).convert('RGB')
-        img_array = np.array(image)
-
-        # Load model
+        # Hold on to this version for the whole request, even if a reload swaps it out
         model = get_model(model_name)
-
-        # Perform inference
-        results = model(img_array, verbose=False)
-
-        # Process detections
-        detections = []
-        segmentation_info = []
-
-        for result in results:
-            if hasattr(result, 'masks') and result.masks is not None:
-                masks = result.masks.data.cpu().numpy()
-                classes = result.boxes.cls.cpu().numpy().astype(int)
-                confidences = result.boxes.conf.cpu().numpy()
-                
-                for i, (mask, cls_idx, conf) in enumerate(zip(masks, classes, confidences)):
-                    class_name = model.names[cls_idx]
-                    detections.append(f"{class_name} (confidence: {conf:.2f})")
-                    
-                    mask_binary = (mask > 0.5).astype(np.uint8)
-                    area_pixels = np.sum(mask_binary)
-                    total_pixels = mask_binary.shape[0] * mask_binary.shape[1]
-                    area_percentage = (area_pixels / total_pixels) * 100
-                    
-                    segmentation_info.append({
-                        'class': class_name,
-                        'confidence': float(conf),
-                        'area_percentage': float(area_percentage),
-                        'area_pixels': int(area_pixels)
-                    })
-            elif result.boxes is not None:
-                boxes = result.boxes
-                for box in boxes:
-                    cls = int(box.cls[0])
-                    conf = float(box.conf[0])
-                    class_name = model.names[cls]
-                    detections.append(f"{class_name} (confidence: {conf:.2f})")
-
-        # Generate AI analysis
-        ai_analysis_content = generate_ai_analysis(model_name, detections, segmentation_info)
-
-        # Generate annotated image
-        if model_name == "eye_conjunctiva_detection_model" and segmentation_info:
-            annotated_img_np = create_eye_conjunctiva_visualization(img_array, results[0])
-            annotated_img_np = cv2.cvtColor(annotated_img_np, cv2.COLOR_BGR2RGB)
+        try:
+            profile = model.resolve_profile(profile)
+        except UnknownProfileError:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown profile '{profile}'. Available profiles: {', '.join(model.profiles.keys())}"
+            )
+        content_hash = hashlib.sha256(file_content).hexdigest()
+
+        # Same image, model version and profile: reuse the stored results instead of recomputing
+        previous = find_previous_analysis(db, model_name, model.version, profile, content_hash)
+        if previous is not None:
+            raw_results = previous.detections
+            detections, segmentation_info = summarize_raw_results(raw_results)
+            ai_analysis_content = previous.ai_analysis
         else:
-            annotated_img_np = results[0].plot()
-            annotated_img_np = cv2.cvtColor(annotated_img_np, cv2.COLOR_BGR2RGB)
-
-        # Save annotated image
-        annotated_path = os.path.join(STATIC_DIR, annotated_filename)
-        Image.fromarray(annotated_img_np).save(annotated_path, format="PNG")
-        print(f"Saved annotated image to: {annotated_path}")
-
-        annotated_image_url = f"/static/{annotated_filename}"
+            # Read and process image
+            image = Image.open(upload_path).convert('RGB')
+            img_array = np.array(image)
+
+            # Perform inference
+            results = model.predict(img_array, profile=profile)
+
+            # Keep only the compact raw output; the annotated image is rendered on demand
+            raw_results = extract_raw_results(results[0], model.names)
+            detections, segmentation_info = summarize_raw_results(raw_results)
+
+            # Generate AI analysis
+            with metered_user(current_user.id if current_user else None):
+                ai_analysis_content = generate_ai_analysis(model_name, detections, segmentation_info)
+
+        analysis = ImageAnalysis(
+            id=unique_id,
+            user_id=current_user.id if current_user else None,
+            model_name=model_name,
+            model_version=model.version,
+            profile=profile,
+            content_hash=content_hash,
+            upload_path=upload_path,
+            detections=raw_results,
+            ai_analysis=ai_analysis_content,
+            renders=previous.renders if previous is not None else None
+        )
+        db.add(analysis)
+        db.commit()
+        db.refresh(analysis)
 
-        return {
-            "model_name": model_name,
-            "detections": detections,
-            "segmentation_info": segmentation_info,
-            "ai_analysis": ai_analysis_content,
-            "annotated_image_url": annotated_image_url
-        }
+        return serialize_analysis(analysis)
 
     except HTTPException:
         raise
@@ -317,83 +362,211 @@ async def process_image_analysis(model_name: str, file: UploadFile):
 # Create router
 router = APIRouter(prefix="/api")
 
+PROFILE_QUERY = Query(None, description="Inference profile, e.g. fast, balanced or accurate")
+# Rendered variants stored per analysis (the default one always is); others are rendered per request
+MAX_STORED_RENDERS = 12
+
 @router.get("/models")
 async def list_models():
-    """List all available models and their status"""
-    model_status = {}
-    for model_name, model_path in MODELS.items():
-        exists = os.path.exists(model_path)
-        loaded = model_name in LOADED_MODELS
-        model_status[model_name] = {
-            "path": model_path,
-            "exists": exists,
-            "loaded": loaded,
-            "absolute_path": os.path.abspath(model_path)
-        }
-    
+    """List all available models, their active versions, profiles and measured latency"""
     return JSONResponse(content={
-        "models": model_status,
+        "models": model_registry.status(),
+        "manifest": os.path.abspath(settings.MODEL_MANIFEST_PATH),
         "current_directory": os.getcwd()
     })
 
+def stream_render(image: Image.Image, thumbnail: bool) -> Response:
+    """A rendered variant as a plain PNG (or JPEG thumbnail) response, without publishing it"""
+    buffer = io.BytesIO()
+    if thumbnail:
+        image = image.convert("RGB")
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        image.save(buffer, format="JPEG", quality=80)
+        media_type = "image/jpeg"
+    else:
+        image.save(buffer, format="PNG")
+        media_type = "image/png"
+    return Response(content=buffer.getvalue(), media_type=media_type, headers={"Cache-Control": "public, max-age=86400"})
+
+@router.get("/annotated/{analysis_id}")
+def get_annotated_image(
+    analysis_id: str,
+    max_size: Optional[int] = Query(None, ge=32, le=4096, description="Longest side of the returned image in pixels"),
+    opacity: Optional[float] = Query(None, ge=0.0, le=1.0, description="Mask overlay opacity"),
+    classes: Optional[str] = Query(None, description="Comma-separated class names to draw"),
+    thumbnail: bool = Query(False, description="Redirect to the pre-generated thumbnail"),
+    db: Session = Depends(get_db)
+):
+    """
+    Renders the annotated image for a stored analysis on first request and redirects
+    to its content-hashed, immutable /static URL. Sizes and opacities are snapped to
+    fixed steps; once an analysis has MAX_STORED_RENDERS variants, further ones are
+    returned directly without being stored.
+    """
+    analysis = get_analysis_or_404(db, analysis_id)
+    max_size, opacity = snap_size(max_size), snap_opacity(opacity)
+    class_filter = sorted({c.strip().lower() for c in classes.split(",") if c.strip()}) if classes else None
+
+    variant = "full" if max_size is None else str(max_size)
+    if opacity is not None:
+        variant += f"_o{round(opacity * 100)}"
+    if class_filter:
+        # Only classes the analysis contains change the image; the rest must not make new variants
+        present = {obj["class_name"].lower() for obj in analysis.detections["objects"]}
+        drawn = [c for c in class_filter if c in present]
+        variant += "_c" + (hashlib.sha1(",".join(drawn).encode("utf-8")).hexdigest()[:10] if drawn else "none")
+
+    renders = analysis.renders or {}
+    published = renders.get(variant)
+    if not published or not os.path.exists(os.path.join(STATIC_DIR, os.path.basename(published["url"]))):
+        image = Image.fromarray(render_annotated_image(analysis, opacity, class_filter, max_size))
+        if variant not in renders and variant != "full" and len(renders) >= MAX_STORED_RENDERS:
+            return stream_render(image, thumbnail)
+        published = publish_image(image, f"{analysis_id}_annotated_{variant}")
+        analysis.renders = {**renders, variant: published}
+        db.commit()
+        print(f"Rendered annotated image to: {published['url']}")
+
+    # The stored detections never change, so the variant -> artifact mapping is stable
+    return RedirectResponse(
+        published["thumbnail_url"] if thumbnail else published["url"],
+        status_code=302,
+        headers={"Cache-Control": "public, max-age=86400"}
+    )
+
+@router.get("/analyses", response_model=ImageAnalysisPage)
+async def list_analyses(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    model_name: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Lists the current user's past analyses, newest first, from stored results
+    """
+    query = db.query(ImageAnalysis).filter(ImageAnalysis.user_id == current_user.id)
+    if model_name:
+        query = query.filter(ImageAnalysis.model_name == model_name)
+
+    try:
+        analyses, next_cursor = keyset_page(query, ImageAnalysis.created_at, ImageAnalysis.id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return {
+        "items": [serialize_analysis(analysis) for analysis in analyses],
+        "next_cursor": next_cursor
+    }
+
+@router.get("/analyses/{analysis_id}")
+async def get_analysis(
+    analysis_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Returns a single stored analysis owned by the current user
+    """
+    analysis = get_analysis_or_404(db, analysis_id)
+    if analysis.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return serialize_analysis(analysis)
+
 # Bone Detection Model Route
 @router.post("/bone-detection")
-async def analyze_bone_detection(file: UploadFile = File(...)):
+async def analyze_bone_detection(
+    file: UploadFile = File(...),
+    profile: Optional[str] = PROFILE_QUERY,
+    current_user: Optional[User] = Depends(get_optional_user),
+    db: Session = Depends(get_db)
+):
     """
     Analyzes bone fractures and abnormalities in X-ray images
     """
-    return JSONResponse(content=await process_image_analysis("bone_detection_model", file))
+    return JSONResponse(content=await process_image_analysis("bone_detection_model", file, db, current_user, profile))
 
 # Brain Tumor Segmentation Model Route
 @router.post("/brain-tumor")
-async def analyze_brain_tumor(file: UploadFile = File(...)):
+async def analyze_brain_tumor(
+    file: UploadFile = File(...),
+    profile: Optional[str] = PROFILE_QUERY,
+    current_user: Optional[User] = Depends(get_optional_user),
+    db: Session = Depends(get_db)
+):
     """
     Segments and analyzes brain tumors in MRI images
     """
-    return JSONResponse(content=await process_image_analysis("brain_tumor_segmentation_model", file))
+    return JSONResponse(content=await process_image_analysis("brain_tumor_segmentation_model", file, db, current_user, profile))
 
 # Eye Conjunctiva Detection Model Route
 @router.post("/eye-conjunctiva")
-async def analyze_eye_conjunctiva(file: UploadFile = File(...)):
+async def analyze_eye_conjunctiva(
+    file: UploadFile = File(...),
+    profile: Optional[str] = PROFILE_QUERY,
+    current_user: Optional[User] = Depends(get_optional_user),
+    db: Session = Depends(get_db)
+):
     """
     Analyzes eye conjunctiva regions (forniceal, palpebral, forniceal_palpebral)
     """
-    return JSONResponse(content=await process_image_analysis("eye_conjunctiva_detection_model", file))
+    return JSONResponse(content=await process_image_analysis("eye_conjunctiva_detection_model", file, db, current_user, profile))
 
 # Liver Disease Detection Model Route
 @router.post("/liver-disease")
-async def analyze_liver_disease(file: UploadFile = File(...)):
+async def analyze_liver_disease(
+    file: UploadFile = File(...),
+    profile: Optional[str] = PROFILE_QUERY,
+    current_user: Optional[User] = Depends(get_optional_user),
+    db: Session = Depends(get_db)
+):
     """
     Detects liver abnormalities and diseases in medical images
     """
-    return JSONResponse(content=await process_image_analysis("liver_disease_detection_model", file))
+    return JSONResponse(content=await process_image_analysis("liver_disease_detection_model", file, db, current_user, profile))
 
 # Skin Disease Detection Model Route
 @router.post("/skin-disease")
-async def analyze_skin_disease(file: UploadFile = File(...)):
+async def analyze_skin_disease(
+    file: UploadFile = File(...),
+    profile: Optional[str] = PROFILE_QUERY,
+    current_user: Optional[User] = Depends(get_optional_user),
+    db: Session = Depends(get_db)
+):
     """
     Classifies various skin conditions and diseases
     """
-    return JSONResponse(content=await process_image_analysis("skin_disease_detection_model", file))
+    return JSONResponse(content=await process_image_analysis("skin_disease_detection_model", file, db, current_user, profile))
 
 # Teeth Detection Model Route
 @router.post("/teeth-detection")
-async def analyze_teeth(file: UploadFile = File(...)):
+async def analyze_teeth(
+    file: UploadFile = File(...),
+    profile: Optional[str] = PROFILE_QUERY,
+    current_user: Optional[User] = Depends(get_optional_user),
+    db: Session = Depends(get_db)
+):
     """
     Analyzes dental images for oral health assessment
     """
-    return JSONResponse(content=await process_image_analysis("teeth_detection_model", file))
+    return JSONResponse(content=await process_image_analysis("teeth_detection_model", file, db, current_user, profile))
 
 # Legacy route for backward compatibility
 @router.post("/analyze/{model_name}")
-async def analyze_image(model_name: str, file: UploadFile = File(...)):
+async def analyze_image(
+    model_name: str,
+    file: UploadFile = File(...),
+    profile: Optional[str] = PROFILE_QUERY,
+    current_user: Optional[User] = Depends(get_optional_user),
+    db: Session = Depends(get_db)
+):
     """
     Legacy endpoint - analyzes an uploaded medical image using the specified YOLO model
     """
-    if model_name not in MODELS:
+    if model_name not in model_registry.names():
         raise HTTPException(
             status_code=404, 
-            detail=f"Model '{model_name}' not found. Available models: {', '.join(MODELS.keys())}"
+            detail=f"Model '{model_name}' not found. Available models: {', '.join(model_registry.names())}"
         )
     
-    return JSONResponse(content=await process_image_analysis(model_name, file))
+    return JSONResponse(content=await process_image_analysis(model_name, file, db, current_user, profile))
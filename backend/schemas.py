@@ -102,4 +102,34 @@ class PrescriptionResponse(BaseModel):
     created_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class PrescriptionImportFailure(BaseModel):
+    filename: str
+    message: str
+
+class PrescriptionImportResponse(BaseModel):
+    prescriptions: List[PrescriptionResponse]
+    created: List[MedicineResponse]
+    updated: List[MedicineResponse]
+    reminders_created: int
+    # Imported medicines without reminder times (as needed, weekly, unclear); the user sets these
+    needs_schedule: List[MedicineResponse]
+    failed: List[PrescriptionImportFailure]
+
+# Image Analysis Schemas
+class ImageAnalysisResponse(BaseModel):
+    analysis_id: str
+    model_name: str
+    model_version: str
+    profile: str
+    detections: List[str]
+    segmentation_info: List[Dict[str, Any]]
+    ai_analysis: Optional[str]
+    annotated_image_url: str
+    thumbnail_url: str
+    created_at: datetime
+
+class ImageAnalysisPage(BaseModel):
+    items: List[ImageAnalysisResponse]
+    next_cursor: Optional[str] = None
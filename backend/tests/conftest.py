@@ -0,0 +1,22 @@
+"""
+Test setup: the backend is imported with backend/ on sys.path, as when it is
+served, against throwaway SQLite databases and placeholder credentials.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+TEST_DB_DIR = tempfile.mkdtemp(prefix="medivision-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DB_DIR, 'test.db')}"
+os.environ["TOOL_CACHE_PATH"] = os.path.join(TEST_DB_DIR, "tool_cache.db")
+for name, value in {
+    "SECRET_KEY": "test-secret",
+    "AIMLAPI_KEY": "test",
+    "SMTP_USERNAME": "test",
+    "SMTP_PASSWORD": "test",
+    "FROM_EMAIL": "tests@example.com",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,87 @@
+"""
+Agent turns run on the worker pool, so the event loop keeps serving other
+requests while chat messages are in flight.
+"""
+import asyncio
+import time
+import uuid
+
+import httpx
+from langchain.schema import AIMessage
+
+from app import app
+from database import SessionLocal, init_db
+from models import User
+from routes import chat
+from utils.auth import create_access_token, get_password_hash
+
+AGENT_SECONDS = 1.5
+CONCURRENT_CHATS = 4
+# Far below one agent turn: a blocked loop would hold each probe for AGENT_SECONDS
+MAX_PROBE_SECONDS = 0.5
+
+
+class SlowAgent:
+    """Stands in for the LangGraph agent: blocks its thread like an LLM round trip"""
+
+    def invoke(self, state):
+        time.sleep(AGENT_SECONDS)
+        return {"messages": [AIMessage(content="Drink water regularly.")]}
+
+
+def create_user(username: str) -> str:
+    db = SessionLocal()
+    try:
+        db.add(User(
+            email=f"{username}@example.com",
+            username=username,
+            hashed_password=get_password_hash("password")
+        ))
+        db.commit()
+    finally:
+        db.close()
+    return create_access_token({"sub": username})
+
+
+async def probe(client, path: str, headers: dict, stop: asyncio.Event) -> list:
+    samples = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200
+        await asyncio.sleep(0.05)
+    return samples
+
+
+async def chat_while_probing(headers: dict):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+        stop = asyncio.Event()
+        probes = [
+            asyncio.create_task(probe(client, "/health", {}, stop)),
+            asyncio.create_task(probe(client, "/api/chat/history", headers, stop)),
+        ]
+        chats = await asyncio.gather(*(
+            client.post("/api/chat/message", json={"message": f"Any tips for staying hydrated? ({i})"}, headers=headers)
+            for i in range(CONCURRENT_CHATS)
+        ))
+        stop.set()
+        return chats, await asyncio.gather(*probes)
+
+
+def test_other_endpoints_stay_responsive_during_chat(monkeypatch):
+    init_db()
+    monkeypatch.setattr(chat, "agent_graph", SlowAgent())
+    headers = {"Authorization": f"Bearer {create_user(f'concurrency-{uuid.uuid4().hex[:8]}')}"}
+
+    start = time.perf_counter()
+    chats, (health, history) = asyncio.run(chat_while_probing(headers))
+    elapsed = time.perf_counter() - start
+
+    assert [response.status_code for response in chats] == [200] * CONCURRENT_CHATS
+    # The turns overlapped instead of running one after another
+    assert elapsed < AGENT_SECONDS * CONCURRENT_CHATS
+    for samples in (health, history):
+        assert len(samples) >= 3
+        assert max(samples) < MAX_PROBE_SECONDS
@@ -1,12 +1,17 @@
 import os
 from dotenv import load_dotenv
 import json
+import logging
 from datetime import datetime
-from typing import TypedDict, Annotated, Sequence
+from typing import TypedDict, Annotated, Sequence, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import operator
+import time
 from langgraph.graph import StateGraph, END
 from langchain_openai import ChatOpenAI
-from langchain.tools import Tool, StructuredTool
+from langchain.tools import StructuredTool
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
 from langchain.agents import AgentExecutor, create_openai_functions_agent
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
@@ -14,21 +19,129 @@ import requests
 from openai import OpenAI  # AIMLAPI uses OpenAI-compatible client
 from sqlalchemy.orm import Session # Import Session for type hinting
 from models import Medicine # Import Medicine model
+from utils.tool_cache import ToolCache, normalize_query
+from utils.http_client import HTTPClient, CircuitOpenError
+from utils.semantic_cache import SemanticCache
+from utils import drug_interactions
+from utils.medicine_lexicon import medicine_lexicon
+from utils.image_preprocessing import prepare_image
+from utils.intent_router import Intent, confident_intent
+from utils.metering import meter, metered_completion, metered_user, note_cache_hit, note_usage, record_call
+from utils.deadline import Deadline, DeadlineExceeded, call_with_deadline
+from config import settings
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
 AIMLAPI_KEY = os.getenv("AIMLAPI_KEY")
+# Point at backend/loadtest/standin.py to run without the real API
+AIMLAPI_BASE_URL = os.getenv("AIMLAPI_BASE_URL", "https://api.aimlapi.com/v1")
 
 # Initialize AIMLAPI client
 aiml_client = OpenAI(
     api_key=AIMLAPI_KEY,
-    base_url="https://api.aimlapi.com/v1"
+    base_url=AIMLAPI_BASE_URL
 )
 
 # Backend base URL for HTTP requests
 BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL", "http://localhost:8000")
 
+# ============= SERPAPI CACHE =============
+# Search results change slowly, so each tool type keeps them for a while
+SERPAPI_CACHE_TTL_SECONDS = {
+    "medicine_pricing": 6 * 3600,
+    "pharmacies": 24 * 3600,
+    "doctors": 24 * 3600,
+    "hospitals": 24 * 3600,
+    "telemedicine": 3 * 24 * 3600,
+    "medicine_information": 7 * 24 * 3600,
+    "emergency_services": 24 * 3600,
+    "vaccine_information": 7 * 24 * 3600,
+}
+
+tool_cache = ToolCache(settings.TOOL_CACHE_PATH, max_entries=settings.TOOL_CACHE_MAX_ENTRIES)
+
+serpapi_client = HTTPClient(
+    "serpapi",
+    settings.SERPAPI_BASE_URL,
+    connect_timeout=settings.SERPAPI_CONNECT_TIMEOUT_SECONDS,
+    read_timeout=settings.SERPAPI_READ_TIMEOUT_SECONDS,
+    retries=settings.SERPAPI_RETRIES,
+    failure_threshold=settings.SERPAPI_CIRCUIT_FAILURES,
+    reset_timeout=settings.SERPAPI_CIRCUIT_RESET_SECONDS
+)
+
+def serpapi_search(tool_type: str, params: dict) -> dict:
+    """
+    Run a SerpAPI search, answered from the tool cache while the result is fresh.
+    When the upstream fails, its circuit is open or the request is out of time,
+    the last known (stale) result is returned with ``_stale`` set; without one
+    the error propagates.
+    """
+    fetched = []
+
+    def fetch():
+        fetched.append(True)
+        timeout = tuple(request_timeout(limit) for limit in serpapi_client.timeout)
+        data = serpapi_client.get_json("/search", params={**params, "api_key": SERPAPI_API_KEY}, timeout=timeout)
+        if "error" in data:
+            raise RuntimeError(data["error"])
+        return data
+
+    key = normalize_query(params)
+    try:
+        data = tool_cache.get_or_compute(tool_type, key, SERPAPI_CACHE_TTL_SECONDS[tool_type], fetch)
+        note_cache_hit(not fetched)
+        return data
+    except (CircuitOpenError, DeadlineExceeded, requests.RequestException) as e:
+        stale = tool_cache.get(tool_type, key, allow_stale=True)
+        if stale is None:
+            raise
+        logger.warning(f"Serving stale {tool_type} results: {str(e)}")
+        return {**stale, "_stale": True}
+
+def stale_note(data: dict) -> str:
+    if data.get("_stale"):
+        return "*Live search is currently unavailable; these are the most recent cached results.*\n"
+    return ""
+
+# ============= SEMANTIC CACHE =============
+# Advisory LLM tools answer near-identical questions from cache. Only the tools
+# listed in SEMANTIC_CACHE_TOOLS opt in; an empty value disables the cache.
+SEMANTIC_CACHE_TOOLS = {
+    name.strip()
+    for name in os.getenv("SEMANTIC_CACHE_TOOLS", "health_advisor,nutrition_advisor,symptom_checker").split(",")
+    if name.strip()
+}
+
+semantic_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(24 * 3600)))
+)
+
+def cached_advice(tool_name: str, query: str, compute, namespace: str = None) -> str:
+    """Answer ``query`` from the semantic cache when the tool opted in, else call ``compute``"""
+    if tool_name not in SEMANTIC_CACHE_TOOLS:
+        return compute()
+    computed = []
+
+    def compute_and_note():
+        computed.append(True)
+        return compute()
+
+    answer = semantic_cache.get_or_compute(namespace or tool_name, query, compute_and_note)
+    note_cache_hit(not computed)
+    return answer
+
+# Interaction results for a drug pair are stable; keep them for a long time
+DRUG_INTERACTION_TTL_SECONDS = float(os.getenv("DRUG_INTERACTION_TTL_SECONDS", str(90 * 24 * 3600)))
+# An "unknown" answer is the model failing to decide, not a finding; retry it soon
+DRUG_INTERACTION_UNKNOWN_TTL_SECONDS = float(os.getenv("DRUG_INTERACTION_UNKNOWN_TTL_SECONDS", "3600"))
+
 # ============= DATABASE SETUP =============
 class MedicineDatabase:
     def __init__(self, db_session: Session): # Accept SQLAlchemy session
@@ -188,13 +301,10 @@ def medicine_pricing_tool(query: str) -> str:
     try:
         if not SERPAPI_API_KEY:
             return "**Pricing search not available** - API key not set."
-        params = {
+        data = serpapi_search("medicine_pricing", {
             "engine": "google",
-            "q": f"{query} price in Pakistan",
-            "api_key": SERPAPI_API_KEY
-        }
-        response = requests.get("https://serpapi.com/search", params=params)
-        data = response.json()
+            "q": f"{query} price in Pakistan"
+        })
         if "organic_results" in data:
             results = data["organic_results"][:3]
             pricing_info = "**Pricing Information:**\n\n"
@@ -203,7 +313,7 @@ def medicine_pricing_tool(query: str) -> str:
                 link = result.get("link", "N/A")
                 snippet = result.get("snippet", "N/A")
                 pricing_info += f"- **{title}**\n  {snippet}\n  *Link:* {link}\n\n"
-            return pricing_info
+            return pricing_info + stale_note(data)
         else:
             return "**No pricing information found.**"
     except Exception as e:
@@ -213,13 +323,10 @@ def find_nearby_pharmacies_tool(location: str) -> str:
     try:
         if not SERPAPI_API_KEY:
             return "**Pharmacy search not available** - API key not set."
-        params = {
+        data = serpapi_search("pharmacies", {
             "engine": "google",
-            "q": f"pharmacies near {location}",
-            "api_key": SERPAPI_API_KEY
-        }
-        response = requests.get("https://serpapi.com/search", params=params)
-        data = response.json()
+            "q": f"pharmacies near {location}"
+        })
         if "local_results" in data and "places" in data["local_results"]:
             results = data["local_results"]["places"][:5]
             pharmacy_info = f"**Nearby Pharmacies near {location}:**\n\n"
@@ -229,7 +336,7 @@ def find_nearby_pharmacies_tool(location: str) -> str:
                 rating = result.get("rating", "N/A")
                 phone = result.get("phone", "N/A")
                 pharmacy_info += f"- **{title}**\n  *Address:* {address}\n  *Rating:* {rating}\n  *Phone:* {phone}\n\n"
-            return pharmacy_info
+            return pharmacy_info + stale_note(data)
         else:
             return "**No pharmacies found.**"
     except Exception as e:
@@ -239,13 +346,10 @@ def find_doctors_tool(specialty: str, location: str) -> str:
     try:
         if not SERPAPI_API_KEY:
             return "**Doctor search not available** - API key not set."
-        params = {
+        data = serpapi_search("doctors", {
             "engine": "google",
-            "q": f"{specialty} doctors near {location}",
-            "api_key": SERPAPI_API_KEY
-        }
-        response = requests.get("https://serpapi.com/search", params=params)
-        data = response.json()
+            "q": f"{specialty} doctors near {location}"
+        })
         if "local_results" in data and "places" in data["local_results"]:
             results = data["local_results"]["places"][:5]
             doctor_info = f"**Nearby {specialty} Doctors near {location}:**\n\n"
@@ -255,7 +359,7 @@ def find_doctors_tool(specialty: str, location: str) -> str:
                 rating = result.get("rating", "N/A")
                 phone = result.get("phone", "N/A")
                 doctor_info += f"- **{title}**\n  *Address:* {address}\n  *Rating:* {rating}\n  *Phone:* {phone}\n\n"
-            return doctor_info
+            return doctor_info + stale_note(data)
         else:
             return "**No doctors found.**"
     except Exception as e:
@@ -265,13 +369,10 @@ def find_hospitals_tool(location: str) -> str:
     try:
         if not SERPAPI_API_KEY:
             return "**Hospital search not available** - API key not set."
-        params = {
+        data = serpapi_search("hospitals", {
             "engine": "google",
-            "q": f"hospitals near {location}",
-            "api_key": SERPAPI_API_KEY
-        }
-        response = requests.get("https://serpapi.com/search", params=params)
-        data = response.json()
+            "q": f"hospitals near {location}"
+        })
         if "local_results" in data and "places" in data["local_results"]:
             results = data["local_results"]["places"][:5]
             hospital_info = f"**Nearby Hospitals near {location}:**\n\n"
@@ -281,7 +382,7 @@ def find_hospitals_tool(location: str) -> str:
                 rating = result.get("rating", "N/A")
                 phone = result.get("phone", "N/A")
                 hospital_info += f"- **{title}**\n  *Address:* {address}\n  *Rating:* {rating}\n  *Phone:* {phone}\n\n"
-            return hospital_info
+            return hospital_info + stale_note(data)
         else:
             return "**No hospitals found.**"
     except Exception as e:
@@ -291,13 +392,10 @@ def find_telemedicine_services_tool() -> str:
     try:
         if not SERPAPI_API_KEY:
             return "**Telemedicine search not available** - API key not set."
-        params = {
+        data = serpapi_search("telemedicine", {
             "engine": "google",
-            "q": "telemedicine services in Pakistan",
-            "api_key": SERPAPI_API_KEY
-        }
-        response = requests.get("https://serpapi.com/search", params=params)
-        data = response.json()
+            "q": "telemedicine services in Pakistan"
+        })
         if "organic_results" in data:
             results = data["organic_results"][:5]
             telemedicine_info = "**Telemedicine Services in Pakistan:**\n\n"
@@ -306,54 +404,118 @@ def find_telemedicine_services_tool() -> str:
                 link = result.get("link", "N/A")
                 snippet = result.get("snippet", "N/A")
                 telemedicine_info += f"- **{title}**\n  {snippet}\n  *Link:* {link}\n\n"
-            return telemedicine_info
+            return telemedicine_info + stale_note(data)
         else:
             return "**No telemedicine services found.**"
     except Exception as e:
         return f"**Error finding telemedicine services:** {str(e)}"
 
 def health_advisor_tool(query: str) -> str:
-    try:
-        response = aiml_client.chat.completions.create(
+    def ask():
+        response = metered_completion(
+            aiml_client, "health_advisor",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a knowledgeable health advisor. Be accurate and remind users to consult doctors."},
                 {"role": "user", "content": query}
             ],
             temperature=0.7,
-            max_tokens=512
+            max_tokens=512,
+            timeout=request_timeout(settings.AGENT_LLM_TIMEOUT_SECONDS)
         )
         return response.choices[0].message.content
+
+    try:
+        return cached_advice("health_advisor", query, ask)
     except Exception as e:
         return f"Error getting health advice: {str(e)}"
 
 def symptom_checker_tool(symptoms: str, duration: str, severity: str) -> str:
-    try:
-        response = aiml_client.chat.completions.create(
+    def ask():
+        response = metered_completion(
+            aiml_client, "symptom_checker",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a symptom checker. Suggest possible causes and when to see a doctor."},
                 {"role": "user", "content": f"Symptoms: {symptoms}\nDuration: {duration}\nSeverity: {severity}"}
             ],
             temperature=0.5,
-            max_tokens=512
+            max_tokens=512,
+            timeout=request_timeout(settings.AGENT_LLM_TIMEOUT_SECONDS)
         )
-        return "Symptom Checker Result:\n\n" + response.choices[0].message.content
+        return response.choices[0].message.content
+
+    try:
+        # Duration and severity change the advice, so they must match exactly;
+        # only the symptom description is compared semantically.
+        namespace = f"symptom_checker:{' '.join(duration.lower().split())}:{' '.join(severity.lower().split())}"
+        answer = cached_advice("symptom_checker", symptoms, ask, namespace=namespace)
+        return "Symptom Checker Result:\n\n" + answer
     except Exception as e:
         return f"Error in symptom checker: {str(e)}"
 
-def drug_interaction_checker_tool(medicines: str) -> str:
+def user_medicine_names(user_id) -> list:
+    """Names of the user's active medicines, read with a session of our own (tools may run on worker threads)"""
+    db = SessionLocal()
     try:
-        response = aiml_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a pharmacology expert. Analyze drug interactions."},
-                {"role": "user", "content": f"Check interactions for: {medicines}"}
-            ],
-            temperature=0.3,
-            max_tokens=512
-        )
-        return "Drug Interaction Analysis:\n\n" + response.choices[0].message.content
+        rows = db.query(Medicine.name).filter(
+            Medicine.user_id == int(user_id),
+            Medicine.status == "active"
+        ).all()
+        return [row.name for row in rows]
+    finally:
+        db.close()
+
+def analyze_drug_pairs(pairs) -> dict:
+    """Ask the LLM about all ``pairs`` in one call and cache each answered pair"""
+    response = metered_completion(
+        aiml_client, "check_drug_interactions",
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "You are a pharmacology expert. Analyze drug interactions."},
+            {"role": "user", "content": drug_interactions.build_batch_prompt(pairs)}
+        ],
+        temperature=0.3,
+        max_tokens=min(256 + 160 * len(pairs), 4096),
+        timeout=request_timeout(settings.AGENT_LLM_TIMEOUT_SECONDS)
+    )
+    results = drug_interactions.parse_batch_response(response.choices[0].message.content, pairs)
+    for pair, result in results.items():
+        ttl = DRUG_INTERACTION_UNKNOWN_TTL_SECONDS if result["severity"] == "unknown" else DRUG_INTERACTION_TTL_SECONDS
+        tool_cache.set("drug_interaction", drug_interactions.pair_key(pair), result, ttl)
+    return results
+
+def drug_interaction_checker_tool(medicines: str = "") -> str:
+    """
+    Check every pair in the list. Pairs analyzed before come from the tool
+    cache; only unseen pairs go to the LLM, in a single batched call. A blank
+    list or "my medicines" checks the user's saved medicines.
+    """
+    try:
+        if drug_interactions.refers_to_own_medicines(medicines):
+            context = _agent_context.get()
+            if context is None:
+                return "Please list the medicines to check."
+            names = drug_interactions.split_medicine_list(", ".join(user_medicine_names(context.user_id)))
+        else:
+            names = drug_interactions.split_medicine_list(medicines)
+
+        if len(names) < 2:
+            return "Drug Interaction Analysis:\n\nAt least two different medicines are needed to check interactions."
+
+        results = {}
+        unseen = []
+        for pair in drug_interactions.canonical_pairs(names):
+            cached = tool_cache.get("drug_interaction", drug_interactions.pair_key(pair))
+            if cached is not None:
+                results[pair] = cached
+            else:
+                unseen.append(pair)
+
+        note_cache_hit(not unseen)
+        if unseen:
+            results.update(analyze_drug_pairs(unseen))
+        return drug_interactions.format_report(names, results)
     except Exception as e:
         return f"Error checking interactions: {str(e)}"
 
@@ -361,13 +523,10 @@ def medicine_information_tool(medicine_name: str) -> str:
     try:
         if not SERPAPI_API_KEY:
             return "**Medicine information search not available** - API key not set."
-        params = {
+        data = serpapi_search("medicine_information", {
             "engine": "google",
-            "q": f"{medicine_name} uses side effects contraindications",
-            "api_key": SERPAPI_API_KEY
-        }
-        response = requests.get("https://serpapi.com/search", params=params)
-        data = response.json()
+            "q": f"{medicine_name} uses side effects contraindications"
+        })
         if "organic_results" in data:
             results = data["organic_results"][:3]
             info = f"**Information on {medicine_name}:**\n\n"
@@ -376,7 +535,7 @@ def medicine_information_tool(medicine_name: str) -> str:
                 snippet = result.get("snippet", "N/A")
                 link = result.get("link", "N/A")
                 info += f"- **{title}**\n  {snippet}\n  *Link:* {link}\n\n"
-            return info
+            return info + stale_note(data)
         else:
             return "**No information found.**"
     except Exception as e:
@@ -386,13 +545,10 @@ def emergency_services_tool(location: str) -> str:
     try:
         if not SERPAPI_API_KEY:
             return "**Emergency services search not available** - API key not set."
-        params = {
+        data = serpapi_search("emergency_services", {
             "engine": "google",
-            "q": f"emergency services near {location}",
-            "api_key": SERPAPI_API_KEY
-        }
-        response = requests.get("https://serpapi.com/search", params=params)
-        data = response.json()
+            "q": f"emergency services near {location}"
+        })
         if "local_results" in data and "places" in data["local_results"]:
             results = data["local_results"]["places"][:5]
             emergency_info = f"**Emergency Services near {location}:**\n\n"
@@ -401,24 +557,29 @@ def emergency_services_tool(location: str) -> str:
                 address = result.get("address", "N/A")
                 phone = result.get("phone", "N/A")
                 emergency_info += f"- **{title}**\n  *Address:* {address}\n  *Phone:* {phone}\n\n"
-            return emergency_info
+            return emergency_info + stale_note(data)
         else:
             return "**No emergency services found.**"
     except Exception as e:
         return f"**Error finding emergency services:** {str(e)}"
 
 def nutrition_advisor_tool(query: str) -> str:
-    try:
-        response = aiml_client.chat.completions.create(
+    def ask():
+        response = metered_completion(
+            aiml_client, "nutrition_advisor",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a nutrition expert. Provide balanced, healthy advice. Remind users to consult professionals."},
                 {"role": "user", "content": query}
             ],
             temperature=0.7,
-            max_tokens=512
+            max_tokens=512,
+            timeout=request_timeout(settings.AGENT_LLM_TIMEOUT_SECONDS)
         )
         return response.choices[0].message.content
+
+    try:
+        return cached_advice("nutrition_advisor", query, ask)
     except Exception as e:
         return f"Error getting nutrition advice: {str(e)}"
 
@@ -426,13 +587,10 @@ def vaccine_information_tool(vaccine_name: str) -> str:
     try:
         if not SERPAPI_API_KEY:
             return "**Vaccine information search not available** - API key not set."
-        params = {
+        data = serpapi_search("vaccine_information", {
             "engine": "google",
-            "q": f"{vaccine_name} vaccine information schedule side effects",
-            "api_key": SERPAPI_API_KEY
-        }
-        response = requests.get("https://serpapi.com/search", params=params)
-        data = response.json()
+            "q": f"{vaccine_name} vaccine information schedule side effects"
+        })
         if "organic_results" in data:
             results = data["organic_results"][:3]
             info = f"**Information on {vaccine_name} vaccine:**\n\n"
@@ -441,7 +599,7 @@ def vaccine_information_tool(vaccine_name: str) -> str:
                 snippet = result.get("snippet", "N/A")
                 link = result.get("link", "N/A")
                 info += f"- **{title}**\n  {snippet}\n  *Link:* {link}\n\n"
-            return info
+            return info + stale_note(data)
         else:
             return "**No vaccine information found.**"
     except Exception as e:
@@ -452,65 +610,95 @@ class AgentState(TypedDict):
     messages: Annotated[Sequence[HumanMessage], operator.add]
     user_id: str
     db_instance: MedicineDatabase
-    tools: list # Add tools to AgentState
+    deadline: Optional[Deadline]
 
-def call_agent(state: AgentState):
-    llm = ChatOpenAI(
-        model="gpt-4o",
-        temperature=0.7,
-        openai_api_key=AIMLAPI_KEY,
-        openai_api_base="https://api.aimlapi.com/v1"
-    ).bind_tools(state["tools"])
+class AgentContext:
+    """Per-request values the shared tools need (the user's DB session and id, the request deadline)"""
+    def __init__(self, db_instance: MedicineDatabase, user_id: str, deadline: Optional[Deadline] = None):
+        self.db_instance = db_instance
+        self.user_id = user_id
+        self.deadline = deadline
 
-    system_message = SystemMessage(content="""You are a medical assistant. For medicine queries (like 'panadol', 'aspirin'), call all relevant tools: medicine_pricing, find_pharmacies, find_doctors, find_hospitals, find_telemedicine_services, medicine_information. For other queries, call appropriate tools. Always provide comprehensive information.""")
+_agent_context: ContextVar[Optional[AgentContext]] = ContextVar("agent_context", default=None)
 
-    messages = [system_message] + list(state["messages"])
-    response = llm.invoke(messages)
+def current_agent_context() -> AgentContext:
+    context = _agent_context.get()
+    if context is None:
+        raise RuntimeError("Medicine tools called outside of an agent request")
+    return context
 
-    if response.tool_calls:
-        tool_results = []
-        for tool_call in response.tool_calls:
-            tool_name = tool_call["name"]
-            tool_args = tool_call["args"]
-            tool = next((t for t in state["tools"] if t.name == tool_name), None)
-            if tool:
-                try:
-                    # For tools where db_instance and user_id are bound via lambda,
-                    # if tool_args is empty, invoke without arguments. Otherwise, pass tool_args.
-                    if tool_name in ["add_medicine", "show_all_medicines", "update_medicine", "delete_medicine"]:
-                        if not tool_args: # Check if tool_args is empty
-                            result = tool.invoke()
-                        else:
-                            result = tool.invoke(tool_args) # Pass tool_args if not empty
-                    else:
-                        result = tool.invoke(tool_args)
-                    tool_results.append(f"{tool_name} result: {result}")
-                except Exception as e:
-                    tool_results.append(f"Error in {tool_name}: {str(e)}")
-            else:
-                tool_results.append(f"Tool {tool_name} not found.")
-        output = "\n".join(tool_results)
-    else:
-        output = response.content
+@contextmanager
+def use_agent_context(db_instance: MedicineDatabase, user_id: str, deadline: Optional[Deadline] = None):
+    token = _agent_context.set(AgentContext(db_instance, user_id, deadline))
+    try:
+        yield
+    finally:
+        _agent_context.reset(token)
 
-    return {"messages": [AIMessage(content=output)]}
+def request_timeout(timeout: float) -> float:
+    """``timeout`` capped to what is left of the current request's deadline, if it has one"""
+    context = _agent_context.get()
+    if context is None or context.deadline is None:
+        return timeout
+    return context.deadline.cap(timeout)
 
-def should_continue(state: AgentState):
-    return END
-
-def get_agent_graph(db_session: Session, user_id: str):
+def create_agent_state(db_session: Session, user_id, content, history: Sequence = (), deadline: Optional[Deadline] = None) -> AgentState:
     """
-    Initializes and returns the LangGraph agent with the given SQLAlchemy db session and user_id.
+    Build the initial state for one request; the graph, tools and LLM are shared.
+    ``history`` holds earlier conversation messages placed before the new one.
+    ``deadline`` bounds the whole turn; None (background work) means no limit.
     """
-    # Initialize MedicineDatabase with the SQLAlchemy session
-    mongo_db_instance = MedicineDatabase(db_session=db_session)
-
-    # Define tools with the specific db_instance
-    tools = [
-        StructuredTool.from_function(lambda name, dosage, time: add_medicine_tool(mongo_db_instance, name, dosage, time, user_id), name="add_medicine", description="Add medicine. Args: name, dosage, time"),
-        Tool(name="show_all_medicines", func=lambda *args, **kwargs: show_all_medicines_tool(mongo_db_instance, user_id), description="Show all medicines."),
-        StructuredTool.from_function(lambda medicine_id, name=None, dosage=None, time=None: update_medicine_tool(mongo_db_instance, medicine_id, user_id, name, dosage, time), name="update_medicine", description="Update medicine. Args: medicine_id, name (optional), dosage (optional), time (optional)"),
-        StructuredTool.from_function(lambda medicine_id: delete_medicine_tool(mongo_db_instance, medicine_id, user_id), name="delete_medicine", description="Delete medicine. Args: medicine_id"),
+    return AgentState(
+        messages=[*history, HumanMessage(content=content)],
+        user_id=str(user_id),
+        db_instance=MedicineDatabase(db_session=db_session),
+        deadline=deadline
+    )
+
+# Medicine CRUD tools read the user and DB session from the request context
+def _add_medicine(name: str, dosage: str, time: str) -> str:
+    context = current_agent_context()
+    return add_medicine_tool(context.db_instance, name, dosage, time, context.user_id)
+
+def _show_all_medicines() -> str:
+    context = current_agent_context()
+    return show_all_medicines_tool(context.db_instance, context.user_id)
+
+def _update_medicine(medicine_id: str, name: Optional[str] = None, dosage: Optional[str] = None, time: Optional[str] = None) -> str:
+    context = current_agent_context()
+    return update_medicine_tool(context.db_instance, medicine_id, context.user_id, name, dosage, time)
+
+def _delete_medicine(medicine_id: str) -> str:
+    context = current_agent_context()
+    return delete_medicine_tool(context.db_instance, medicine_id, context.user_id)
+
+def execute_intent(intent: Intent, db_instance: MedicineDatabase, user_id: str) -> str:
+    """Run a locally routed medicine command with the same tool functions the agent uses"""
+    slots = intent.slots
+    if intent.name == "show_all_medicines":
+        return show_all_medicines_tool(db_instance, user_id)
+    if intent.name == "delete_medicine":
+        return delete_medicine_tool(db_instance, slots["medicine_id"], user_id)
+    if intent.name == "add_medicine":
+        return add_medicine_tool(db_instance, slots["name"], slots["dosage"], slots["time"], user_id)
+    if intent.name == "update_medicine":
+        return update_medicine_tool(db_instance, slots["medicine_id"], user_id, dosage=slots.get("dosage"), time=slots.get("time"))
+    raise ValueError(f"Unknown intent {intent.name}")
+
+def answer_locally(db_session: Session, user_id, content) -> Optional[str]:
+    """Answer a deterministic medicine command without the LLM, or return None to use the agent"""
+    intent = confident_intent(content)
+    if intent is None:
+        return None
+    logger.info(f"Routed '{intent.name}' locally for user {user_id}")
+    return execute_intent(intent, MedicineDatabase(db_session=db_session), str(user_id))
+
+def build_tools():
+    return [
+        StructuredTool.from_function(_add_medicine, name="add_medicine", description="Add medicine. Args: name, dosage, time"),
+        StructuredTool.from_function(_show_all_medicines, name="show_all_medicines", description="Show all medicines."),
+        StructuredTool.from_function(_update_medicine, name="update_medicine", description="Update medicine. Args: medicine_id, name (optional), dosage (optional), time (optional)"),
+        StructuredTool.from_function(_delete_medicine, name="delete_medicine", description="Delete medicine. Args: medicine_id"),
         StructuredTool.from_function(health_advisor_tool, name="health_advisor", description="Get health advice. Args: query"),
         StructuredTool.from_function(medicine_pricing_tool, name="medicine_pricing", description="Search medicine prices. Args: query"),
         StructuredTool.from_function(find_nearby_pharmacies_tool, name="find_pharmacies", description="Find pharmacies. Args: location"),
@@ -518,23 +706,296 @@ def get_agent_graph(db_session: Session, user_id: str):
         StructuredTool.from_function(find_hospitals_tool, name="find_hospitals", description="Find hospitals. Args: location"),
         StructuredTool.from_function(find_telemedicine_services_tool, name="find_telemedicine_services", description="Find telemedicine services"),
         StructuredTool.from_function(symptom_checker_tool, name="symptom_checker", description="Check symptoms. Args: symptoms, duration, severity"),
-        StructuredTool.from_function(drug_interaction_checker_tool, name="check_drug_interactions", description="Check drug interactions. Args: medicines"),
+        StructuredTool.from_function(drug_interaction_checker_tool, name="check_drug_interactions", description="Check drug interactions between medicines. Args: medicines (comma-separated; leave empty or say 'my medicines' to check the user's saved medicines)"),
         StructuredTool.from_function(medicine_information_tool, name="medicine_information", description="Get detailed information on a medicine. Args: medicine_name"),
         StructuredTool.from_function(emergency_services_tool, name="emergency_services", description="Find emergency services. Args: location"),
         StructuredTool.from_function(nutrition_advisor_tool, name="nutrition_advisor", description="Get nutrition advice. Args: query"),
         StructuredTool.from_function(vaccine_information_tool, name="vaccine_information", description="Get vaccine information. Args: vaccine_name"),
     ]
 
+AGENT_MODEL = "gpt-4o"
+
+def build_llm(tools):
+    return ChatOpenAI(
+        model=AGENT_MODEL,
+        temperature=0.7,
+        openai_api_key=AIMLAPI_KEY,
+        openai_api_base=AIMLAPI_BASE_URL,
+        stream_usage=True  # token counts for streamed turns, for metering
+    ).bind_tools(tools)
+
+SYSTEM_MESSAGE = SystemMessage(content="""You are a medical assistant. For medicine queries (like 'panadol', 'aspirin'), call all relevant tools: medicine_pricing, find_pharmacies, find_doctors, find_hospitals, find_telemedicine_services, medicine_information. For other queries, call appropriate tools. Always provide comprehensive information.""")
+
+# Tools that use the request's SQLAlchemy session; a Session is not thread-safe,
+# so these run one after another on the calling thread.
+SERIAL_TOOLS = {"add_medicine", "show_all_medicines", "update_medicine", "delete_medicine"}
+
+TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=settings.AGENT_TOOL_WORKERS, thread_name_prefix="agent-tool")
+
+def invoke_tool(tool_call) -> str:
+    tool_name = tool_call["name"]
+    tool = AGENT_TOOLS_BY_NAME.get(tool_name)
+    if not tool:
+        return f"Tool {tool_name} not found."
+    with meter("tool", tool_name) as call:
+        try:
+            result = tool.invoke(tool_call["args"] or {})
+        except Exception as e:
+            call.error = f"{type(e).__name__}: {str(e)}"
+            return f"Error in {tool_name}: {str(e)}"
+        # Tools report their own failures as text rather than raising
+        if isinstance(result, str) and result.lstrip("*").startswith("Error"):
+            call.error = result[:500]
+        return f"{tool_name} result: {result}"
+
+def invoke_tool_in_context(context: AgentContext, tool_call) -> str:
+    with use_agent_context(context.db_instance, context.user_id, context.deadline), metered_user(context.user_id):
+        return invoke_tool(tool_call)
+
+def iter_tool_calls(tool_calls, context: AgentContext, concurrency: int = None, timeout: float = None):
+    """
+    Run a response's tool calls concurrently, yielding (index, output) as each finishes.
+
+    At most ``concurrency`` calls are in flight at once. A call that runs longer
+    than ``timeout`` seconds, or past the request deadline, is reported as timed
+    out and the rest still return. Calls that would start with less than
+    AGENT_MIN_TOOL_SECONDS of the deadline left are skipped.
+    """
+    concurrency = max(concurrency or settings.AGENT_TOOL_CONCURRENCY, 1)
+    timeout = timeout or settings.AGENT_TOOL_TIMEOUT_SECONDS
+    request_deadline = context.deadline
+
+    pending = [i for i, call in enumerate(tool_calls) if call["name"] not in SERIAL_TOOLS]
+    in_flight = {}
+    skipped = []
+
+    def submit_next():
+        while pending and len(in_flight) < concurrency:
+            i = pending.pop(0)
+            budget = timeout
+            if request_deadline is not None:
+                budget = min(timeout, request_deadline.remaining())
+                if budget < settings.AGENT_MIN_TOOL_SECONDS:
+                    request_deadline.skip(tool_calls[i]["name"])
+                    skipped.append(i)
+                    continue
+            future = TOOL_EXECUTOR.submit(invoke_tool_in_context, context, tool_calls[i])
+            in_flight[future] = (i, time.monotonic() + budget)
+
+    submit_next()
+
+    # DB tools run here while the network-bound tools are in flight. They are
+    # local and quick, so they run even when the deadline is close.
+    for i, call in enumerate(tool_calls):
+        if call["name"] in SERIAL_TOOLS:
+            yield i, invoke_tool_in_context(context, call)
+
+    while in_flight or skipped:
+        for i in skipped:
+            yield i, f"{tool_calls[i]['name']} skipped; not enough time left to run it."
+        skipped.clear()
+        if not in_flight:
+            submit_next()
+            continue
+
+        now = time.monotonic()
+        next_deadline = min(deadline for _, deadline in in_flight.values())
+        done, _ = wait(list(in_flight), timeout=max(next_deadline - now, 0), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            i, _ = in_flight.pop(future)
+            yield i, future.result()
+
+        now = time.monotonic()
+        for future, (i, deadline) in list(in_flight.items()):
+            if deadline <= now:
+                future.cancel()
+                del in_flight[future]
+                if request_deadline is not None and request_deadline.expired():
+                    request_deadline.skip(tool_calls[i]["name"])
+                    yield i, f"{tool_calls[i]['name']} cut short by the request deadline; no result."
+                else:
+                    yield i, f"{tool_calls[i]['name']} timed out after {timeout:.0f}s; no result."
+
+        submit_next()
+
+def run_tool_calls(tool_calls, context: AgentContext, concurrency: int = None, timeout: float = None) -> list:
+    """Run a response's tool calls concurrently and return their outputs in call order"""
+    results = [None] * len(tool_calls)
+    for i, output in iter_tool_calls(tool_calls, context, concurrency, timeout):
+        results[i] = output
+    return results
+
+OUT_OF_TIME_ANSWER = "I couldn't finish looking into this in time. Please try again in a moment."
+CUT_SHORT_NOTE = "\n\n*This answer was cut short to reply in time.*"
+
+def deadline_note(deadline: Optional[Deadline]) -> str:
+    """Footnote naming the tools the deadline made us skip, if any"""
+    if deadline is None or not deadline.skipped:
+        return ""
+    return f"\n\n*To reply in time, this answer leaves out: {', '.join(deadline.skipped)}.*"
+
+def agent_llm_kwargs(deadline: Optional[Deadline]) -> Optional[dict]:
+    """Request options for the agent LLM call, or None when the deadline leaves too little time for it"""
+    if deadline is None:
+        return {}
+    if deadline.remaining() < settings.AGENT_MIN_LLM_SECONDS:
+        deadline.skip("call_agent")
+        return None
+    return {"timeout": deadline.remaining()}
+
+def call_agent(state: AgentState):
+    messages = [SYSTEM_MESSAGE] + list(state["messages"])
+    deadline = state.get("deadline")
+    llm_kwargs = agent_llm_kwargs(deadline)
+    if llm_kwargs is None:
+        return {"messages": [AIMessage(content=OUT_OF_TIME_ANSWER)]}
+
+    try:
+        with meter("llm", "call_agent", AGENT_MODEL, user_id=state["user_id"]) as call:
+            # The client retries timed-out requests, so the deadline is also enforced around the call
+            response = call_with_deadline(TOOL_EXECUTOR, deadline, AGENT_LLM.invoke, messages, **llm_kwargs)
+            call.set_usage(response)
+    except DeadlineExceeded:
+        deadline.skip("call_agent")
+        return {"messages": [AIMessage(content=OUT_OF_TIME_ANSWER)]}
+
+    if response.tool_calls:
+        context = AgentContext(state["db_instance"], state["user_id"], deadline)
+        output = "\n".join(run_tool_calls(response.tool_calls, context)) + deadline_note(deadline)
+    else:
+        output = response.content
+
+    return {"messages": [AIMessage(content=output)]}
+
+def stream_agent(state: AgentState):
+    """
+    Streaming counterpart of call_agent. Yields events as they happen:
+    ``token`` (LLM text deltas), ``tool_start``, ``tool_result`` and a final
+    ``done`` carrying the full response text. When the state's deadline runs
+    out mid-answer, ``done`` carries the text streamed so far with a note.
+    """
+    messages = [SYSTEM_MESSAGE] + list(state["messages"])
+    deadline = state.get("deadline")
+    llm_kwargs = agent_llm_kwargs(deadline)
+    if llm_kwargs is None:
+        yield {"event": "done", "data": {"response": OUT_OF_TIME_ANSWER}}
+        return
+
+    gathered = None
+    cut_short = False
+    # Timed by hand: a generator may resume in a different context, so ``meter`` can't stay open across yields
+    started = time.perf_counter()
+    try:
+        for chunk in AGENT_LLM.stream(messages, **llm_kwargs):
+            gathered = chunk if gathered is None else gathered + chunk
+            if chunk.content:
+                yield {"event": "token", "data": {"text": chunk.content}}
+            if deadline is not None and deadline.expired():
+                cut_short = True
+                break
+    except Exception as e:
+        error = f"{type(e).__name__}: {str(e)}"
+        record_call("llm", "call_agent", (time.perf_counter() - started) * 1000, AGENT_MODEL, state["user_id"], gathered, error)
+        # A read timeout at the deadline ends the answer early instead of failing it
+        if deadline is None or not deadline.expired():
+            raise
+        cut_short = True
+    else:
+        record_call("llm", "call_agent", (time.perf_counter() - started) * 1000, AGENT_MODEL, state["user_id"], gathered)
+
+    if cut_short:
+        # Tool calls may be incomplete mid-stream; keep only the text streamed so far
+        deadline.skip("call_agent")
+        partial = gathered.content if gathered is not None else ""
+        yield {"event": "done", "data": {"response": partial + CUT_SHORT_NOTE if partial else OUT_OF_TIME_ANSWER}}
+        return
+
+    tool_calls = gathered.tool_calls if gathered is not None else []
+    if tool_calls:
+        for i, tool_call in enumerate(tool_calls):
+            yield {"event": "tool_start", "data": {"index": i, "name": tool_call["name"], "args": tool_call["args"]}}
+
+        context = AgentContext(state["db_instance"], state["user_id"], deadline)
+        results = [None] * len(tool_calls)
+        for i, result in iter_tool_calls(tool_calls, context):
+            results[i] = result
+            yield {"event": "tool_result", "data": {"index": i, "name": tool_calls[i]["name"], "output": result}}
+        output = "\n".join(results) + deadline_note(deadline)
+    else:
+        output = gathered.content if gathered is not None else ""
+
+    yield {"event": "done", "data": {"response": output}}
+
+def should_continue(state: AgentState):
+    return END
+
+def build_agent_graph():
     graph = StateGraph(AgentState)
     graph.add_node("agent", call_agent)
     graph.set_entry_point("agent")
     graph.add_edge("agent", END)
+    return graph.compile()
 
-    compiled_graph = graph.compile()
-    return compiled_graph, tools # Return tools along with the graph
+# Built once at import; requests only create an AgentState
+AGENT_TOOLS = build_tools()
+AGENT_TOOLS_BY_NAME = {tool.name: tool for tool in AGENT_TOOLS}
+AGENT_LLM = build_llm(AGENT_TOOLS)
+agent_graph = build_agent_graph()
 
 # ============= IMAGE PROCESSING =============
-def process_prescription_image(image_bytes, filename: str = None):
+# Extraction results of prescriptions a user uploaded before, in the tool cache
+# under "prescription" and keyed by user and exact image content
+PRESCRIPTION_CACHE_TTL_SECONDS = float(os.getenv("PRESCRIPTION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+def prescription_cache_key(user_id, digest: str) -> str:
+    return f"{user_id}:{digest}"
+
+def parse_prescription_response(content: str) -> dict:
+    import re
+
+    # Try to extract JSON from the response
+    json_match = re.search(r'\{.*\}', content, re.DOTALL)
+    if json_match:
+        json_str = json_match.group(0)
+        try:
+            result = json.loads(json_str)
+            return {"status": "success", **result}
+        except json.JSONDecodeError:
+            # Try to fix common JSON issues
+            json_str = re.sub(r',\s*\}', '}', json_str)  # Remove trailing commas
+            json_str = re.sub(r',\s*\]', ']', json_str)
+            try:
+                result = json.loads(json_str)
+                return {"status": "success", **result}
+            except json.JSONDecodeError:
+                pass
+
+    # If JSON parsing fails, extract medicine names manually
+    medicine_names = medicine_lexicon.generics_in(content)
+
+    if medicine_names:
+        medicines = [{"name": text.title(), "dosage": "Not specified", "instructions": "Consult prescription"} for text, _ in medicine_names]
+        return {"status": "success", "medicines": medicines}
+
+    return {"status": "error", "message": "Could not extract medicines from image.", "raw": content}
+
+PRESCRIPTION_MODEL = "gpt-4o"
+
+def process_prescription_image(image_bytes, filename: str = None, user_id=None):
+    """
+    Extract medicines from a prescription photo. The image is downsized and
+    recompressed before the vision call. With ``user_id``, an identical image
+    the same user uploaded before is answered from the cache; results are
+    never shared between users.
+    """
+    with meter("llm", "process_prescription_image", PRESCRIPTION_MODEL) as call:
+        result = extract_prescription(image_bytes, filename, user_id)
+        if result.get("status") == "error":
+            call.error = result.get("message")
+        return result
+
+def extract_prescription(image_bytes, filename: str = None, user_id=None):
     try:
         if not AIMLAPI_KEY:
             return {"status": "error", "message": "AIMLAPI_KEY not set."}
@@ -547,49 +1008,37 @@ def process_prescription_image(image_bytes, filename: str = None):
                 "analysis": "This is a diagnostic image (X-ray, MRI, etc.). Automated medicine extraction not supported. Consult a doctor.",
             }
 
+        prepared = prepare_image(image_bytes)
+        cache_key = prescription_cache_key(user_id, prepared.digest) if user_id is not None else None
+        if cache_key is not None:
+            cached = tool_cache.get("prescription", cache_key)
+            if cached is not None:
+                logger.info(f"Prescription served from cache for user {user_id}")
+                note_cache_hit(True)
+                return {**cached, "cached": True}
+            note_cache_hit(False)
+
         import base64
-        encoded_image = base64.b64encode(image_bytes).decode("utf-8")
+        encoded_image = base64.b64encode(prepared.data).decode("utf-8")
 
         response = aiml_client.chat.completions.create(
-            model="gpt-4o",
+            model=PRESCRIPTION_MODEL,
             messages=[
                 {"role": "system", "content": "Extract medicine names, dosages, and instructions from prescription. Respond ONLY with valid JSON in this format: {\"medicines\": [{\"name\": \"medicine_name\", \"dosage\": \"dosage\", \"instructions\": \"instructions\"}]} "},
                 {"role": "user", "content": [
                     {"type": "text", "text": "Analyze this prescription image and extract all medicines."},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}
+                    {"type": "image_url", "image_url": {"url": f"data:{prepared.mime_type};base64,{encoded_image}"}}
                 ]}
             ],
-            max_tokens=512
+            max_tokens=512,
+            timeout=request_timeout(settings.AGENT_LLM_TIMEOUT_SECONDS)
         )
+        note_usage(response)
 
-        content = response.choices[0].message.content.strip()
-        import json, re
-
-        # Try to extract JSON from the response
-        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
-            try:
-                result = json.loads(json_str)
-                return {"status": "success", **result}
-            except json.JSONDecodeError:
-                # Try to fix common JSON issues
-                json_str = re.sub(r',\s*\}', '}', json_str)  # Remove trailing commas
-                json_str = re.sub(r',\s*\]', ']', json_str)
-                try:
-                    result = json.loads(json_str)
-                    return {"status": "success", **result}
-                except json.JSONDecodeError:
-                    pass
-
-        # If JSON parsing fails, extract medicine names manually
-        medicine_names = re.findall(r'\b(?:panadol|aspirin|ibuprofen|paracetamol|amoxicillin|azithromycin|omeprazole|metformin|lisinopril|atorvastatin|simvastatin|levothyroxine|albuterol|prednisone|warfarin|clopidogrel|insulin|hydrochlorothiazide|furosemide|gabapentin|sertraline|citalopram|fluoxetine|escitalopram|tramadol|oxycodone|morphine|codeine|diazepam|lorazepam|alprazolam|zopiclone|zolpidem|amlodipine|atenolol|bisoprolol|carvedilol|enalapril|ramipril|losartan|candesartan|valsartan|amlodipine|felodipine|nicardipine|diltiazem|verapamil|digoxin|amiodarone|propafenone|flecainide|sotalol|procainamide|quinidine|warfarin|heparin|enoxaparin|dalteparin|fondaparinux|aspirin|clopidogrel|ticagrelor|prasugrel|abciximab|eptifibatide|tirofiban|streptokinase|alteplase|tenecteplase|reteplase|urokinase)\b', content.lower())
-
-        if medicine_names:
-            medicines = [{"name": name.title(), "dosage": "Not specified", "instructions": "Consult prescription"} for name in set(medicine_names)]
-            return {"status": "success", "medicines": medicines}
-
-        return {"status": "error", "message": "Could not extract medicines from image.", "raw": content}
+        result = parse_prescription_response(response.choices[0].message.content.strip())
+        if result["status"] == "success" and cache_key is not None:
+            tool_cache.set("prescription", cache_key, result, PRESCRIPTION_CACHE_TTL_SECONDS)
+        return result
 
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -622,4 +1071,4 @@ def text_to_speech_tool(text: str) -> str:
         return f"Error in text-to-speech: {str(e)}"
 
 # Export
-__all__ = ['get_agent_graph', 'process_prescription_image', 'speech_to_text_tool', 'text_to_speech_tool']
+__all__ = ['agent_graph', 'create_agent_state', 'stream_agent', 'answer_locally', 'process_prescription_image', 'speech_to_text_tool', 'text_to_speech_tool']
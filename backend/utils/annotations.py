@@ -0,0 +1,164 @@
+"""
+Compact storage and on-demand rendering of YOLO analysis results.
+
+Analyses persist only the raw model output (boxes, classes, confidences and
+run-length encoded masks). Annotated images are drawn from that data when
+they are first requested instead of on every inference call.
+"""
+import cv2
+import numpy as np
+
+MASK_THRESHOLD = 0.5
+DEFAULT_OPACITY = 0.5
+# Render parameters are snapped to these, so an analysis has a small, fixed set of variants
+RENDER_SIZES = (256, 512, 1024, 2048)
+OPACITY_STEP = 0.25
+
+# Ultralytics default palette (hex, RGB order)
+PALETTE_HEX = (
+    "FF3838", "FF9D97", "FF701F", "FFB21D", "CFD231", "48F90A", "92CC17", "3DDB86", "1A9334", "00D4BB",
+    "2C99A8", "00C2FF", "344593", "6473FF", "0018EC", "8438FF", "520085", "CB38FF", "FF95C8", "FF37C7",
+)
+
+
+def class_color(class_id: int):
+    """Return a stable BGR color for a class index"""
+    hex_color = PALETTE_HEX[int(class_id) % len(PALETTE_HEX)]
+    r, g, b = (int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+    return (b, g, r)
+
+
+def encode_rle(mask: np.ndarray) -> dict:
+    """Run-length encode a binary mask (row-major, counts start with a run of zeros)"""
+    flat = np.asarray(mask, dtype=np.uint8).ravel()
+    if flat.size == 0:
+        return {"size": [int(mask.shape[0]), int(mask.shape[1])], "counts": []}
+    change_points = np.flatnonzero(np.diff(flat)) + 1
+    boundaries = np.concatenate(([0], change_points, [flat.size]))
+    counts = np.diff(boundaries).tolist()
+    if flat[0] == 1:
+        counts = [0] + counts
+    return {"size": [int(mask.shape[0]), int(mask.shape[1])], "counts": [int(c) for c in counts]}
+
+
+def decode_rle(rle: dict) -> np.ndarray:
+    """Decode a mask produced by encode_rle"""
+    height, width = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.zeros(len(counts), dtype=np.uint8)
+    values[1::2] = 1
+    return np.repeat(values, counts).reshape(height, width)
+
+
+def rle_area(rle: dict) -> int:
+    """Number of foreground pixels in an encoded mask"""
+    return int(sum(rle["counts"][1::2]))
+
+
+def extract_raw_results(result, class_names) -> dict:
+    """Convert an ultralytics Results object into a JSON-serializable dict"""
+    height, width = result.orig_shape[:2]
+    objects = []
+
+    if result.boxes is not None and len(result.boxes):
+        boxes = result.boxes.xyxy.cpu().numpy()
+        classes = result.boxes.cls.cpu().numpy().astype(int)
+        confidences = result.boxes.conf.cpu().numpy()
+        masks = None
+        if getattr(result, "masks", None) is not None:
+            masks = result.masks.data.cpu().numpy()
+
+        for i, (box, cls_idx, conf) in enumerate(zip(boxes, classes, confidences)):
+            obj = {
+                "class_id": int(cls_idx),
+                "class_name": class_names[int(cls_idx)],
+                "confidence": float(conf),
+                "box": [round(float(v), 1) for v in box],
+                "mask": None,
+            }
+            if masks is not None and i < len(masks):
+                obj["mask"] = encode_rle(masks[i] > MASK_THRESHOLD)
+            objects.append(obj)
+
+    return {
+        "image_size": [int(height), int(width)],
+        "has_masks": any(obj["mask"] is not None for obj in objects),
+        "objects": objects,
+    }
+
+
+def filter_objects(raw: dict, classes=None) -> list:
+    """Return the stored objects, optionally restricted to a set of class names"""
+    if not classes:
+        return list(raw["objects"])
+    wanted = {c.strip().lower() for c in classes}
+    return [obj for obj in raw["objects"] if obj["class_name"].lower() in wanted]
+
+
+def resize_mask(mask: np.ndarray, width: int, height: int) -> np.ndarray:
+    if mask.shape[0] == height and mask.shape[1] == width:
+        return mask
+    return cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+
+
+def render_detections(image_bgr: np.ndarray, objects: list, opacity: float = DEFAULT_OPACITY) -> np.ndarray:
+    """Draw masks, boxes and labels onto a BGR image"""
+    annotated = image_bgr.copy()
+    height, width = annotated.shape[:2]
+    line_width = max(round((height + width) / 2 * 0.003), 2)
+
+    for obj in objects:
+        if obj["mask"] is None:
+            continue
+        color = np.array(class_color(obj["class_id"]), dtype=np.float32)
+        mask = resize_mask(decode_rle(obj["mask"]), width, height).astype(bool)
+        annotated[mask] = (annotated[mask] * (1 - opacity) + color * opacity).astype(np.uint8)
+
+    for obj in objects:
+        color = class_color(obj["class_id"])
+        x1, y1, x2, y2 = (int(v) for v in obj["box"])
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, line_width, cv2.LINE_AA)
+
+        label = f"{obj['class_name']} {obj['confidence']:.2f}"
+        font_scale = line_width / 3
+        font_thickness = max(line_width - 1, 1)
+        text_w, text_h = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness)[0]
+        outside = y1 - text_h - 3 >= 0
+        label_y2 = y1 - text_h - 3 if outside else y1 + text_h + 3
+        cv2.rectangle(annotated, (x1, y1), (x1 + text_w, label_y2), color, -1, cv2.LINE_AA)
+        cv2.putText(
+            annotated,
+            label,
+            (x1, y1 - 2 if outside else y1 + text_h + 2),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            font_scale,
+            (255, 255, 255),
+            font_thickness,
+            cv2.LINE_AA
+        )
+
+    return annotated
+
+
+def snap_size(max_size: int = None):
+    """Smallest of RENDER_SIZES that holds ``max_size``; None (full size) above the largest"""
+    if not max_size:
+        return None
+    return next((size for size in RENDER_SIZES if size >= max_size), None)
+
+
+def snap_opacity(opacity: float = None):
+    if opacity is None:
+        return None
+    return round(opacity / OPACITY_STEP) * OPACITY_STEP
+
+
+def fit_to_size(image: np.ndarray, max_size: int = None) -> np.ndarray:
+    """Downscale an image so its longest side is at most max_size"""
+    if not max_size:
+        return image
+    height, width = image.shape[:2]
+    scale = max_size / max(height, width)
+    if scale >= 1:
+        return image
+    return cv2.resize(image, (max(int(width * scale), 1), max(int(height * scale), 1)), interpolation=cv2.INTER_AREA)
@@ -0,0 +1,132 @@
+"""
+Full-text search over a user's chat history.
+
+On SQLite, ``chat_history_fts`` is an FTS5 external-content table over
+``chat_history.message`` and ``chat_history.response``; triggers keep it in
+sync on insert, update and delete, so the search index never needs a
+separate write path. On PostgreSQL a stored ``tsvector`` column with a GIN
+index plays the same role. Other databases fall back to ``LIKE``.
+
+Results are newest first and paged with the same (created_at, id) cursors
+as ``/history``.
+"""
+import logging
+import re
+
+from sqlalchemy import DateTime, Integer, String, Text, bindparam, text
+from sqlalchemy.exc import DBAPIError
+
+from utils.pagination import decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND = "like"
+
+SQLITE_SETUP = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_fts USING fts5("
+    " message, response, content='chat_history', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS chat_history_fts_insert AFTER INSERT ON chat_history BEGIN"
+    " INSERT INTO chat_history_fts(rowid, message, response) VALUES (new.id, new.message, new.response);"
+    " END",
+    "CREATE TRIGGER IF NOT EXISTS chat_history_fts_delete AFTER DELETE ON chat_history BEGIN"
+    " INSERT INTO chat_history_fts(chat_history_fts, rowid, message, response) VALUES ('delete', old.id, old.message, old.response);"
+    " END",
+    "CREATE TRIGGER IF NOT EXISTS chat_history_fts_update AFTER UPDATE OF message, response ON chat_history BEGIN"
+    " INSERT INTO chat_history_fts(chat_history_fts, rowid, message, response) VALUES ('delete', old.id, old.message, old.response);"
+    " INSERT INTO chat_history_fts(rowid, message, response) VALUES (new.id, new.message, new.response);"
+    " END",
+]
+
+POSTGRES_SETUP = [
+    "ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS search_vector tsvector"
+    " GENERATED ALWAYS AS (to_tsvector('english', coalesce(message, '') || ' ' || coalesce(response, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_chat_history_search_vector ON chat_history USING GIN (search_vector)",
+]
+
+TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def setup_search(engine):
+    """Create the search index for the engine's dialect; existing history is indexed once"""
+    global SEARCH_BACKEND
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                indexed = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_history_fts'"
+                )).first()
+                for statement in SQLITE_SETUP:
+                    conn.execute(text(statement))
+                if not indexed:
+                    conn.execute(text("INSERT INTO chat_history_fts(chat_history_fts) VALUES ('rebuild')"))
+                SEARCH_BACKEND = "fts5"
+            elif dialect == "postgresql":
+                for statement in POSTGRES_SETUP:
+                    conn.execute(text(statement))
+                SEARCH_BACKEND = "tsvector"
+    except DBAPIError as e:
+        logger.warning(f"Full-text search unavailable, falling back to LIKE: {str(e)}")
+        SEARCH_BACKEND = "like"
+    logger.info(f"Chat history search backend: {SEARCH_BACKEND}")
+
+
+def fts5_query(query: str) -> str:
+    """Quote each term so user input is never parsed as FTS5 syntax; the last term matches as a prefix"""
+    terms = TERM_RE.findall(query)
+    if not terms:
+        return ""
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_history(db, user_id: int, query: str, limit: int = 20, cursor: str = None):
+    """Return (rows, next_cursor). Raises ValueError for a malformed cursor."""
+    params = {"user_id": user_id, "limit": limit + 1}
+    conditions = ["c.user_id = :user_id"]
+    if cursor:
+        params["cursor_created"], params["cursor_id"] = decode_cursor(cursor, int)
+        conditions.append("(c.created_at < :cursor_created OR (c.created_at = :cursor_created AND c.id < :cursor_id))")
+
+    if SEARCH_BACKEND == "fts5":
+        params["query"] = fts5_query(query)
+        if not params["query"]:
+            return [], None
+        sql = (
+            "SELECT c.id, c.message, c.response, c.message_type, c.created_at,"
+            " snippet(chat_history_fts, -1, '**', '**', '…', 16) AS snippet"
+            " FROM chat_history_fts JOIN chat_history c ON c.id = chat_history_fts.rowid"
+            f" WHERE chat_history_fts MATCH :query AND {' AND '.join(conditions)}"
+        )
+    elif SEARCH_BACKEND == "tsvector":
+        params["query"] = query
+        sql = (
+            "SELECT c.id, c.message, c.response, c.message_type, c.created_at,"
+            " ts_headline('english', c.message || ' ' || c.response, websearch_to_tsquery('english', :query),"
+            " 'StartSel=**, StopSel=**, MaxWords=24, MinWords=8') AS snippet"
+            " FROM chat_history c"
+            f" WHERE c.search_vector @@ websearch_to_tsquery('english', :query) AND {' AND '.join(conditions)}"
+        )
+    else:
+        params["pattern"] = f"%{query}%"
+        sql = (
+            "SELECT c.id, c.message, c.response, c.message_type, c.created_at, NULL AS snippet"
+            " FROM chat_history c"
+            f" WHERE (c.message LIKE :pattern OR c.response LIKE :pattern) AND {' AND '.join(conditions)}"
+        )
+
+    statement = text(sql + " ORDER BY c.created_at DESC, c.id DESC LIMIT :limit")
+    if cursor:
+        statement = statement.bindparams(bindparam("cursor_created", type_=DateTime()))
+    # Typed columns so created_at comes back as a datetime on every backend
+    statement = statement.columns(
+        id=Integer, message=Text, response=Text, message_type=String, created_at=DateTime, snippet=Text
+    )
+    rows = db.execute(statement, params).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return rows, next_cursor
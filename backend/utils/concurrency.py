@@ -0,0 +1,27 @@
+"""
+Bounded thread pool for blocking work started from async routes.
+
+The agent makes synchronous HTTP calls to the LLM and SerpAPI and commits
+through a synchronous SQLAlchemy session. Running that directly in an
+``async def`` route stalls the event loop; ``run_blocking`` moves it onto a
+fixed-size pool so the loop keeps serving other requests.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from config import settings
+
+BLOCKING_EXECUTOR = ThreadPoolExecutor(max_workers=settings.BLOCKING_WORKER_THREADS, thread_name_prefix="blocking")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` on the bounded pool and await its result"""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(copy_context().run, fn, *args, **kwargs)
+    return await loop.run_in_executor(BLOCKING_EXECUTOR, call)
+
+
+def shutdown_executor():
+    BLOCKING_EXECUTOR.shutdown(wait=True)
@@ -0,0 +1,182 @@
+"""
+Token-budgeted conversation context for the chat agent.
+
+Each request gets the user's rolling summary plus as many of the most recent
+ChatHistory turns as fit in CONTEXT_TOKEN_BUDGET, including turns still
+queued by the history writer. After turns are written, the
+turns that have fallen out of the recent window are folded into the summary
+in the background, in batches of at least CONTEXT_SUMMARY_MIN_TURNS, so the
+prompt stays bounded however long the conversation gets, no request waits
+for summarization, and the summarizer is not called on every turn.
+
+Token counts are estimated at ~4 characters per token; they only need to be
+good enough to keep the prompt size stable.
+"""
+import logging
+import threading
+
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import ChatHistory, ConversationSummary
+from utils.ai_agent import aiml_client
+from utils.concurrency import BLOCKING_EXECUTOR
+from utils.history_writer import history_writer, unsaved
+from utils.metering import metered_completion, metered_user
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+# Longest part of a single message passed to the summarizer
+SUMMARY_TURN_TOKENS = 400
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = max(tokens - MESSAGE_OVERHEAD_TOKENS, 0) * CHARS_PER_TOKEN
+    text = text or ""
+    return text if len(text) <= limit else text[:limit].rstrip() + " …"
+
+
+def turn_tokens(turn, per_turn_cap: int) -> int:
+    return min(estimate_tokens(turn.message), per_turn_cap) + min(estimate_tokens(turn.response), per_turn_cap)
+
+
+def recent_turns(db: Session, user_id: int, after_id: int, budget: int, max_turns: int, include_pending: bool = False) -> list:
+    """
+    Newest turns after ``after_id`` that fit in ``budget``, oldest first.
+    With ``include_pending``, turns not yet written (which have no id) count as the newest.
+    """
+    per_turn_cap = max(budget // 4, MESSAGE_OVERHEAD_TOKENS + 1)
+    pending = history_writer.pending_for(user_id) if include_pending else []
+    candidates = db.query(ChatHistory).filter(
+        ChatHistory.user_id == user_id,
+        ChatHistory.id > after_id
+    ).order_by(ChatHistory.id.desc()).limit(max_turns).all()
+    if pending:
+        candidates = (unsaved(pending, candidates)[::-1] + candidates)[:max_turns]
+
+    selected = []
+    used = 0
+    for turn in candidates:
+        cost = turn_tokens(turn, per_turn_cap)
+        if used + cost > budget:
+            break
+        selected.append(turn)
+        used += cost
+    return selected[::-1]
+
+
+def build_context_messages(db: Session, user_id: int, budget: int = None) -> list:
+    """Summary and recent turns as chat messages to put before the new user message"""
+    budget = budget or settings.CONTEXT_TOKEN_BUDGET
+    summary = db.query(ConversationSummary).filter(ConversationSummary.user_id == user_id).first()
+
+    messages = []
+    covered_until = 0
+    if summary and summary.summary:
+        summary_text = truncate_to_tokens(summary.summary, settings.CONTEXT_SUMMARY_MAX_TOKENS)
+        messages.append(SystemMessage(content=f"Summary of the earlier conversation with this user:\n{summary_text}"))
+        budget -= estimate_tokens(summary_text)
+        covered_until = summary.covered_until_id
+
+    per_turn_cap = max(budget // 4, MESSAGE_OVERHEAD_TOKENS + 1)
+    for turn in recent_turns(db, user_id, covered_until, budget, settings.CONTEXT_MAX_TURNS, include_pending=True):
+        messages.append(HumanMessage(content=truncate_to_tokens(turn.message, per_turn_cap)))
+        messages.append(AIMessage(content=truncate_to_tokens(turn.response, per_turn_cap)))
+    return messages
+
+
+def summarize(previous_summary: str, turns) -> str:
+    transcript = "\n".join(
+        f"User: {truncate_to_tokens(turn.message, SUMMARY_TURN_TOKENS)}\nAssistant: {truncate_to_tokens(turn.response, SUMMARY_TURN_TOKENS)}"
+        for turn in turns
+    )
+    response = metered_completion(
+        aiml_client, "conversation_summary",
+        model=settings.CONTEXT_SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": (
+                "You maintain a running summary of a conversation between a user and a medical assistant. "
+                "Merge the new turns into the existing summary. Keep facts that matter for later questions: "
+                "the user's medicines, conditions, symptoms, allergies, locations and open questions. "
+                f"Reply with the updated summary only, under {settings.CONTEXT_SUMMARY_MAX_TOKENS * 3 // 4} words."
+            )},
+            {"role": "user", "content": f"Existing summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"}
+        ],
+        temperature=0.2,
+        max_tokens=settings.CONTEXT_SUMMARY_MAX_TOKENS,
+        # Runs on the worker pool chat requests share; a hung call must not hold a thread
+        timeout=settings.CONTEXT_SUMMARY_TIMEOUT_SECONDS
+    )
+    return response.choices[0].message.content.strip()
+
+
+def refresh_summary(user_id: int):
+    """
+    Fold turns older than the recent window into the user's summary. The
+    window kept out of the summary is half the budget, so the next request
+    still finds its recent turns verbatim with room to grow. Nothing is
+    folded until CONTEXT_SUMMARY_MIN_TURNS turns, or the other half of the
+    budget, have built up beyond the window.
+    """
+    db = SessionLocal()
+    try:
+        summary = db.query(ConversationSummary).filter(ConversationSummary.user_id == user_id).first()
+        covered_until = summary.covered_until_id if summary else 0
+        keep = recent_turns(db, user_id, covered_until, settings.CONTEXT_TOKEN_BUDGET // 2, settings.CONTEXT_MAX_TURNS // 2)
+        keep_from = keep[0].id if keep else None
+
+        query = db.query(ChatHistory).filter(
+            ChatHistory.user_id == user_id,
+            ChatHistory.id > covered_until
+        )
+        if keep_from is not None:
+            query = query.filter(ChatHistory.id < keep_from)
+        # Bounded batch per refresh; a long backlog is folded over several turns
+        to_fold = query.order_by(ChatHistory.id).limit(settings.CONTEXT_MAX_TURNS).all()
+        backlog_tokens = sum(turn_tokens(turn, settings.CONTEXT_TOKEN_BUDGET // 4) for turn in to_fold)
+        if not to_fold:
+            return
+        if len(to_fold) < settings.CONTEXT_SUMMARY_MIN_TURNS and backlog_tokens < settings.CONTEXT_TOKEN_BUDGET // 2:
+            # Still fits verbatim next to the window; wait for a bigger batch
+            return
+
+        with metered_user(user_id):
+            updated = summarize(summary.summary if summary else "", to_fold)
+        if summary is None:
+            summary = ConversationSummary(user_id=user_id)
+            db.add(summary)
+        summary.summary = updated
+        summary.covered_until_id = to_fold[-1].id
+        db.commit()
+        logger.info(f"Folded {len(to_fold)} turns into the conversation summary of user {user_id}")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error updating conversation summary for user {user_id}: {str(e)}")
+    finally:
+        db.close()
+        with _refreshing_lock:
+            _refreshing.discard(user_id)
+
+
+def schedule_summary_refresh(user_id: int):
+    """Run refresh_summary off the request path; at most one refresh per user at a time"""
+    with _refreshing_lock:
+        if user_id in _refreshing:
+            return
+        _refreshing.add(user_id)
+    try:
+        BLOCKING_EXECUTOR.submit(refresh_summary, user_id)
+    except RuntimeError:  # executor already shut down
+        with _refreshing_lock:
+            _refreshing.discard(user_id)
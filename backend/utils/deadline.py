@@ -0,0 +1,57 @@
+"""
+Request deadlines for agent turns.
+
+A chat route creates a ``Deadline`` when the request arrives, so time spent
+queued for a worker counts against it. The agent carries it in its state
+and every LLM and tool call sizes its timeout from what is left. Calls that
+cannot start in time are skipped and recorded on the deadline, so the
+answer can say what it is missing.
+"""
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextvars import copy_context
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request's time budget runs out before a call can finish"""
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        # Names of the calls skipped or cut short to stay within the budget
+        self.skipped = []
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cap(self, timeout: float) -> float:
+        """``timeout`` limited to the remaining budget; raises DeadlineExceeded once nothing is left"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:.0f}s exceeded")
+        return min(timeout, remaining) if timeout else remaining
+
+    def skip(self, name: str):
+        if name not in self.skipped:
+            self.skipped.append(name)
+
+
+def call_with_deadline(executor, deadline, fn, *args, **kwargs):
+    """
+    Run ``fn`` and return its result, waiting no longer than ``deadline``
+    allows. On expiry the call is abandoned, not interrupted: it finishes on
+    ``executor`` in the background and its result is dropped.
+    """
+    if deadline is None:
+        return fn(*args, **kwargs)
+    future = executor.submit(copy_context().run, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=deadline.cap(None))
+    except FutureTimeout:
+        future.cancel()
+        raise DeadlineExceeded(f"Request deadline of {deadline.seconds:.0f}s exceeded")
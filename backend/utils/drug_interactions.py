@@ -0,0 +1,160 @@
+"""
+Pairwise decomposition of drug interaction checks.
+
+A medicine list is normalized and split into canonical (sorted) pairs so
+each pair is analyzed once and cached on its own; adding a drug to a regimen
+only sends the new pairs to the LLM. The LLM answers a batch of pairs as JSON
+and the per-pair results are recomposed into one report.
+"""
+import json
+import re
+from itertools import combinations
+
+from utils.medicine_lexicon import medicine_lexicon
+
+SEVERITY_ORDER = ["major", "moderate", "minor", "none", "unknown"]
+
+LIST_SEPARATOR_RE = re.compile(r"\s*(?:,|;|\n|\band\b|\bplus\b)\s*", re.IGNORECASE)
+# Also separates list items, unless the joined name is a known combination product
+COMBINATION_SEPARATOR_RE = re.compile(r"\s*(?:\+|&|/)\s*")
+MAX_COMBINATION_PARTS = 3
+STRENGTH_RE = re.compile(
+    r"\b\d+(?:\.\d+)?\s*(?:mg|mcg|µg|g|ml|iu|units?|%)\b|\b\d+(?:\.\d+)?\b|\((?:[^)]*)\)",
+    re.IGNORECASE
+)
+FORM_WORDS = {"tablet", "tablets", "tab", "tabs", "capsule", "capsules", "cap", "caps", "syrup", "injection", "drops", "cream"}
+OWN_MEDICINES_RE = re.compile(r"^\s*(?:my|all my|check my|current)?\s*(?:medicines|medications|meds|regimen)\s*$", re.IGNORECASE)
+
+
+def normalize_drug_name(name: str) -> str:
+    """Lowercase name without strength, form or extra whitespace ("Panadol 500mg Tablets" -> "panadol")"""
+    name = STRENGTH_RE.sub(" ", name.lower())
+    words = [w for w in re.findall(r"[a-z][a-z\-']*", name) if w not in FORM_WORDS]
+    return " ".join(words)
+
+
+def canonical_drug_name(name: str) -> str:
+    """
+    Normalized name, mapped to its generic when the medicine lexicon knows it,
+    so "Panadol" and "paracetamol" share cached pairs.
+    """
+    name = normalize_drug_name(name)
+    return (medicine_lexicon.generic_name(name) or name) if name else name
+
+
+def combination_name(components) -> str:
+    """
+    Generic name of a combination product written as its components
+    ("amoxicillin/clavulanate" -> "amoxicillin-clavulanate"), or None when
+    the formulary does not list it in either order.
+    """
+    names = [normalize_drug_name(c) for c in components]
+    if len(names) < 2 or not all(names):
+        return None
+    for ordered in (names, names[::-1]):
+        generic = medicine_lexicon.generic_name("-".join(ordered), fuzzy=False)
+        if generic:
+            return generic
+    return None
+
+
+def join_combinations(components) -> list:
+    """Canonical names of ``components``, with runs that form a known combination joined into one"""
+    names = []
+    i = 0
+    while i < len(components):
+        for end in range(min(len(components), i + MAX_COMBINATION_PARTS), i + 1, -1):
+            generic = combination_name(components[i:end])
+            if generic:
+                names.append(generic)
+                i = end
+                break
+        else:
+            names.append(canonical_drug_name(components[i]))
+            i += 1
+    return names
+
+
+def split_medicine_list(medicines: str) -> list:
+    """Unique canonical names in input order; known combination products stay one name"""
+    names = []
+    for part in LIST_SEPARATOR_RE.split(medicines or ""):
+        for name in join_combinations(COMBINATION_SEPARATOR_RE.split(part)):
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+def refers_to_own_medicines(medicines: str) -> bool:
+    """True for a blank list or phrases like "my medicines" that mean the user's saved regimen"""
+    return not (medicines or "").strip() or bool(OWN_MEDICINES_RE.match(medicines))
+
+
+def canonical_pairs(names) -> list:
+    return [tuple(sorted(pair)) for pair in combinations(sorted(set(names)), 2)]
+
+
+def pair_key(pair) -> str:
+    return "|".join(pair)
+
+
+def build_batch_prompt(pairs) -> str:
+    listing = "\n".join(f"- {a} + {b}" for a, b in pairs)
+    return (
+        "Analyze the interaction of each medicine pair below independently.\n"
+        f"{listing}\n\n"
+        "Reply with JSON only, in the form "
+        '{"pairs": [{"drug_a": "...", "drug_b": "...", '
+        '"severity": "major|moderate|minor|none|unknown", '
+        '"summary": "one or two sentences", "advice": "what the patient should do"}]}. '
+        "Use the names exactly as given and include every pair."
+    )
+
+
+def parse_batch_response(text: str, pairs) -> dict:
+    """Map canonical pair -> result for the pairs the LLM answered; malformed entries are dropped"""
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        return {}
+    try:
+        entries = json.loads(match.group(0)).get("pairs", [])
+    except (ValueError, AttributeError):
+        return {}
+
+    wanted = set(pairs)
+    results = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        pair = tuple(sorted((
+            canonical_drug_name(str(entry.get("drug_a", ""))),
+            canonical_drug_name(str(entry.get("drug_b", "")))
+        )))
+        if pair not in wanted:
+            continue
+        severity = str(entry.get("severity", "unknown")).lower()
+        results[pair] = {
+            "severity": severity if severity in SEVERITY_ORDER else "unknown",
+            "summary": str(entry.get("summary", "")).strip(),
+            "advice": str(entry.get("advice", "")).strip(),
+        }
+    return results
+
+
+def format_report(names, results: dict) -> str:
+    """Recompose per-pair results into the tool's report, most severe first"""
+    report = f"Drug Interaction Analysis for {', '.join(names)}:\n\n"
+    ordered = sorted(
+        canonical_pairs(names),
+        key=lambda pair: SEVERITY_ORDER.index(results[pair]["severity"]) if pair in results else len(SEVERITY_ORDER)
+    )
+    for pair in ordered:
+        result = results.get(pair)
+        if result is None:
+            report += f"- **{pair[0]} + {pair[1]}**: could not be analyzed right now.\n"
+            continue
+        report += f"- **{pair[0]} + {pair[1]}** ({result['severity']}): {result['summary']}"
+        if result["advice"]:
+            report += f" *Advice:* {result['advice']}"
+        report += "\n"
+    return report + "\nAlways confirm interactions with a doctor or pharmacist."
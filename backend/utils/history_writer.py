@@ -0,0 +1,139 @@
+"""
+Write-behind persistence for chat history.
+
+Saving a turn only queues it in memory; a background thread writes queued
+turns to ``chat_history`` in one transaction once CHAT_HISTORY_FLUSH_SIZE
+turns are waiting or CHAT_HISTORY_FLUSH_INTERVAL_SECONDS have passed, so
+requests no longer wait for a commit and concurrent chats share one fsync.
+The conversation summary is refreshed after the turns it needs are written.
+
+Each turn is timestamped when it is queued, so history order is unchanged.
+Readers that must see a user's latest turns (the history endpoint and the
+agent's conversation context) merge ``pending_for(user_id)`` with what they
+read from the database, dropping the turns already written (``unsaved``).
+
+The queue is flushed on shutdown. A crash can lose up to one flush interval
+of turns. A failed write keeps the turns queued for the next flush.
+"""
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from config import settings
+from database import SessionLocal
+from models import ChatHistory
+
+logger = logging.getLogger(__name__)
+
+# A queued turn; it has the fields readers of ChatHistory rows use, and no id yet
+PendingTurn = namedtuple("PendingTurn", ["user_id", "message", "response", "message_type", "created_at"])
+
+
+def unsaved(pending, stored) -> list:
+    """Pending turns not among the ``stored`` ChatHistory rows (a flush may land between the two reads)"""
+    written = {(row.created_at, row.message) for row in stored}
+    return [turn for turn in pending if (turn.created_at, turn.message) not in written]
+
+
+class HistoryWriter:
+    def __init__(self, flush_size: int, flush_interval: float):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._wake = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._in_flight = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        logger.info("Chat history writer started")
+
+    def stop(self, timeout: float = 30):
+        """Stop the flusher and write everything still queued"""
+        if self._thread is not None:
+            self._stop.set()
+            with self._wake:
+                self._wake.notify()
+            self._thread.join(timeout)
+            self._thread = None
+        written = self.flush()
+        remaining = self.pending()
+        if remaining:
+            logger.error(f"{remaining} chat history turns could not be written on shutdown")
+        logger.info(f"Chat history writer stopped after writing {written} queued turns")
+
+    def add(self, user_id: int, message: str, response: str, message_type: str) -> PendingTurn:
+        turn = PendingTurn(user_id, message, response, message_type, datetime.utcnow())
+        with self._wake:
+            self._pending.append(turn)
+            if len(self._pending) >= self.flush_size:
+                self._wake.notify()
+        if self._thread is None:
+            # No flusher running (scripts, or after shutdown): write through
+            self.flush()
+        return turn
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._wake:
+                if len(self._pending) < self.flush_size:
+                    self._wake.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> int:
+        """Write all queued turns in one transaction; returns how many were written"""
+        with self._flush_lock:
+            with self._wake:
+                turns, self._pending = self._pending, []
+                self._in_flight = turns
+            if not turns:
+                return 0
+
+            db = SessionLocal()
+            try:
+                db.bulk_insert_mappings(ChatHistory, [turn._asdict() for turn in turns])
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error writing {len(turns)} chat history turns, will retry: {str(e)}")
+                with self._wake:
+                    self._pending = turns + self._pending
+                    self._in_flight = []
+                return 0
+            finally:
+                db.close()
+
+            with self._wake:
+                self._in_flight = []
+
+        # Imported here: conversation_context reads this module's pending turns
+        from utils.conversation_context import schedule_summary_refresh
+        for user_id in {turn.user_id for turn in turns}:
+            schedule_summary_refresh(user_id)
+        return len(turns)
+
+    def pending_for(self, user_id: int) -> list:
+        """The user's turns not yet known to be written, oldest first"""
+        with self._wake:
+            return [turn for turn in self._in_flight + self._pending if turn.user_id == user_id]
+
+    def pending(self) -> int:
+        with self._wake:
+            return len(self._in_flight) + len(self._pending)
+
+
+history_writer = HistoryWriter(
+    settings.CHAT_HISTORY_FLUSH_SIZE,
+    settings.CHAT_HISTORY_FLUSH_INTERVAL_SECONDS
+)
+
+
+def flush_history() -> int:
+    return history_writer.flush()
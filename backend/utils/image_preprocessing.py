@@ -0,0 +1,71 @@
+"""
+Image preparation for vision model calls.
+
+Phone photos of prescriptions are often several megabytes, but the vision
+model scales every image down to fit 2048px and then to a 768px short side
+before it looks at it. ``prepare_image`` does that resize locally, converts
+documents with little colour to grayscale, and re-encodes as JPEG, so far
+fewer bytes are uploaded for the same result.
+
+``digest`` is the SHA-256 of the prepared bytes. Callers key extraction
+results on it (per user), so re-uploading the identical image skips the
+vision call. Only exact content matches are reused: prescriptions printed on
+the same template look alike to any perceptual hash but list different
+medicines.
+"""
+import hashlib
+import io
+from collections import namedtuple
+
+from PIL import Image, ImageOps, ImageStat
+
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+JPEG_QUALITY = 85
+# Mean HSV saturation (0-255) below which an image is treated as a text document
+GRAYSCALE_SATURATION = 24
+
+PreparedImage = namedtuple("PreparedImage", ["data", "mime_type", "width", "height", "grayscale", "original_size", "digest"])
+
+
+def target_size(width: int, height: int, max_long: int = MAX_LONG_SIDE, max_short: int = MAX_SHORT_SIDE):
+    scale = min(1.0, max_long / max(width, height), max_short / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def is_document(image: Image.Image) -> bool:
+    """True when the image is nearly colourless, like a printed or handwritten page"""
+    sample = image.convert("RGB")
+    sample.thumbnail((256, 256))
+    saturation = ImageStat.Stat(sample.convert("HSV").getchannel("S")).mean[0]
+    return saturation < GRAYSCALE_SATURATION
+
+
+def prepare_image(image_bytes: bytes, max_long: int = MAX_LONG_SIDE, max_short: int = MAX_SHORT_SIDE) -> PreparedImage:
+    """Resize, grayscale documents and JPEG-encode an upload for the vision model"""
+    image = Image.open(io.BytesIO(image_bytes))
+    source_format = image.format
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "L"):
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+        image = background
+
+    grayscale = image.mode == "L" or is_document(image)
+    if grayscale:
+        image = ImageOps.autocontrast(image.convert("L"), cutoff=1)
+
+    size = target_size(*image.size, max_long=max_long, max_short=max_short)
+    resized = size != image.size
+    if resized:
+        image = image.resize(size, Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    data = buffer.getvalue()
+    # A small colour JPEG that needed no changes is best sent as it is
+    if source_format == "JPEG" and not resized and not grayscale and len(image_bytes) < len(data):
+        data = image_bytes
+
+    digest = hashlib.sha256(data).hexdigest()
+    return PreparedImage(data, "image/jpeg", image.width, image.height, grayscale, len(image_bytes), digest)
@@ -0,0 +1,112 @@
+"""
+Local intent router for deterministic medicine commands.
+
+Short commands such as "show my medicines", "delete medicine 12" or
+"add panadol 500mg at 08:00" are parsed with anchored rules and executed
+directly against MedicineDatabase, skipping the LLM tool-selection round
+trip. A message is only routed when a rule matches all of it and every slot
+parses; anything else (extra questions, unknown medicine names, unparseable
+times) goes to the agent as before.
+"""
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from utils.medicine_lexicon import medicine_lexicon
+
+Intent = namedtuple("Intent", ["name", "slots", "confidence"])
+
+ROUTE_THRESHOLD = 0.9
+
+POLITE_RE = re.compile(r"^(?:please\s+|pls\s+|can you\s+|could you\s+|kindly\s+)+|\s*(?:please|pls|thanks|thank you)$")
+
+TIME = r"\d{1,2}(?::\d{2})?\s*(?:am|pm)|\d{1,2}:\d{2}"
+TIMES = rf"(?:{TIME})(?:\s*(?:,|and|&)\s*(?:{TIME}))*"
+DOSAGE = r"\d+(?:\.\d+)?\s*(?:mg|mcg|g|ml|iu|units?|tablets?|tabs?|capsules?|caps?|drops?|puffs?)"
+MEDICINE_WORD = r"(?:medicine|medication|med|drug|pill|tablet)"
+
+RULES = [
+    ("show_all_medicines", re.compile(
+        rf"^(?:show|list|display|view|get|what are|which are|tell me)\s+(?:me\s+)?(?:all\s+)?(?:of\s+)?my\s+(?:current\s+)?{MEDICINE_WORD}s?$"
+        rf"|^my\s+{MEDICINE_WORD}s?$"
+        rf"|^what\s+{MEDICINE_WORD}s?\s+(?:am i|do i)\s+(?:on|taking|take)$"
+    )),
+    ("delete_medicine", re.compile(
+        # Only an explicit "delete/remove medicine N": deletion is permanent, and "stop" or
+        # "cancel" often means pause or mark as taken, so those go to the agent
+        rf"^(?:delete|remove)\s+(?:my\s+)?{MEDICINE_WORD}\s+(?:with\s+)?(?:id\s*)?#?(?P<medicine_id>\d+)$"
+    )),
+    ("add_medicine", re.compile(
+        rf"^(?:add|schedule|remind me to take|set (?:a )?reminder for)\s+(?:{MEDICINE_WORD}\s+)?(?P<name>[a-z][a-z\- ]*?)\s+(?P<dosage>{DOSAGE})"
+        rf"\s+(?:at|@|every day at|daily at)\s+(?P<time>{TIMES})$"
+    )),
+    ("update_medicine", re.compile(
+        rf"^(?:change|update|move|set)\s+(?:my\s+)?(?:{MEDICINE_WORD}\s+)?(?:id\s*)?#?(?P<medicine_id>\d+)\s+"
+        rf"(?:(?:to|time to|times to|at)\s+(?P<time>{TIMES})|(?:dosage|dose)\s+(?:to\s+)?(?P<dosage>{DOSAGE}))$"
+    )),
+]
+
+
+def normalize_message(text: str) -> str:
+    text = " ".join(text.lower().strip().split())
+    text = text.rstrip(".!?")
+    return POLITE_RE.sub("", text).strip()
+
+
+def parse_times(value: str):
+    """24-hour "HH:MM" strings for "8am, 14:30 and 9 pm", or None if any part fails to parse"""
+    times = []
+    for part in re.split(r"\s*(?:,|and|&)\s*", value):
+        part = part.replace(" ", "")
+        if not part:
+            continue
+        if part.endswith(("am", "pm")) and ":" not in part:
+            part = f"{part[:-2]}:00{part[-2:]}"
+        for fmt in ("%H:%M", "%I:%M%p"):
+            try:
+                times.append(datetime.strptime(part, fmt).strftime("%H:%M"))
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    return times or None
+
+
+def route(message: str):
+    """Return the Intent a message expresses, or None when no rule covers the whole message"""
+    if not isinstance(message, str):
+        return None
+    text = normalize_message(message)
+    if not text or len(text) > 120:
+        return None
+
+    for name, pattern in RULES:
+        match = pattern.match(text)
+        if not match:
+            continue
+        slots = {k: v.strip() for k, v in match.groupdict().items() if v}
+        confidence = 1.0
+
+        if "time" in slots:
+            times = parse_times(slots["time"])
+            if times is None:
+                return Intent(name, slots, 0.5)
+            slots["time"] = ", ".join(times)
+        if "dosage" in slots:
+            slots["dosage"] = slots["dosage"].replace(" ", "")
+        if name == "add_medicine":
+            # Unknown names may be a misparse of a longer request; let the LLM decide
+            generic = medicine_lexicon.generic_name(slots["name"], fuzzy=False)
+            if generic is None:
+                confidence = 0.6
+            slots["name"] = slots["name"].title()
+        return Intent(name, slots, confidence)
+    return None
+
+
+def confident_intent(message: str):
+    intent = route(message)
+    if intent is None or intent.confidence < ROUTE_THRESHOLD:
+        return None
+    return intent
@@ -0,0 +1,308 @@
+"""
+Durable background jobs stored in the application database.
+
+Long-running AI work (image chat, prescription imports) can be enqueued
+instead of run inside the request. Jobs are rows in ``jobs``; a small pool
+of worker threads claims them with a conditional UPDATE, runs the handler
+registered for the job's kind and stores the result. Nothing is kept only
+in memory, so queued work survives a restart and a job whose worker died
+is claimed again once its lease runs out. While a handler runs, its worker
+keeps renewing the lease, and it records the outcome only if it still
+holds the lease. A lease that runs out counts as a failed attempt: a job
+whose worker dies on every attempt is failed once it has used them all.
+
+Failed attempts are retried with exponential backoff up to
+``max_attempts``, so a job may run more than once and handlers must
+tolerate that. An idempotency key makes enqueueing the same request twice
+return the existing job.
+
+Files a job was given to work on are listed in its payload under
+``uploads``; they are removed once the job has failed for good. A handler
+that succeeds decides itself which of them to keep.
+"""
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import Job
+from utils.metering import metered_user
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ("succeeded", "failed")
+
+# kind -> handler(payload, db, job) returning a JSON-serializable result
+JOB_HANDLERS = {}
+
+
+def job_handler(kind: str):
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help (bad input, missing file)"""
+
+
+def serialize_job(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def remove_uploads(payload: dict):
+    for path in (payload or {}).get("uploads") or []:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove job upload {path}: {str(e)}")
+
+
+def accepted_response(job: Job, created: bool) -> dict:
+    """Body returned when a request is handed to the queue"""
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "created": created,
+        "status_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events",
+    }
+
+
+def enqueue(db: Session, user_id: int, kind: str, payload: dict, idempotency_key: str = None, max_attempts: int = None):
+    """Add a job and return (job, created). A repeated idempotency key returns the existing job."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"No handler registered for job kind '{kind}'")
+    if idempotency_key:
+        existing = db.query(Job).filter(Job.user_id == user_id, Job.idempotency_key == idempotency_key).first()
+        if existing is not None:
+            return existing, False
+
+    job = Job(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        kind=kind,
+        payload=payload,
+        idempotency_key=idempotency_key,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request with the same key won the race
+        db.rollback()
+        return db.query(Job).filter(Job.user_id == user_id, Job.idempotency_key == idempotency_key).one(), False
+    db.refresh(job)
+    job_queue.notify()
+    return job, True
+
+
+class JobQueue:
+    def __init__(self, workers: int, poll_interval: float, lease_seconds: float, retry_backoff: float):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.retry_backoff = retry_backoff
+        self._wake = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self.purge_finished()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Job queue started with {self.workers} workers")
+
+    def stop(self, timeout: float = 30):
+        """Stop claiming jobs and wait for running ones; unfinished jobs are picked up after restart"""
+        self._stop.set()
+        self.notify(all_workers=True)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("Job queue stopped")
+
+    def notify(self, all_workers: bool = False):
+        with self._wake:
+            if all_workers:
+                self._wake.notify_all()
+            else:
+                self._wake.notify()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job_id = self.claim()
+            except Exception as e:
+                logger.error(f"Error claiming job: {str(e)}")
+                job_id = None
+            if job_id is None:
+                with self._wake:
+                    self._wake.wait(self.poll_interval)
+                continue
+            self.execute(job_id)
+
+    def fail_abandoned(self, db: Session, now: datetime):
+        """Fail jobs whose worker died on their last allowed attempt (crashed, OOM-killed)"""
+        abandoned = and_(Job.status == "running", Job.locked_until < now, Job.attempts >= Job.max_attempts)
+        for job_id, kind, attempts, payload in db.query(Job.id, Job.kind, Job.attempts, Job.payload).filter(abandoned).all():
+            failed = db.query(Job).filter(Job.id == job_id, abandoned).update({
+                Job.status: "failed",
+                Job.error: f"Worker stopped responding during attempt {attempts}",
+                Job.locked_until: None,
+                Job.finished_at: now,
+            }, synchronize_session=False)
+            db.commit()
+            if failed:
+                logger.error(f"Job {job_id} ({kind}) failed after {attempts} attempts: its worker stopped responding")
+                remove_uploads(payload)
+
+    def claim(self):
+        """Lease the oldest runnable job to this worker; returns its id or None"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            self.fail_abandoned(db, now)
+            runnable = or_(
+                and_(Job.status == "queued", Job.run_after <= now),
+                # Worker died mid-job; retried like a failed attempt while attempts are left
+                and_(Job.status == "running", Job.locked_until < now, Job.attempts < Job.max_attempts),
+            )
+            candidates = db.query(Job.id).filter(runnable).order_by(Job.run_after, Job.created_at).limit(5).all()
+            for (job_id,) in candidates:
+                claimed = db.query(Job).filter(Job.id == job_id, runnable).update({
+                    Job.status: "running",
+                    Job.attempts: Job.attempts + 1,
+                    Job.locked_until: now + timedelta(seconds=self.lease_seconds),
+                    Job.started_at: now,
+                }, synchronize_session=False)
+                db.commit()
+                if claimed:
+                    return job_id
+            return None
+        finally:
+            db.close()
+
+    def _heartbeat(self, job_id: str, attempt: int, stop: threading.Event):
+        """Keep extending the lease of a running job until ``stop`` is set, so it is not claimed twice"""
+        while not stop.wait(max(self.lease_seconds / 3, 1)):
+            db = SessionLocal()
+            try:
+                renewed = db.query(Job).filter(
+                    Job.id == job_id, Job.status == "running", Job.attempts == attempt
+                ).update({Job.locked_until: datetime.utcnow() + timedelta(seconds=self.lease_seconds)}, synchronize_session=False)
+                db.commit()
+                if not renewed:
+                    return
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Error renewing the lease of job {job_id}: {str(e)}")
+            finally:
+                db.close()
+
+    def execute(self, job_id: str):
+        db = SessionLocal()
+        stop_heartbeat = threading.Event()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).one()
+            attempt, max_attempts, kind, payload = job.attempts, job.max_attempts, job.kind, job.payload or {}
+            heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, attempt, stop_heartbeat), daemon=True)
+            heartbeat.start()
+            handler = JOB_HANDLERS.get(kind)
+            error = None
+            try:
+                if handler is None:
+                    raise PermanentJobError(f"No handler registered for job kind '{kind}'")
+                with metered_user(job.user_id):
+                    result = handler(payload, db, job)
+            except Exception as e:
+                db.rollback()
+                error = e
+            finally:
+                stop_heartbeat.set()
+                heartbeat.join()
+
+            now = datetime.utcnow()
+            if error is None:
+                outcome = {Job.status: "succeeded", Job.result: result, Job.error: None, Job.finished_at: now}
+            elif isinstance(error, PermanentJobError) or attempt >= max_attempts:
+                outcome = {Job.status: "failed", Job.error: f"{type(error).__name__}: {str(error)}"[:2000], Job.finished_at: now}
+            else:
+                outcome = {
+                    Job.status: "queued",
+                    Job.error: f"{type(error).__name__}: {str(error)}"[:2000],
+                    Job.run_after: now + timedelta(seconds=self.retry_backoff * 2 ** (attempt - 1)),
+                }
+            outcome[Job.locked_until] = None
+
+            # Only the worker still holding the lease records the outcome
+            recorded = db.query(Job).filter(
+                Job.id == job_id, Job.status == "running", Job.attempts == attempt
+            ).update(outcome, synchronize_session=False)
+            db.commit()
+            if not recorded:
+                logger.warning(f"Job {job_id} ({kind}) attempt {attempt} lost its lease; discarding its outcome")
+                return
+
+            if error is None:
+                return
+            if outcome[Job.status] == "failed":
+                logger.error(f"Job {job_id} ({kind}) failed after {attempt} attempts: {str(error)}")
+                remove_uploads(payload)
+            else:
+                logger.warning(f"Job {job_id} ({kind}) attempt {attempt} failed, retrying: {str(error)}")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error finishing job {job_id}: {str(e)}")
+        finally:
+            stop_heartbeat.set()
+            db.close()
+
+    def purge_finished(self):
+        db = SessionLocal()
+        try:
+            cutoff = datetime.utcnow() - timedelta(days=settings.JOB_RETENTION_DAYS)
+            removed = db.query(Job).filter(Job.status.in_(TERMINAL_STATES), Job.finished_at < cutoff).delete(synchronize_session=False)
+            db.commit()
+            if removed:
+                logger.info(f"Removed {removed} finished jobs older than {settings.JOB_RETENTION_DAYS} days")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error purging finished jobs: {str(e)}")
+        finally:
+            db.close()
+
+
+job_queue = JobQueue(
+    settings.JOB_WORKERS,
+    settings.JOB_POLL_INTERVAL_SECONDS,
+    settings.JOB_LEASE_SECONDS,
+    settings.JOB_RETRY_BACKOFF_SECONDS
+)
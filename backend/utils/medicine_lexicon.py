@@ -0,0 +1,228 @@
+"""
+Medicine name lexicon.
+
+Loads a formulary of generic names and their brand/alternate names and finds
+them in free text with an Aho-Corasick automaton, so a scan costs the same
+whether the formulary has ninety names or ten thousand. Misspelled words are
+matched with a symmetric-delete index bounded by edit distance. The shared
+``medicine_lexicon`` is built once at import from MEDICINE_FORMULARY_PATH.
+
+Formulary file: CSV with a ``generic,aliases`` header; aliases are separated
+by ``|``. Lines starting with ``#`` are ignored.
+"""
+import csv
+import logging
+import os
+import re
+from collections import deque, namedtuple
+from itertools import combinations
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FORMULARY_PATH = Path(__file__).resolve().parent.parent / "data" / "formulary.csv"
+MIN_FUZZY_LENGTH = 5
+
+WORD_RE = re.compile(r"[a-z][a-z\-]*")
+
+MedicineMatch = namedtuple("MedicineMatch", ["text", "generic", "start", "end", "distance"])
+
+
+def normalize_term(term: str) -> str:
+    return " ".join(term.lower().split())
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, or ``limit + 1`` as soon as it is known to exceed ``limit``"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _deletes(word: str, distance: int):
+    """All strings obtained by removing up to ``distance`` characters"""
+    variants = {word}
+    for n in range(1, min(distance, len(word) - 1) + 1):
+        for positions in combinations(range(len(word)), n):
+            variants.add("".join(c for i, c in enumerate(word) if i not in positions))
+    return variants
+
+
+class MedicineLexicon:
+    def __init__(self, formulary: dict, max_edit_distance: int = 1):
+        """``formulary`` maps each generic name to an iterable of aliases"""
+        self.max_edit_distance = max_edit_distance
+        self.generic_of = {}
+        for generic, aliases in formulary.items():
+            generic = normalize_term(generic)
+            if not generic:
+                continue
+            for term in [generic, *aliases]:
+                term = normalize_term(term)
+                if term:
+                    self.generic_of.setdefault(term, generic)
+        self.terms = list(self.generic_of)
+        self._build_automaton()
+        self._build_fuzzy_index()
+
+    @classmethod
+    def from_file(cls, path: str, max_edit_distance: int = 1):
+        formulary = {}
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = csv.DictReader(line for line in f if not line.lstrip().startswith("#"))
+            for row in rows:
+                generic = (row.get("generic") or "").strip()
+                aliases = [a for a in (row.get("aliases") or "").split("|") if a.strip()]
+                formulary.setdefault(generic, []).extend(aliases)
+        return cls(formulary, max_edit_distance)
+
+    def __len__(self):
+        return len(self.terms)
+
+    # ---------- exact matching ----------
+    def _build_automaton(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]  # indexes of the terms that end at each state
+
+        for index, term in enumerate(self.terms):
+            state = 0
+            for char in term:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append(index)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _scan(self, text: str):
+        """Yield (start, end, term_index) for every term occurrence on word boundaries"""
+        goto, fail, out, terms = self._goto, self._fail, self._out, self.terms
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in out[state]:
+                end = position + 1
+                start = end - len(terms[index])
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    yield start, end, index
+
+    # ---------- fuzzy matching ----------
+    def _build_fuzzy_index(self):
+        self._deletes = {}
+        for term in self.terms:
+            if len(term) >= MIN_FUZZY_LENGTH and " " not in term:
+                for variant in _deletes(term, self.max_edit_distance):
+                    self._deletes.setdefault(variant, set()).add(term)
+
+    def closest(self, word: str):
+        """(term, distance) of the nearest single-word term within the edit distance, or None"""
+        word = normalize_term(word)
+        if word in self.generic_of:
+            return word, 0
+        if len(word) < MIN_FUZZY_LENGTH or self.max_edit_distance == 0:
+            return None
+
+        candidates = set()
+        for variant in _deletes(word, self.max_edit_distance):
+            candidates |= self._deletes.get(variant, set())
+        scored = [(edit_distance(word, term, self.max_edit_distance), term) for term in candidates]
+        scored = [(distance, term) for distance, term in scored if distance <= self.max_edit_distance]
+        if not scored:
+            return None
+        distance, term = min(scored)
+        return term, distance
+
+    # ---------- public API ----------
+    def generic_name(self, name: str, fuzzy: bool = True):
+        """Generic name for a brand, generic or (optionally) misspelled name, or None"""
+        term = normalize_term(name)
+        if term in self.generic_of:
+            return self.generic_of[term]
+        if fuzzy:
+            match = self.closest(term)
+            if match:
+                return self.generic_of[match[0]]
+        return None
+
+    def find(self, text: str, fuzzy: bool = True) -> list:
+        """
+        Non-overlapping medicine mentions in ``text``, in order. Exact matches
+        prefer the longest term at each position; words not covered by an
+        exact match are then tried against the fuzzy index.
+        """
+        lowered = text.lower()
+        if len(lowered) != len(text):  # a few characters change length when lowercased
+            text = lowered
+        candidates = sorted(self._scan(lowered), key=lambda m: (m[0], -(m[1] - m[0])))
+
+        matches = []
+        covered_until = 0
+        for start, end, index in candidates:
+            if start < covered_until:
+                continue
+            term = self.terms[index]
+            matches.append(MedicineMatch(text[start:end], self.generic_of[term], start, end, 0))
+            covered_until = end
+
+        if fuzzy and self.max_edit_distance:
+            covered = [(m.start, m.end) for m in matches]
+            for word in WORD_RE.finditer(lowered):
+                if len(word.group()) < MIN_FUZZY_LENGTH:
+                    continue
+                if any(start < word.end() and word.start() < end for start, end in covered):
+                    continue
+                match = self.closest(word.group())
+                if match:
+                    term, distance = match
+                    matches.append(MedicineMatch(text[word.start():word.end()], self.generic_of[term], word.start(), word.end(), distance))
+            matches.sort(key=lambda m: m.start)
+        return matches
+
+    def generics_in(self, text: str, fuzzy: bool = True) -> list:
+        """Distinct (surface text, generic) pairs in order of first mention"""
+        seen = set()
+        found = []
+        for match in self.find(text, fuzzy):
+            if match.generic not in seen:
+                seen.add(match.generic)
+                found.append((match.text, match.generic))
+        return found
+
+
+def load_lexicon(path: str = None) -> MedicineLexicon:
+    path = path or os.getenv("MEDICINE_FORMULARY_PATH", DEFAULT_FORMULARY_PATH)
+    try:
+        lexicon = MedicineLexicon.from_file(path, int(os.getenv("MEDICINE_FUZZY_MAX_DISTANCE", "1")))
+    except OSError as e:
+        logger.error(f"Medicine formulary not loaded from {path}: {str(e)}")
+        return MedicineLexicon({})
+    logger.info(f"Loaded medicine formulary with {len(lexicon)} names from {path}")
+    return lexicon
+
+
+medicine_lexicon = load_lexicon()
@@ -0,0 +1,268 @@
+"""
+Per-call metering for LLM and tool invocations.
+
+Every agent tool call and every LLM call (the agent itself, the advisory
+tools, prescription extraction, image analysis, conversation summaries) is
+wrapped in ``meter``. It records the model, prompt and completion tokens,
+latency, whether a cache answered the call, the error if any, and the user.
+Records are buffered in memory and written to ``call_metrics`` in batches
+from the blocking pool, so metering adds no database round trip to a call.
+
+``summarize_calls`` aggregates records per tool (or per user or model) for
+the metrics endpoint.
+"""
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+
+from config import settings
+from database import SessionLocal
+from models import CallMetric
+from utils.concurrency import BLOCKING_EXECUTOR
+
+logger = logging.getLogger(__name__)
+
+# USD per million (prompt, completion) tokens, for cost estimates
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4": (30.00, 60.00),
+}
+
+_current_user = ContextVar("metering_user", default=None)
+_current_call = ContextVar("metering_call", default=None)
+
+
+class CallRecord:
+    """One metered call; fields are filled in while the call runs"""
+
+    def __init__(self, kind: str, name: str, model: str = None, user_id=None):
+        self.kind = kind
+        self.name = name
+        self.model = model
+        self.user_id = int(user_id) if user_id not in (None, "") else None
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.latency_ms = None
+        self.cache_hit = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+
+    def set_usage(self, response):
+        prompt, completion = usage_tokens(response)
+        if prompt is not None:
+            self.prompt_tokens = (self.prompt_tokens or 0) + prompt
+        if completion is not None:
+            self.completion_tokens = (self.completion_tokens or 0) + completion
+
+    def as_row(self) -> dict:
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "model": self.model,
+            "user_id": self.user_id,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_ms": self.latency_ms,
+            "cache_hit": self.cache_hit,
+            "error": self.error,
+            "cost_usd": estimate_cost(self.model, self.prompt_tokens, self.completion_tokens),
+            "created_at": self.created_at,
+        }
+
+
+def usage_tokens(response):
+    """(prompt, completion) tokens of an OpenAI response or a LangChain message; None when unreported"""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata:
+        return metadata.get("input_tokens"), metadata.get("output_tokens")
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage")
+    if token_usage:
+        return token_usage.get("prompt_tokens"), token_usage.get("completion_tokens")
+    return None, None
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int):
+    prices = MODEL_PRICES.get(model)
+    if prices is None or (prompt_tokens is None and completion_tokens is None):
+        return None
+    return ((prompt_tokens or 0) * prices[0] + (completion_tokens or 0) * prices[1]) / 1_000_000
+
+
+class MeterRecorder:
+    """Buffers call records and writes them in batches by size or age"""
+
+    def __init__(self, flush_size: int, flush_interval: float, retention_days: int):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._pending = []
+        self._flushing = False
+        self._last_flush = time.monotonic()
+        self._last_purge = 0.0
+
+    def add(self, record: CallRecord):
+        with self._lock:
+            self._pending.append(record.as_row())
+            due = len(self._pending) >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval
+            if not due or self._flushing:
+                return
+            self._flushing = True
+        try:
+            BLOCKING_EXECUTOR.submit(self.flush)
+        except RuntimeError:  # executor already shut down; the shutdown flush writes them
+            with self._lock:
+                self._flushing = False
+
+    def flush(self) -> int:
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            purge = time.monotonic() - self._last_purge >= 24 * 3600
+            if purge:
+                self._last_purge = time.monotonic()
+
+        db = SessionLocal()
+        try:
+            if rows:
+                db.bulk_insert_mappings(CallMetric, rows)
+            if purge:
+                cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+                db.query(CallMetric).filter(CallMetric.created_at < cutoff).delete(synchronize_session=False)
+            db.commit()
+            return len(rows)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error writing {len(rows)} call metrics: {str(e)}")
+            return 0
+        finally:
+            db.close()
+            with self._lock:
+                self._flushing = False
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+recorder = MeterRecorder(
+    settings.METERING_FLUSH_SIZE,
+    settings.METERING_FLUSH_INTERVAL_SECONDS,
+    settings.METERING_RETENTION_DAYS
+)
+
+
+def flush_metrics() -> int:
+    return recorder.flush()
+
+
+@contextmanager
+def metered_user(user_id):
+    """Attribute calls made inside the block (and in run_blocking work started from it) to ``user_id``"""
+    token = _current_user.set(user_id)
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+
+@contextmanager
+def meter(kind: str, name: str, model: str = None, user_id=None):
+    """
+    Record one call. Yields the CallRecord so the caller can attach token
+    usage and the cache outcome; an exception is recorded and re-raised.
+    """
+    record = CallRecord(kind, name, model, user_id if user_id is not None else _current_user.get())
+    token = _current_call.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record.error = f"{type(e).__name__}: {str(e)}"[:500]
+        raise
+    finally:
+        record.latency_ms = (time.perf_counter() - start) * 1000
+        _current_call.reset(token)
+        recorder.add(record)
+
+
+def record_call(kind: str, name: str, latency_ms: float, model: str = None, user_id=None, response=None, error: str = None):
+    """Record a call timed by the caller, for code that cannot hold ``meter`` open (generators)"""
+    record = CallRecord(kind, name, model, user_id if user_id is not None else _current_user.get())
+    record.latency_ms = latency_ms
+    record.error = error[:500] if error else None
+    if response is not None:
+        record.set_usage(response)
+    recorder.add(record)
+
+
+def note_cache_hit(hit: bool = True):
+    """Mark whether a cache answered the innermost call being metered"""
+    record = _current_call.get()
+    if record is not None:
+        record.cache_hit = hit
+
+
+def note_usage(response):
+    """Add an LLM response's token usage to the innermost call being metered"""
+    record = _current_call.get()
+    if record is not None:
+        record.set_usage(response)
+
+
+def metered_completion(client, name: str, **kwargs):
+    """``client.chat.completions.create(**kwargs)`` recorded as an LLM call named ``name``"""
+    with meter("llm", name, kwargs.get("model")) as call:
+        response = client.chat.completions.create(**kwargs)
+        call.set_usage(response)
+        return response
+
+
+def percentile(sorted_values, fraction: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize_calls(rows, group_by=("kind", "name", "model")) -> list:
+    """Aggregate CallMetric rows per group: counts, error and cache-hit rates, tokens, cost and latency percentiles"""
+    groups = {}
+    for row in rows:
+        key = tuple(getattr(row, field) for field in group_by)
+        groups.setdefault(key, []).append(row)
+
+    summaries = []
+    for key, calls in groups.items():
+        latencies = sorted(call.latency_ms for call in calls if call.latency_ms is not None)
+        cache_known = [call for call in calls if call.cache_hit is not None]
+        cache_hits = sum(1 for call in cache_known if call.cache_hit)
+        errors = sum(1 for call in calls if call.error)
+        costs = [call.cost_usd for call in calls if call.cost_usd is not None]
+        summaries.append({
+            **dict(zip(group_by, key)),
+            "calls": len(calls),
+            "errors": errors,
+            "error_rate": round(errors / len(calls), 3),
+            "cache_hits": cache_hits,
+            "cache_hit_rate": round(cache_hits / len(cache_known), 3) if cache_known else None,
+            "prompt_tokens": sum(call.prompt_tokens or 0 for call in calls),
+            "completion_tokens": sum(call.completion_tokens or 0 for call in calls),
+            "cost_usd": round(sum(costs), 6) if costs else None,
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies), 1) if latencies else None,
+                "p50": round(percentile(latencies, 0.50), 1) if latencies else None,
+                "p95": round(percentile(latencies, 0.95), 1) if latencies else None,
+                "max": round(latencies[-1], 1) if latencies else None,
+            },
+        })
+    summaries.sort(key=lambda item: (item["cost_usd"] or 0, item["calls"]), reverse=True)
+    return summaries
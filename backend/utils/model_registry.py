@@ -0,0 +1,285 @@
+"""
+Versioned YOLO model registry backed by a JSON manifest.
+
+The manifest lists every model with its version, weights path, optional
+sha256 checksum, expected class names and inference settings. A background
+watcher re-reads the manifest; when an entry changes, the new version is
+loaded and warmed off the request path and then swapped in atomically.
+Requests that already hold the previous ``LoadedModel`` finish on it.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLoadError(Exception):
+    """Raised when a manifest entry cannot be loaded"""
+
+
+class UnknownProfileError(Exception):
+    """Raised when a request names an inference profile the model doesn't define"""
+
+
+class LatencyStats:
+    """Rolling inference latency for one model profile"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self._count
+        if not samples:
+            return {"count": 0, "mean_ms": None, "p50_ms": None, "p95_ms": None}
+        return {
+            "count": count,
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 1),
+            "p50_ms": round(samples[len(samples) // 2] * 1000, 1),
+            "p95_ms": round(samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000, 1),
+        }
+
+
+class LoadedModel:
+    """A loaded model together with the manifest entry it was built from"""
+
+    def __init__(self, name: str, spec: dict, path: str, model):
+        self.name = name
+        self.spec = spec
+        self.version = spec["version"]
+        self.path = path
+        self.model = model
+        self.inference = dict(spec.get("inference") or {})
+        self.profiles = dict(spec.get("profiles") or {})
+        self.default_profile = spec.get("default_profile") or next(iter(self.profiles), "default")
+        self.profiles.setdefault(self.default_profile, {})
+        self.class_names = spec.get("class_names") or list(model.names.values())
+        self.loaded_at = datetime.utcnow()
+        self.latency = {profile: LatencyStats() for profile in self.profiles}
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def resolve_profile(self, profile: str = None) -> str:
+        profile = profile or self.default_profile
+        if profile not in self.profiles:
+            raise UnknownProfileError(profile)
+        return profile
+
+    def profile_settings(self, profile: str = None) -> dict:
+        return {**self.inference, **self.profiles[self.resolve_profile(profile)]}
+
+    def predict(self, image, profile: str = None, record: bool = True):
+        profile = self.resolve_profile(profile)
+        start = time.perf_counter()
+        results = self.model(image, verbose=False, **self.profile_settings(profile))
+        if record:
+            self.latency[profile].record(time.perf_counter() - start)
+        return results
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.manifest_dir = os.path.dirname(manifest_path)
+        self._manifest = {}
+        self._manifest_mtime = None
+        self._active = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._watcher = None
+        self._stop_event = threading.Event()
+        self.reload_manifest()
+
+    # ---------- manifest ----------
+    def reload_manifest(self) -> bool:
+        """Re-read the manifest if it changed on disk. Returns True when it was reloaded."""
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            logger.error(f"Model manifest not found: {self.manifest_path}")
+            return False
+
+        if mtime == self._manifest_mtime:
+            return False
+
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                models = json.load(f)["models"]
+        except (ValueError, KeyError) as e:
+            logger.error(f"Invalid model manifest {self.manifest_path}: {e}")
+            return False
+
+        self._manifest = models
+        self._manifest_mtime = mtime
+        logger.info(f"Loaded model manifest with {len(models)} models")
+        return True
+
+    def names(self):
+        return list(self._manifest.keys())
+
+    def spec(self, name: str) -> dict:
+        if name not in self._manifest:
+            raise KeyError(name)
+        return self._manifest[name]
+
+    def weights_path(self, spec: dict) -> str:
+        return os.path.join(self.manifest_dir, spec["path"])
+
+    # ---------- loading ----------
+    def _load(self, name: str, spec: dict) -> LoadedModel:
+        path = self.weights_path(spec)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+
+        expected_sha = spec.get("sha256")
+        if expected_sha:
+            actual_sha = file_sha256(path)
+            if actual_sha != expected_sha:
+                raise ModelLoadError(f"Checksum mismatch for {name} {spec['version']}: expected {expected_sha}, got {actual_sha}")
+
+        try:
+            model = YOLO(path)
+        except Exception as e:
+            raise ModelLoadError(f"Error loading model {name} from {path}: {str(e)}")
+
+        expected_names = spec.get("class_names")
+        if expected_names and list(model.names.values()) != list(expected_names):
+            raise ModelLoadError(f"Class names for {name} {spec['version']} do not match the manifest: {list(model.names.values())}")
+
+        loaded = LoadedModel(name, spec, path, model)
+        self._warm_up(loaded)
+        logger.info(f"Loaded model {name} version {loaded.version} from {path}")
+        return loaded
+
+    @staticmethod
+    def _warm_up(loaded: LoadedModel):
+        """Run one dummy inference per profile so the first real request doesn't pay for lazy init"""
+        try:
+            for profile in loaded.profiles:
+                imgsz = loaded.profile_settings(profile).get("imgsz", 640)
+                loaded.predict(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), profile=profile, record=False)
+        except Exception as e:
+            raise ModelLoadError(f"Warm-up failed for {loaded.name} {loaded.version}: {str(e)}")
+
+    def get(self, name: str) -> LoadedModel:
+        """Return the active version of a model, loading it on first use"""
+        loaded = self._active.get(name)
+        if loaded is not None:
+            return loaded
+
+        spec = self.spec(name)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            loaded = self._active.get(name)
+            if loaded is None:
+                loaded = self._load(name, spec)
+                self._active[name] = loaded
+        return loaded
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._active
+
+    # ---------- hot reload ----------
+    def check_for_updates(self):
+        """Reload the manifest and swap in any loaded model whose entry changed"""
+        if not self.reload_manifest():
+            return
+
+        for name, loaded in list(self._active.items()):
+            spec = self._manifest.get(name)
+            if spec is None:
+                logger.info(f"Model {name} removed from manifest; unloading")
+                self._active.pop(name, None)
+                continue
+            if spec == loaded.spec:
+                continue
+
+            logger.info(f"Manifest changed for {name}: {loaded.version} -> {spec['version']}")
+            try:
+                replacement = self._load(name, spec)
+            except Exception as e:
+                logger.error(f"Keeping {name} {loaded.version}; new version failed to load: {str(e)}")
+                continue
+            # Single reference assignment: new requests see the new version,
+            # in-flight requests keep using the object they already hold.
+            self._active[name] = replacement
+            logger.info(f"Swapped {name} to version {replacement.version}")
+
+    def _watch(self, interval: float):
+        while not self._stop_event.wait(interval):
+            try:
+                self.check_for_updates()
+            except Exception as e:
+                logger.error(f"Error checking model manifest: {str(e)}")
+
+    def start_watcher(self, interval: float):
+        if self._watcher is not None:
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="model-manifest-watcher", daemon=True)
+        self._watcher.start()
+        logger.info(f"Model manifest watcher started (every {interval}s)")
+
+    def stop_watcher(self):
+        if self._watcher is None:
+            return
+        self._stop_event.set()
+        self._watcher.join(timeout=5)
+        self._watcher = None
+        logger.info("Model manifest watcher stopped")
+
+    # ---------- reporting ----------
+    def status(self) -> dict:
+        report = {}
+        for name, spec in self._manifest.items():
+            path = self.weights_path(spec)
+            loaded = self._active.get(name)
+            report[name] = {
+                "path": path,
+                "absolute_path": os.path.abspath(path),
+                "exists": os.path.exists(path),
+                "loaded": loaded is not None,
+                "manifest_version": spec["version"],
+                "active_version": loaded.version if loaded else None,
+                "loaded_at": loaded.loaded_at.isoformat() if loaded else None,
+                "sha256": spec.get("sha256"),
+                "class_names": loaded.class_names if loaded else spec.get("class_names"),
+                "inference": spec.get("inference") or {},
+                "default_profile": loaded.default_profile if loaded else spec.get("default_profile"),
+                "profiles": {
+                    profile: {
+                        "settings": {**(spec.get("inference") or {}), **overrides},
+                        "latency": loaded.latency[profile].summary() if loaded and profile in loaded.latency else None,
+                    }
+                    for profile, overrides in (spec.get("profiles") or {}).items()
+                },
+            }
+        return report
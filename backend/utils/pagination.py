@@ -0,0 +1,44 @@
+"""
+Keyset (cursor) pagination over (created_at, id), newest first.
+
+Cursors are opaque url-safe strings that encode the last row's position, so
+each page is a single indexed range scan regardless of how deep the client
+has paged.
+"""
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(created_at: datetime, row_id) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, id_type=str):
+    """Decode a cursor into (created_at, id). Raises ValueError when malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), id_type(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_page(query, created_column, id_column, limit: int, cursor: str = None, id_type=str):
+    """Return (rows, next_cursor) for the page after ``cursor``"""
+    if cursor:
+        created_at, row_id = decode_cursor(cursor, id_type)
+        query = query.filter(or_(
+            created_column < created_at,
+            and_(created_column == created_at, id_column < row_id)
+        ))
+
+    rows = query.order_by(created_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
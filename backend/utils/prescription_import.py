@@ -0,0 +1,194 @@
+"""
+Bulk import of medicines extracted from prescription images.
+
+Extraction results from every page are merged into one medicine list
+(the same medicine on two pages is one entry), reminder times are derived
+from the dosing instructions, and everything is written in one
+transaction: medicine upserts, one DELETE of the superseded pending
+reminders, one bulk reminder insert and one Prescription row per file.
+Medicines taken as needed, weekly, or on a schedule the instructions do not
+spell out get no reminders; they are listed for the user to schedule.
+"""
+import logging
+import re
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from models import Medicine, Prescription, Reminder
+from utils.medicine_lexicon import medicine_lexicon
+from utils.schedular import build_reminders, get_current_pkt_time, parse_reminder_time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOSAGE = "Not specified"
+
+# Dosing frequency phrases -> reminder times (PKT), most specific first
+FREQUENCY_TIMES = [
+    (re.compile(r"\b(?:four times|4 times|4x|qid|qds)\b|\bevery 6 ?(?:hours|hrs|h)\b|\bq6h\b"), ["08:00", "12:00", "16:00", "20:00"]),
+    (re.compile(r"\b(?:three times|thrice|3 times|3x|tid|tds)\b|\bevery 8 ?(?:hours|hrs|h)\b|\bq8h\b|\b1-1-1\b"), ["08:00", "14:00", "20:00"]),
+    (re.compile(r"\b(?:twice|two times|2 times|2x|bid|bd)\b|\bevery 12 ?(?:hours|hrs|h)\b|\bq12h\b|\b1-0-1\b"), ["09:00", "21:00"]),
+    (re.compile(r"\b(?:at night|bedtime|before sleep|nightly|hs|qhs)\b|\b0-0-1\b"), ["22:00"]),
+    (re.compile(r"\b(?:in the morning|every morning|mornings?)\b|\b1-0-0\b"), ["08:00"]),
+    (re.compile(r"\b(?:once|one time|1 time|daily|od|qd|every day|a day)\b|\bevery 24 ?(?:hours|hrs|h)\b"), ["09:00"]),
+]
+# Instructions a daily reminder would get wrong: as-needed, weekly and other non-daily schedules
+UNSCHEDULED_RE = re.compile(
+    r"\b(?:as needed|as required|when needed|when required|if needed|if required|prn|sos|on demand)\b"
+    r"|\b(?:weekly|fortnightly|monthly|alternate days|(?:once|twice|\d+ times?) (?:a|per|every) (?:week|month))\b"
+    r"|\bevery (?:other|alternate|\d+(?:st|nd|rd|th)?) (?:days?|weeks?|months?)\b"
+    r"|\b(?:every|on) (?:mon|tues|wednes|thurs|fri|satur|sun)days?\b"
+)
+CLOCK_TIME_RE = re.compile(r"\b(\d{1,2}(?::\d{2})?\s*(?:am|pm)|\d{1,2}:\d{2})\b", re.IGNORECASE)
+
+
+def times_for_instructions(instructions: str) -> list:
+    """
+    Daily reminder times for a dosing instruction; explicit clock times win.
+    Empty for as-needed and non-daily schedules, and when no frequency is recognised.
+    """
+    text = (instructions or "").lower()
+    if UNSCHEDULED_RE.search(text):
+        return []
+
+    explicit = []
+    for match in CLOCK_TIME_RE.findall(text):
+        parsed = parse_reminder_time(match)
+        if parsed is not None:
+            explicit.append(parsed.strftime("%H:%M"))
+    if explicit:
+        return sorted(set(explicit))
+
+    for pattern, times in FREQUENCY_TIMES:
+        if pattern.search(text):
+            return list(times)
+    return []
+
+
+def merge_times(existing, added) -> list:
+    """
+    Union of two reminder time lists, deduplicated on the parsed time so
+    "09:00 AM" (chat tool format) and "09:00" (import format) are one dose.
+    Existing entries keep their spelling; the result is in clock order.
+    """
+    merged = {}
+    for value in list(existing or []) + list(added or []):
+        parsed = parse_reminder_time(value)
+        merged.setdefault(parsed if parsed is not None else value, value)
+    return [merged[key] for key in sorted(merged, key=lambda key: (isinstance(key, str), str(key)))]
+
+
+def medicine_key(name: str, dosage: str):
+    """Identity of a medicine across pages and against saved medicines"""
+    name = " ".join((name or "").lower().split())
+    generic = medicine_lexicon.generic_name(name, fuzzy=False) or name
+    return generic, " ".join((dosage or "").lower().split())
+
+
+def merge_extracted_medicines(results) -> list:
+    """One entry per medicine across all successful extraction results, in first-seen order"""
+    merged = {}
+    for result in results:
+        if result.get("status") != "success":
+            continue
+        for item in result.get("medicines") or []:
+            name = str(item.get("name") or "").strip()
+            if not name:
+                continue
+            dosage = str(item.get("dosage") or "").strip() or DEFAULT_DOSAGE
+            instructions = str(item.get("instructions") or "").strip()
+            key = medicine_key(name, dosage)
+
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = {
+                    "name": name,
+                    "dosage": dosage,
+                    "instructions": instructions or None,
+                    "times": times_for_instructions(instructions),
+                }
+            else:
+                entry["times"] = merge_times(entry["times"], times_for_instructions(instructions))
+                entry["instructions"] = entry["instructions"] or instructions or None
+    return list(merged.values())
+
+
+def import_prescriptions(db: Session, user_id: int, sources) -> dict:
+    """
+    Upsert medicines and reminders for extracted prescriptions in one transaction.
+
+    ``sources`` is a list of dicts with ``filename``, ``file_path`` and the
+    extraction ``result``. Returns the Prescription rows, the created and
+    updated Medicine rows, the number of reminders written and the imported
+    medicines left without reminder times (``needs_schedule``).
+    """
+    items = merge_extracted_medicines(source["result"] for source in sources)
+    try:
+        existing = {
+            medicine_key(medicine.name, medicine.dosage): medicine
+            for medicine in db.query(Medicine).filter(
+                Medicine.user_id == user_id,
+                Medicine.status == "active"
+            ).all()
+        }
+
+        created, updated = [], []
+        for item in items:
+            medicine = existing.get(medicine_key(item["name"], item["dosage"]))
+            if medicine is None:
+                medicine = Medicine(
+                    user_id=user_id,
+                    name=item["name"],
+                    dosage=item["dosage"],
+                    times=item["times"],
+                    instructions=item["instructions"],
+                    status="active"
+                )
+                db.add(medicine)
+                created.append(medicine)
+            else:
+                medicine.times = merge_times(medicine.times, item["times"])
+                medicine.instructions = medicine.instructions or item["instructions"]
+                medicine.updated_at = datetime.utcnow()
+                updated.append(medicine)
+
+        prescriptions = [
+            Prescription(
+                user_id=user_id,
+                filename=source["filename"],
+                file_path=source["file_path"],
+                extracted_data=source["result"],
+                status="processed" if source["result"].get("status") == "success" else "failed"
+            )
+            for source in sources
+        ]
+        db.add_all(prescriptions)
+        db.flush()  # assigns ids to new medicines
+
+        # Updated medicines get their pending reminders rebuilt from the merged times
+        if updated:
+            db.query(Reminder).filter(
+                Reminder.medicine_id.in_([medicine.id for medicine in updated]),
+                Reminder.status == "pending"
+            ).delete(synchronize_session=False)
+
+        now_pkt = get_current_pkt_time()
+        reminder_rows = [
+            row
+            for medicine in created + updated
+            for row in build_reminders(medicine.id, user_id, medicine.times, now_pkt)
+        ]
+        db.bulk_insert_mappings(Reminder, reminder_rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(f"Imported {len(sources)} prescriptions for user {user_id}: {len(created)} medicines created, {len(updated)} updated, {len(reminder_rows)} reminders")
+    return {
+        "prescriptions": prescriptions,
+        "created": created,
+        "updated": updated,
+        "reminders_created": len(reminder_rows),
+        "needs_schedule": [medicine for medicine in created + updated if not medicine.times],
+    }
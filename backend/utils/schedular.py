@@ -78,6 +78,56 @@ def check_and_send_reminders():
     finally:
         db.close()
 
+def parse_reminder_time(time_str: str):
+    """Parse "HH:MM", "HH:MM:SS", "8:00 AM", "8:00AM", "8 AM" or "8am" into a time, or None"""
+    time_str = time_str.strip()
+    for fmt in ["%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p", "%I %p", "%I%p"]:
+        try:
+            return datetime.strptime(time_str, fmt).time()
+        except ValueError:
+            continue
+    return None
+
+def build_reminders(medicine_id: int, user_id: int, times: list, now_pkt: datetime = None) -> list:
+    """
+    Reminder rows (as dicts for a bulk insert) for the next occurrence of each
+    time in Pakistan time, stored as naive UTC.
+    """
+    now_pkt = now_pkt or get_current_pkt_time()
+    today_pkt = now_pkt.date()
+    rows = []
+
+    for time_str in times:
+        try:
+            time_obj = parse_reminder_time(time_str)
+            if time_obj is None:
+                logger.error(f"Could not parse time: {time_str}")
+                continue
+
+            # Create reminder datetime in Pakistan timezone
+            reminder_datetime_pkt = PKT.localize(datetime.combine(today_pkt, time_obj))
+
+            # If time has passed today, schedule for tomorrow
+            if reminder_datetime_pkt < now_pkt:
+                reminder_datetime_pkt = reminder_datetime_pkt + timedelta(days=1)
+
+            # Convert PKT-aware datetime to UTC for storage
+            reminder_datetime_utc = reminder_datetime_pkt.astimezone(pytz.utc)
+
+            rows.append({
+                "user_id": user_id,
+                "medicine_id": medicine_id,
+                "reminder_time": reminder_datetime_utc.replace(tzinfo=None),  # Store as naive UTC
+                "status": "pending"
+            })
+            logger.debug(f"Reminder for {time_str} -> PKT: {reminder_datetime_pkt.strftime('%Y-%m-%d %H:%M:%S %Z%z')} -> UTC (stored): {reminder_datetime_utc.strftime('%Y-%m-%d %H:%M:%S %Z%z')}")
+
+        except Exception as e:
+            logger.error(f"❌ Error parsing time {time_str}: {str(e)}")
+            continue
+
+    return rows
+
 def create_reminders_for_medicine(medicine_id: int, user_id: int, times: list, db: Session):
     """Create reminder entries for a medicine (using Pakistan timezone)"""
     try:
@@ -86,62 +136,16 @@ def create_reminders_for_medicine(medicine_id: int, user_id: int, times: list, d
             Reminder.medicine_id == medicine_id,
             Reminder.status == "pending"
         ).delete()
-        
-        # Get current Pakistan time
+
         now_pkt = get_current_pkt_time()
-        today_pkt = now_pkt.date()
-        
         logger.info(f"Creating reminders for medicine {medicine_id} in PKT timezone")
         logger.info(f"Current PKT time: {now_pkt.strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        for time_str in times:
-            try:
-                # Parse time in 24-hour format (HH:MM)
-                time_str = time_str.strip()
-                
-                # Try multiple formats
-                time_obj = None
-                for fmt in ["%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p"]:
-                    try:
-                        time_obj = datetime.strptime(time_str, fmt).time()
-                        break
-                    except ValueError:
-                        continue
-                
-                if time_obj is None:
-                    logger.error(f"Could not parse time: {time_str}")
-                    continue
-                
-                logger.debug(f"Parsed time '{time_str}' to time object: {time_obj}")
 
-                # Create reminder datetime in Pakistan timezone
-                reminder_datetime_pkt = PKT.localize(datetime.combine(today_pkt, time_obj))
-                logger.debug(f"Initial reminder datetime (PKT): {reminder_datetime_pkt.strftime('%Y-%m-%d %H:%M:%S %Z%z')}")
-                
-                # If time has passed today, schedule for tomorrow
-                if reminder_datetime_pkt < now_pkt:
-                    reminder_datetime_pkt = reminder_datetime_pkt + timedelta(days=1)
-                    logger.info(f"Time {time_str} has passed today ({now_pkt.strftime('%H:%M')}), scheduling for tomorrow: {reminder_datetime_pkt.strftime('%Y-%m-%d %H:%M:%S %Z%z')}")
-                
-                # Convert PKT-aware datetime to UTC for storage
-                reminder_datetime_utc = reminder_datetime_pkt.astimezone(pytz.utc)
-                
-                reminder = Reminder(
-                    user_id=user_id,
-                    medicine_id=medicine_id,
-                    reminder_time=reminder_datetime_utc.replace(tzinfo=None), # Store as naive UTC
-                    status="pending"
-                )
-                db.add(reminder)
-                
-                logger.info(f"✅ Created reminder for {time_str} -> PKT: {reminder_datetime_pkt.strftime('%Y-%m-%d %H:%M:%S %Z%z')} -> UTC (stored): {reminder_datetime_utc.strftime('%Y-%m-%d %H:%M:%S %Z%z')}")
-                
-            except Exception as e:
-                logger.error(f"❌ Error parsing time {time_str}: {str(e)}")
-                continue
-        
+        rows = build_reminders(medicine_id, user_id, times, now_pkt)
+        db.bulk_insert_mappings(Reminder, rows)
+
         db.commit()
-        logger.info(f"✅ Successfully created reminders for medicine {medicine_id}")
+        logger.info(f"✅ Successfully created {len(rows)} reminders for medicine {medicine_id}")
 
     except Exception as e:
         logger.error(f"❌ Error creating reminders: {str(e)}")
@@ -0,0 +1,220 @@
+"""
+Semantic response cache for advisory LLM tools.
+
+Queries are embedded with a local hashing vectorizer (word unigrams/bigrams
+and character trigrams hashed into a fixed number of signed buckets), so no
+model download or network call is needed. Each namespace keeps its vectors in
+a preallocated numpy matrix; a lookup is one matrix-vector product over that
+namespace. A cached response is returned when the best cosine similarity is
+at or above the threshold.
+
+Every hit is appended to a bounded log with its namespace, score and time,
+so the score distribution of hits can be watched; the query text is left
+out because it holds users' health questions. ``evaluate_pairs`` measures
+the false-hit rate of a threshold on labeled query pairs.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be can do does for from how i in is it me my of on or "
+    "should the to what when which with you your".split()
+)
+
+
+class HashingEmbedder:
+    """Stateless bag-of-features embedding into ``dim`` buckets, L2-normalized"""
+
+    def __init__(self, dim: int = 2048):
+        self.dim = dim
+
+    def features(self, text: str):
+        words = [w for w in TOKEN_RE.findall(text.lower()) if w not in STOPWORDS]
+        features = list(words)
+        features += [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"#{word}#"
+            features += [f"^{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self.features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            # Whole-word features carry more meaning than character trigrams
+            vector[bucket] += sign * (0.5 if feature.startswith("^") else 1.0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class _Namespace:
+    """Bounded vector index for one tool; storage grows by doubling up to ``capacity``"""
+
+    INITIAL_ROWS = 32
+
+    def __init__(self, dim: int, capacity: int):
+        self.capacity = capacity
+        rows = min(self.INITIAL_ROWS, capacity)
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)
+        self.expires_at = np.zeros(rows, dtype=np.float64)
+        self.last_used = np.zeros(rows, dtype=np.float64)
+        self.queries = []
+        self.responses = []
+        self.size = 0
+
+    def _grow(self):
+        rows = min(len(self.vectors) * 2, self.capacity)
+        self.vectors = np.resize(self.vectors, (rows, self.vectors.shape[1]))
+        self.expires_at = np.resize(self.expires_at, rows)
+        self.last_used = np.resize(self.last_used, rows)
+
+    def free_slot(self, now: float) -> int:
+        """Index for a new entry: an unused slot, else an expired one, else the least recently used"""
+        if self.size < self.capacity:
+            if self.size == len(self.vectors):
+                self._grow()
+            self.queries.append(None)
+            self.responses.append(None)
+            self.size += 1
+            return self.size - 1
+        expired = np.flatnonzero(self.expires_at <= now)
+        if len(expired):
+            return int(expired[0])
+        return int(np.argmin(self.last_used))
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        max_entries: int = 1000,
+        ttl: float = 24 * 3600,
+        dim: int = 2048,
+        hit_log_size: int = 500
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embedder = HashingEmbedder(dim)
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: defaultdict(int))
+        self._hit_log = deque(maxlen=hit_log_size)
+
+    def _namespace(self, namespace: str) -> _Namespace:
+        index = self._namespaces.get(namespace)
+        if index is None:
+            index = self._namespaces[namespace] = _Namespace(self.embedder.dim, self.max_entries)
+        return index
+
+    def lookup(self, namespace: str, query: str, threshold: float = None):
+        """Return (response, score, matched_query) for the closest fresh entry above the threshold, or None"""
+        threshold = self.threshold if threshold is None else threshold
+        vector = self.embedder.embed(query)
+        now = time.time()
+        with self._lock:
+            index = self._namespaces.get(namespace)
+            self._stats[namespace]["lookups"] += 1
+            if index is None or index.size == 0 or not vector.any():
+                self._stats[namespace]["misses"] += 1
+                return None
+
+            scores = index.vectors[:index.size] @ vector
+            scores[index.expires_at[:index.size] <= now] = -1.0
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < threshold:
+                self._stats[namespace]["misses"] += 1
+                return None
+
+            index.last_used[best] = now
+            self._stats[namespace]["hits"] += 1
+            matched_query, response = index.queries[best], index.responses[best]
+            self._hit_log.append({
+                "namespace": namespace,
+                "score": round(score, 4),
+                "at": now,
+            })
+        return response, score, matched_query
+
+    def store(self, namespace: str, query: str, response: str, ttl: float = None):
+        vector = self.embedder.embed(query)
+        if not vector.any():
+            return
+        now = time.time()
+        with self._lock:
+            index = self._namespace(namespace)
+            was_full = index.size == self.max_entries
+            slot = index.free_slot(now)
+            if was_full:
+                self._stats[namespace]["evictions"] += 1
+            index.vectors[slot] = vector
+            index.queries[slot] = query
+            index.responses[slot] = response
+            index.expires_at[slot] = now + (self.ttl if ttl is None else ttl)
+            index.last_used[slot] = now
+            self._stats[namespace]["stores"] += 1
+
+    def get_or_compute(self, namespace: str, query: str, compute, threshold: float = None) -> str:
+        hit = self.lookup(namespace, query, threshold)
+        if hit is not None:
+            return hit[0]
+        response = compute()
+        self.store(namespace, query, response)
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            report = {}
+            for namespace, counters in self._stats.items():
+                index = self._namespaces.get(namespace)
+                report[namespace] = {
+                    **counters,
+                    "entries": index.size if index else 0,
+                    "hit_rate": round(counters["hits"] / counters["lookups"], 3) if counters["lookups"] else None,
+                }
+            return {"threshold": self.threshold, "max_entries_per_tool": self.max_entries, "namespaces": report}
+
+    def recent_hits(self, limit: int = 100) -> list:
+        """Most recent hits first (namespace, score and time only)"""
+        with self._lock:
+            return list(self._hit_log)[::-1][:limit]
+
+
+def evaluate_pairs(embedder: HashingEmbedder, pairs, thresholds) -> list:
+    """
+    Measure cache behaviour on labeled pairs ``(query_a, query_b, same_answer)``.
+
+    For each threshold returns the false-hit rate (share of cache hits whose
+    pair should not share an answer), the share of different-answer pairs
+    that would hit, and the recall on same-answer pairs.
+    """
+    scored = [
+        (float(embedder.embed(a) @ embedder.embed(b)), bool(same))
+        for a, b, same in pairs
+    ]
+    positives = sum(1 for _, same in scored if same)
+    negatives = len(scored) - positives
+
+    report = []
+    for threshold in thresholds:
+        hits = [same for score, same in scored if score >= threshold]
+        false_hits = sum(1 for same in hits if not same)
+        report.append({
+            "threshold": threshold,
+            "hits": len(hits),
+            "false_hits": false_hits,
+            "false_hit_rate": round(false_hits / len(hits), 3) if hits else None,
+            "negatives_hit": round(false_hits / negatives, 3) if negatives else None,
+            "recall": round((len(hits) - false_hits) / positives, 3) if positives else None,
+        })
+    return report
@@ -0,0 +1,221 @@
+"""
+Speech engines and utterance detection for the voice chat WebSocket.
+
+Engines are pluggable and picked by name from settings:
+
+- speech-to-text: ``open(sample_rate, encoding)`` returns a transcriber
+  with ``feed(chunk) -> partial text or None`` and ``finish() -> text``
+- text-to-speech: ``synthesize(text)`` yields self-contained audio clips
+  in ``mime_type``
+
+The ``standin`` engines work offline for tests and load tests: the stand-in
+transcriber takes UTF-8 text frames as the words spoken, and the stand-in
+synthesizer renders a short tone per sentence as WAV. They are refused
+unless SPEECH_ALLOW_STANDIN is set, so a deployment never answers real
+speech with a canned transcript. The ``aimlapi`` engines (the default) call
+the OpenAI-compatible audio endpoints.
+
+``EnergyVAD`` ends an utterance after a stretch of silence in raw 16-bit
+PCM; other encodings rely on the client's ``end`` control message.
+"""
+import io
+import logging
+import re
+import wave
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+PCM_ENCODING = "pcm16"
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+MARKDOWN_RE = re.compile(r"\*\*|__|`|^#+\s*|^\s*[-*]\s+", re.MULTILINE)
+LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)|https?://\S+")
+
+
+def speakable(text: str) -> str:
+    """Agent markdown as plain text for synthesis"""
+    text = LINK_RE.sub(lambda match: match.group(1) or "", text)
+    return MARKDOWN_RE.sub("", text).replace("*", "")
+
+
+def split_sentences(text: str):
+    """Split ``text`` into (complete sentences, unfinished remainder)"""
+    parts = SENTENCE_END_RE.split(text)
+    complete = [part.strip() for part in parts[:-1] if part.strip()]
+    return complete, parts[-1]
+
+
+class EnergyVAD:
+    """
+    Energy-based end-of-utterance detection for little-endian 16-bit mono PCM.
+    An utterance ends once some speech has been heard and is followed by
+    ``silence_ms`` of frames quieter than ``threshold`` (RMS).
+    """
+
+    def __init__(self, sample_rate: int, threshold: float = None, silence_ms: int = None, frame_ms: int = 30, min_speech_ms: int = 150):
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * 2
+        self.frame_ms = frame_ms
+        self.threshold = threshold if threshold is not None else settings.VOICE_VAD_THRESHOLD
+        self.silence_ms = silence_ms if silence_ms is not None else settings.VOICE_SILENCE_MS
+        self.min_speech_ms = min_speech_ms
+        self.reset()
+
+    def reset(self):
+        self._buffer = b""
+        self._speech_ms = 0
+        self._silence_ms = 0
+
+    def feed(self, chunk: bytes) -> bool:
+        """Return True when the audio so far ends an utterance"""
+        self._buffer += chunk
+        ended = False
+        while len(self._buffer) >= self.frame_bytes:
+            frame, self._buffer = self._buffer[:self.frame_bytes], self._buffer[self.frame_bytes:]
+            samples = np.frombuffer(frame, dtype="<i2").astype(np.float32)
+            rms = float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+            if rms >= self.threshold:
+                self._speech_ms += self.frame_ms
+                self._silence_ms = 0
+            elif self._speech_ms >= self.min_speech_ms:
+                self._silence_ms += self.frame_ms
+                if self._silence_ms >= self.silence_ms:
+                    ended = True
+        return ended
+
+
+# ============= SPEECH-TO-TEXT =============
+class StandinTranscriber:
+    FALLBACK_TRANSCRIPT = "show my medicines"
+
+    def __init__(self):
+        self._words = []
+        self._audio_bytes = 0
+
+    def feed(self, chunk: bytes):
+        try:
+            text = chunk.decode("utf-8").strip()
+        except UnicodeDecodeError:
+            text = ""
+        if text and text.isprintable():
+            self._words.append(text)
+            return " ".join(self._words)
+        self._audio_bytes += len(chunk)
+        return None
+
+    def finish(self) -> str:
+        if self._words:
+            return " ".join(self._words)
+        return self.FALLBACK_TRANSCRIPT if self._audio_bytes else ""
+
+
+class StandinSpeechToText:
+    """Offline stand-in: text frames are the transcript, real audio becomes a fixed command"""
+    name = "standin"
+
+    def open(self, sample_rate: int, encoding: str):
+        return StandinTranscriber()
+
+
+class BufferedTranscriber:
+    """Collects the utterance and transcribes it in one request when it ends"""
+
+    def __init__(self, client, model: str, sample_rate: int, encoding: str):
+        self.client = client
+        self.model = model
+        self.sample_rate = sample_rate
+        self.encoding = encoding
+        self._audio = bytearray()
+
+    def feed(self, chunk: bytes):
+        self._audio.extend(chunk)
+        return None
+
+    def finish(self) -> str:
+        if not self._audio:
+            return ""
+        if self.encoding == PCM_ENCODING:
+            upload = ("utterance.wav", pcm_to_wav(bytes(self._audio), self.sample_rate))
+        else:
+            upload = (f"utterance.{self.encoding}", bytes(self._audio))
+        result = self.client.audio.transcriptions.create(model=self.model, file=upload)
+        return result.text.strip()
+
+
+class AIMLSpeechToText:
+    name = "aimlapi"
+
+    def __init__(self, client, model: str):
+        self.client = client
+        self.model = model
+
+    def open(self, sample_rate: int, encoding: str):
+        return BufferedTranscriber(self.client, self.model, sample_rate, encoding)
+
+
+# ============= TEXT-TO-SPEECH =============
+def pcm_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class StandinTextToSpeech:
+    """Offline stand-in: one short WAV tone per sentence, ~50 ms per character"""
+    name = "standin"
+    mime_type = "audio/wav"
+    sample_rate = 16000
+
+    def synthesize(self, text: str):
+        sentences, rest = split_sentences(text)
+        for sentence in sentences + ([rest.strip()] if rest.strip() else []):
+            seconds = min(0.05 * len(sentence), 8.0)
+            t = np.arange(int(self.sample_rate * seconds)) / self.sample_rate
+            pcm = (3000 * np.sin(2 * np.pi * 440 * t)).astype("<i2").tobytes()
+            yield pcm_to_wav(pcm, self.sample_rate)
+
+
+class AIMLTextToSpeech:
+    name = "aimlapi"
+    mime_type = "audio/mpeg"
+
+    def __init__(self, client, model: str, voice: str):
+        self.client = client
+        self.model = model
+        self.voice = voice
+
+    def synthesize(self, text: str):
+        sentences, rest = split_sentences(text)
+        for sentence in sentences + ([rest.strip()] if rest.strip() else []):
+            response = self.client.audio.speech.create(model=self.model, voice=self.voice, input=sentence, response_format="mp3")
+            yield response.content
+
+
+def get_speech_engines():
+    """(speech-to-text, text-to-speech) engines named in settings"""
+    stt_name, tts_name = settings.SPEECH_STT_ENGINE, settings.SPEECH_TTS_ENGINE
+    if "standin" in (stt_name, tts_name) and not settings.SPEECH_ALLOW_STANDIN:
+        raise ValueError("The stand-in speech engines are for tests and load tests; set SPEECH_ALLOW_STANDIN to use them")
+    if "aimlapi" in (stt_name, tts_name):
+        from utils.ai_agent import aiml_client
+
+    if stt_name == "standin":
+        stt = StandinSpeechToText()
+    elif stt_name == "aimlapi":
+        stt = AIMLSpeechToText(aiml_client, settings.SPEECH_STT_MODEL)
+    else:
+        raise ValueError(f"Unknown speech-to-text engine '{stt_name}'")
+
+    if tts_name == "standin":
+        tts = StandinTextToSpeech()
+    elif tts_name == "aimlapi":
+        tts = AIMLTextToSpeech(aiml_client, settings.SPEECH_TTS_MODEL, settings.SPEECH_TTS_VOICE)
+    else:
+        raise ValueError(f"Unknown text-to-speech engine '{tts_name}'")
+    return stt, tts
@@ -0,0 +1,83 @@
+"""
+Static file serving for analysis artifacts.
+
+Rendered images are published under content-hashed names
+(``<stem>.<hash>.<ext>``) so they can be cached by browsers forever. The
+``ImmutableStaticFiles`` mount marks those files immutable; files without a
+hash in their name are served with ``no-cache`` so clients revalidate them.
+ETags, conditional requests and byte ranges are left to Starlette.
+"""
+import hashlib
+import io
+import os
+import re
+import uuid
+
+from PIL import Image
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+from config import settings
+
+STATIC_DIR = settings.STATIC_DIR
+IMMUTABLE_MAX_AGE = 31536000  # one year
+THUMBNAIL_SIZE = 256
+
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{16}(?:\.thumb)?\.\w+$")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _write_once(path: str, data: bytes):
+    """Write a content-addressed file; an existing file already has the same bytes"""
+    if os.path.exists(path):
+        return
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def publish_image(image: Image.Image, stem: str, thumbnail_size: int = THUMBNAIL_SIZE) -> dict:
+    """
+    Save an image and its JPEG thumbnail under content-hashed names.
+
+    Returns the ``url`` and ``thumbnail_url`` paths under /static.
+    """
+    os.makedirs(STATIC_DIR, exist_ok=True)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    data = buffer.getvalue()
+    digest = content_hash(data)
+
+    filename = f"{stem}.{digest}.png"
+    _write_once(os.path.join(STATIC_DIR, filename), data)
+
+    thumb_filename = f"{stem}.{digest}.thumb.jpg"
+    thumb_path = os.path.join(STATIC_DIR, thumb_filename)
+    if not os.path.exists(thumb_path):
+        thumbnail = image.convert("RGB")
+        thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+        thumb_buffer = io.BytesIO()
+        thumbnail.save(thumb_buffer, format="JPEG", quality=80, optimize=True, progressive=True)
+        _write_once(thumb_path, thumb_buffer.getvalue())
+
+    return {
+        "url": f"/static/{filename}",
+        "thumbnail_url": f"/static/{thumb_filename}",
+    }
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles with immutable caching for content-hashed artifacts"""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if HASHED_NAME_RE.search(os.path.basename(full_path)):
+            response.headers["cache-control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            response.headers["cache-control"] = "no-cache"
+        return response
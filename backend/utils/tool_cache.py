@@ -0,0 +1,172 @@
+"""
+Two-level TTL cache for agent tool results.
+
+Entries live in an in-memory LRU and in a small SQLite file so they survive
+restarts. Concurrent misses for the same key are coalesced: one caller
+computes the value while the others wait for it. Expired entries are kept on
+disk for a while so callers can fall back to a stale value when the upstream
+is unavailable.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+STALE_RETENTION_SECONDS = 7 * 24 * 3600
+
+
+class ToolCache:
+    def __init__(self, db_path: str, max_entries: int = 2048):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # (namespace, key) -> (expires_at, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._stats = defaultdict(lambda: defaultdict(int))
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._db_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._conn.commit()
+        self.purge_expired()
+
+    # ---------- stats ----------
+    def _count(self, namespace: str, field: str):
+        with self._lock:
+            self._stats[namespace][field] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            report = {}
+            for namespace, counters in self._stats.items():
+                hits = counters["memory_hits"] + counters["disk_hits"]
+                lookups = hits + counters["misses"] + counters["coalesced"]
+                report[namespace] = {
+                    **counters,
+                    "hit_rate": round((hits + counters["coalesced"]) / lookups, 3) if lookups else None,
+                }
+            return {"entries_in_memory": len(self._memory), "namespaces": report}
+
+    # ---------- storage ----------
+    def _remember(self, full_key, expires_at: float, value):
+        with self._lock:
+            self._memory[full_key] = (expires_at, value)
+            self._memory.move_to_end(full_key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _load(self, namespace: str, key: str):
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM tool_cache WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def get(self, namespace: str, key: str, allow_stale: bool = False):
+        """Return the cached value, or None. Stale values are only returned when allowed."""
+        full_key = (namespace, key)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(full_key)
+            if entry is not None:
+                self._memory.move_to_end(full_key)
+        if entry is not None and (entry[0] > now or allow_stale):
+            if not allow_stale:
+                self._count(namespace, "memory_hits")
+            return entry[1]
+
+        try:
+            stored = self._load(namespace, key)
+        except sqlite3.Error as e:
+            logger.error(f"Tool cache read failed: {str(e)}")
+            return None
+        if stored is None:
+            return None
+        value, expires_at = stored
+        if expires_at > now:
+            self._remember(full_key, expires_at, value)
+            self._count(namespace, "disk_hits")
+            return value
+        return value if allow_stale else None
+
+    def set(self, namespace: str, key: str, value, ttl: float):
+        now = time.time()
+        expires_at = now + ttl
+        self._remember((namespace, key), expires_at, value)
+        try:
+            with self._db_lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO tool_cache (namespace, key, value, expires_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value), expires_at, now)
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Tool cache write failed: {str(e)}")
+        self._count(namespace, "stores")
+
+    def get_or_compute(self, namespace: str, key: str, ttl: float, compute):
+        """Return a cached value or compute it once, sharing the result with concurrent callers"""
+        value = self.get(namespace, key)
+        if value is not None:
+            return value
+
+        full_key = (namespace, key)
+        with self._lock:
+            waiter = self._inflight.get(full_key)
+            leader = waiter is None
+            if leader:
+                waiter = Future()
+                self._inflight[full_key] = waiter
+
+        if not leader:
+            self._count(namespace, "coalesced")
+            return waiter.result()
+
+        self._count(namespace, "misses")
+        try:
+            value = compute()
+            self.set(namespace, key, value, ttl)
+            waiter.set_result(value)
+            return value
+        except BaseException as e:
+            waiter.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(full_key, None)
+
+    def purge_expired(self, retention: float = STALE_RETENTION_SECONDS) -> int:
+        """Drop entries that expired more than ``retention`` seconds ago"""
+        with self._db_lock:
+            cursor = self._conn.execute("DELETE FROM tool_cache WHERE expires_at < ?", (time.time() - retention,))
+            self._conn.commit()
+        return cursor.rowcount
+
+
+def normalize_query(params: dict) -> str:
+    """Stable cache key for a set of query parameters"""
+    normalized = {
+        k: " ".join(str(v).lower().split()) if isinstance(v, str) else v
+        for k, v in params.items()
+        if k != "api_key"
+    }
+    return json.dumps(normalized, sort_keys=True)